@@ -0,0 +1,271 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 功能：内存有上限的子集构造计数，用于统计很大的 DFA 的状态数（只数状态，不建转换表）
+# dfa_multi.dfa_stats_count 把每个 DFA 状态（NFA 子集，可达几千位的大整数）都放在内存的 set 里，状态数上千万时内存不够。这里：
+#     1. 已访问集合只保存每个子集的 64 位指纹（子集的字节串的 hash），不保存子集本身
+#     2. 已访问的指纹先放在内存的 set 中，超过 mem_cap 项时排序后写入磁盘（一段 array('Q') 文件），之后用 mmap + 二分查找判断是否访问过；
+#        磁盘上的段超过 MAX_RUNS 段时合并成一段
+#     3. 按层广度优先遍历，每层的待展开子集（frontier）按块 pickle 写入磁盘文件，内存中只有一块
+# 内存占用大致为 mem_cap 个指纹 + 一块 frontier + 一批待查的后继，与 DFA 状态数无关
+# 两个不同的子集指纹相同的概率约为 n²/2^65 （n 为 DFA 状态数），对一千万个状态约为 3×10^-6 ；此时后一个子集被当作已访问而不展开，
+# 它本身和只能经过它到达的状态都数不到，所以结果只会偏少（可能少不止一个）
+
+import os
+import sys
+import mmap
+import heapq
+import pickle
+import tempfile
+from time import time
+from array import array
+from bisect import bisect_left
+from itertools import islice
+
+from argv_parse import argv_parse
+from nfa import genHomoNFAfromRegex
+from nfa_homo_calculation import get_NFA_homo_LUT, get_stride_net, get_next_mask_stride
+
+
+MEM_CAP = 1 << 22                   # 内存中最多保存的指纹数，超过时写入磁盘
+MAX_RUNS = 8                        # 磁盘上的指纹段超过这么多段时合并成一段
+BATCH_SIZE = 1 << 16                # 每批待查的后继数
+BLOCK_SIZE = 1 << 14                # frontier 文件每块的子集数
+FP_MASK = (1 << 64) - 1
+
+
+
+# 函数 : fingerprint
+# 功能 : NFA 子集的 64 位指纹
+def fingerprint(nset):
+    return hash(nset.to_bytes((nset.bit_length() + 7) // 8, 'little')) & FP_MASK
+
+
+
+
+
+# 类 : FingerprintSet
+# 功能 : 已访问的指纹集合，内存中的部分超过 mem_cap 项时写入磁盘
+class FingerprintSet():
+
+    def __init__(self, spill_dir, mem_cap=MEM_CAP):
+        self.spill_dir = spill_dir
+        self.mem_cap = mem_cap
+        self.mem = set()
+        self.runs = []                                                 # 磁盘上的段： [(文件名, 文件对象, mmap, memoryview), ...]
+        self.n_spill = 0
+
+
+
+    def __len__(self):
+        return len(self.mem) + sum( len(view)  for _, _, _, view in self.runs )
+
+
+
+    # 功能 : 指纹 fp 是否在磁盘上的某一段中
+    def in_runs(self, fp):
+        for _, _, _, view in self.runs:
+            i = bisect_left(view, fp)
+            if i < len(view) and view[i] == fp:
+                return True
+        return False
+
+
+
+    # 功能 : 加入一批指纹
+    # 返回 : 其中以前没有的指纹列表
+    def add_new(self, fps):
+        mem = self.mem
+        new = [ fp  for fp in fps  if fp not in mem ]
+        if bool(self.runs):
+            new = [ fp  for fp in new  if not self.in_runs(fp) ]
+        mem.update(new)
+        if len(mem) > self.mem_cap:
+            self.spill()
+        return new
+
+
+
+    # 功能 : 把一串有序的指纹（可以是生成器）分块写入一个新的段文件并打开
+    def open_run(self, sorted_fps):
+        fname = os.path.join(self.spill_dir, 'visited%d.bin' % self.n_spill)
+        self.n_spill += 1
+        sorted_fps = iter(sorted_fps)
+        with open(fname, 'wb') as fp:
+            while True:
+                chunk = array('Q', islice(sorted_fps, BATCH_SIZE))
+                if len(chunk) == 0:
+                    break
+                chunk.tofile(fp)
+        fp = open(fname, 'rb')
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return (fname, fp, mm, memoryview(mm).cast('Q'))
+
+
+
+    # 功能 : 关闭并删除一段
+    def close_run(self, run):
+        fname, fp, mm, view = run
+        view.release()
+        mm.close()
+        fp.close()
+        os.remove(fname)
+
+
+
+    # 功能 : 把内存中的指纹写入磁盘，段太多时（边读边写）合并成一段
+    def spill(self):
+        self.runs.append(self.open_run(sorted(self.mem)))
+        self.mem = set()
+        if len(self.runs) > MAX_RUNS:
+            merged = self.open_run(heapq.merge(*[ view  for _, _, _, view in self.runs ]))
+            for run in self.runs:
+                self.close_run(run)
+            self.runs = [merged]
+
+
+
+    def close(self):
+        for run in self.runs:
+            self.close_run(run)
+        self.runs = []
+        self.mem = set()
+
+
+
+
+
+# 类 : FrontierFile
+# 功能 : 一层待展开的子集，按块 pickle 写入磁盘文件，读出时逐块读入
+class FrontierFile():
+
+    def __init__(self, spill_dir, level):
+        self.fname = os.path.join(spill_dir, 'frontier%d.pkl' % level)
+        self.fp = open(self.fname, 'wb')
+        self.block = []
+        self.n = 0
+
+
+
+    def append(self, nset):
+        self.block.append(nset)
+        self.n += 1
+        if len(self.block) >= BLOCK_SIZE:
+            pickle.dump(self.block, self.fp, protocol=pickle.HIGHEST_PROTOCOL)
+            self.block = []
+
+
+
+    # 功能 : 写完，之后可以读出
+    def finish(self):
+        if bool(self.block):
+            pickle.dump(self.block, self.fp, protocol=pickle.HIGHEST_PROTOCOL)
+            self.block = []
+        self.fp.close()
+
+
+
+    # 功能 : 逐个读出子集
+    def __iter__(self):
+        with open(self.fname, 'rb') as fp:
+            while True:
+                try:
+                    block = pickle.load(fp)
+                except EOFError:
+                    break
+                yield from block
+
+
+
+    def remove(self):
+        os.remove(self.fname)
+
+
+
+
+
+# 函数 : dfa_stats_count_spill
+# 功能 : 与 dfa_multi.dfa_stats_count 相同（数出 homo-NFA 转成 DFA 后的状态数，包括空集对应的死状态），但内存有上限，见文件开头的说明
+# 参数 : NFAhomo_fore_net, NFAhomo_char_mask : get_NFA_homo_LUT 的结果
+#        max_dfa_stat : 状态数超过它时放弃，小于 0 时不限
+#        mem_cap      : 内存中最多保存的指纹数
+#        spill_dir    : 写磁盘文件的目录，为 None 时用系统的临时目录（用完后删除）
+#        verbose      : 是否每层打印一行进度
+# 返回 : (是否数完, 状态数)
+def dfa_stats_count_spill(NFAhomo_fore_net, NFAhomo_char_mask, max_dfa_stat=-1, mem_cap=MEM_CAP, spill_dir=None, verbose=False):
+    class_mask = list(set(NFAhomo_char_mask))
+    fore_stride = get_stride_net(NFAhomo_fore_net)
+    with tempfile.TemporaryDirectory(dir=spill_dir) as work_dir:
+        visited = FingerprintSet(work_dir, mem_cap)
+        try:
+            visited.add_new([fingerprint(1)])
+            frontier = FrontierFile(work_dir, 0)
+            frontier.append(1)
+            frontier.finish()
+            count, level = 1, 0
+            stime = time()
+            while frontier.n > 0:
+                level += 1
+                next_frontier = FrontierFile(work_dir, level)
+                batch = dict()                                         # 指纹 → 子集，一批待查的后继
+
+                def flush():
+                    nonlocal count
+                    for fp in visited.add_new(list(batch)):
+                        next_frontier.append(batch[fp])
+                    count = len(visited)
+                    batch.clear()
+
+                for s in frontier:
+                    tmask = get_next_mask_stride(s, fore_stride)
+                    for cmask in class_mask:
+                        t = tmask & cmask
+                        batch[fingerprint(t)] = t
+                    if len(batch) >= BATCH_SIZE:
+                        flush()
+                        if max_dfa_stat >= 0 and count > max_dfa_stat:
+                            next_frontier.finish()
+                            return False, count
+                flush()
+                next_frontier.finish()
+                frontier.remove()
+                frontier = next_frontier
+                if verbose:
+                    print('[%12d ms]   level %d : %d new, %d stats (%d on disk)' % (int(round((time()-stime)*1000)), level, frontier.n, count, count - len(visited.mem)) )
+                if max_dfa_stat >= 0 and count > max_dfa_stat:
+                    return False, count
+            return True, count
+        finally:
+            visited.close()
+
+
+
+
+
+# 主函数
+# 数出正则表达式文件的 homo-NFA 转成 DFA 后的状态数
+if __name__ == '__main__':
+
+    # 解析命令行参数
+    (REGEX_FNAME,), ARGV_NUMS = argv_parse(['.re'])
+    if REGEX_FNAME == '' or len(ARGV_NUMS) > 2:
+        print('Usage: python %s <输入正则表达式文件(.re)> [最大DFA状态数(默认不限)] [内存中最多保存的指纹数(默认%d)]' % (sys.argv[0], MEM_CAP))
+        exit(-1)
+    MAX_DFA_STAT = int(ARGV_NUMS[0]) if len(ARGV_NUMS) > 0 else -1
+    MEM_CAP_ARG = int(ARGV_NUMS[1]) if len(ARGV_NUMS) > 1 else MEM_CAP
+
+    # 读取文件，得到一行一行的 regex ，去重 ， 按 ASCII 编码排序
+    regex_strings = list( set( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) ) )
+    regex_strings.sort()
+    print('total %d regexs (after remove duplicate)\n' % len(regex_strings))
+
+    stime = time()
+    nfa = genHomoNFAfromRegex(regex_strings)
+    print('[%12d ms]   genHomoNFAfromRegex  ' % int(round((time()-stime)*1000)), nfa)
+    stime = time()
+    _, NFAhomo_fore_net, _, NFAhomo_char_mask, _, _ = get_NFA_homo_LUT(nfa)
+    print('[%12d ms]   get_NFA_homo_LUT' % int(round((time()-stime)*1000)))
+
+    stime = time()
+    finished, count = dfa_stats_count_spill(NFAhomo_fore_net, NFAhomo_char_mask, MAX_DFA_STAT, MEM_CAP_ARG, verbose=True)
+    print('[%12d ms]   DFA#S=%d%s' % (int(round((time()-stime)*1000)), count, '' if finished else ' (stopped at the limit)'))
@@ -0,0 +1,243 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 本代码文件提供 lazy-DFA 匹配引擎：
+# 扫描时按需做子集构造，只建立实际遇到的 DFA 状态（即 homo-NFA 的激活状态集），
+# 并把 (DFA状态, 字符类) → 下一个DFA状态 缓存在转换表里（转换表按字符类索引，见 nfa_homo_calculation.get_char_class ）。缓存有内存上限，满了按策略淘汰：
+#     'lru'   : 淘汰最久没有被访问的 1/4 的 DFA 状态（近似 LRU）
+#     'clear' : 清空整个缓存，从当前状态重新开始建立
+# 对状态组合会爆炸、无法完整建立 DFA 的 regex 分组，在实际流量上仍然能以接近 DFA 的速度扫描
+
+import os
+import sys
+from time import time
+
+from argv_parse import argv_parse
+from nfa import genHomoNFAfromRegex
+from nfa_homo_calculation import get_char_class, get_class_mask
+from nfa_homo_match import NFAHomoMatcher, SCAN_CHUNK_SIZE
+
+
+LAZY_DFA_MEM_LIMIT = 64 << 20                  # 缓存的默认内存上限 (bytes)
+
+
+
+# 类 : LazyDFAMatcher
+# 功能 : lazy-DFA 匹配引擎，接口与 NFAHomoMatcher 相同：
+#        scan(data) 和 scan_file(fname) 返回命中列表 [(offset, rule_id), ...] ，
+#        scan_chunk / scan_border 的激活状态集 s 仍是用整数表示的 NFA 子集，所以块之间可以随意衔接
+class LazyDFAMatcher():
+
+    # 构造函数
+    # 参数 : nfa       : 必须是 homo-NFA (class NFA)
+    #        mem_limit : 缓存的内存上限 (bytes)
+    #        policy    : 淘汰策略，'lru' 或 'clear'
+    def __init__(self, nfa, mem_limit=LAZY_DFA_MEM_LIMIT, policy='lru'):
+        assert policy in ('lru', 'clear')
+        self.nfa_matcher = NFAHomoMatcher(nfa)
+        self.NFA_N = self.nfa_matcher.NFA_N
+        self.policy = policy
+
+        self.n_class, self.char_class = get_char_class(nfa)
+        self.class_mask = get_class_mask(self.nfa_matcher.NFAhomo_char_mask, self.n_class, self.char_class)
+        self.class_bytes = bytes(self.char_class[:256]) if self.n_class <= 256 else None          # 字节 → 字符类，用 bytes.translate 一次性转换整块数据
+
+        state_size = 8 * (self.n_class + 16) + self.NFA_N // 8 + 64                    # 估算一个 DFA 状态占用的内存: 转换表的一行 + NFA 子集 + 其它开销
+        self.state_max = max(4, mem_limit // state_size)                                # 缓存最多保存多少个 DFA 状态
+
+        self.n_hit = 0                                                                  # 命中缓存的转换次数
+        self.n_miss = 0                                                                 # 未命中缓存（需要做一次子集构造）的转换次数
+        self.n_evict = 0                                                                # 被淘汰的 DFA 状态数
+        self.n_flush = 0                                                                # 缓存满了的次数
+        self.tick = 0                                                                   # 扫描过的字符数，用作访问时刻
+        self.flush()
+        self.n_flush = 0
+
+
+
+    # 功能 : 清空缓存
+    def flush(self):
+        self.id_of = dict()                                                             # NFA 子集 → DFA 状态号
+        self.sets = []                                                                  # sets[d]  = DFA 状态 d 对应的 NFA 子集（None 代表 d 空闲）
+        self.trans = []                                                                 # trans[d] = 转换表的一行， trans[d][k] = 读入字符类 k 后的 DFA 状态号（-1 代表尚未建立）
+        self.rules = []                                                                 # rules[d] = DFA 状态 d 命中的 rule_id 元组
+        self.refs = []                                                                  # refs[d]  = 指向 d 的转换 {(d', k), ...} ，淘汰 d 时要把它们置为 -1
+        self.used = []                                                                  # used[d]  = 最近一次访问 d 的时刻
+        self.free = []                                                                  # 空闲的 DFA 状态号
+        self.n_flush += 1
+
+
+
+    # 功能 : 给出 NFA 子集 s 对应的 DFA 状态号，若还没有就建立它（缓存满了就先按策略淘汰，但不淘汰 DFA 状态 keep ）
+    # 返回 : (s 的 DFA 状态号, keep 的新状态号)  ——缓存被清空时 keep 会被重新编号
+    def intern(self, s, keep=-1):
+        d = self.id_of.get(s)
+        if d is None:
+            if len(self.id_of) >= self.state_max:                                       # 缓存满了
+                if self.policy == 'lru':
+                    self.evict(keep)
+                else:
+                    keep_s = self.sets[keep] if keep >= 0 else None
+                    self.n_evict += len(self.id_of)
+                    self.flush()
+                    if keep_s is not None:
+                        self.n_evict -= 1
+                        keep, _ = self.intern(keep_s)
+            row = [-1] * self.n_class
+            rules = self.nfa_matcher.accept_rules(s) if s & self.nfa_matcher.accept_mask else ()
+            if self.free:
+                d = self.free.pop()
+                self.sets[d], self.trans[d], self.rules[d], self.refs[d], self.used[d] = s, row, rules, set(), self.tick
+            else:
+                d = len(self.sets)
+                self.sets.append(s)
+                self.trans.append(row)
+                self.rules.append(rules)
+                self.refs.append(set())
+                self.used.append(self.tick)
+            self.id_of[s] = d
+        return d, keep
+
+
+
+    # 功能 : 淘汰最久没有被访问的 1/4 的 DFA 状态，但保留 DFA 状态 keep
+    def evict(self, keep):
+        live = [d for d in range(len(self.sets)) if self.sets[d] is not None and d != keep]
+        live.sort(key=lambda d:self.used[d])
+        for d in live[:max(1, len(live)//4)]:
+            for sd, k in self.refs[d]:                                                  # 断开所有指向 d 的转换
+                if self.sets[sd] is not None and self.trans[sd][k] == d:
+                    self.trans[sd][k] = -1
+            for k, td in enumerate(self.trans[d]):                                      # d 自己的转换也从目标状态的 refs 中删掉，refs 只记录现存的转换
+                if td >= 0 and td != d:
+                    self.refs[td].discard((d, k))
+            del self.id_of[self.sets[d]]
+            self.sets[d], self.trans[d], self.rules[d], self.refs[d] = None, None, None, None
+            self.free.append(d)
+            self.n_evict += 1
+
+
+
+    # 功能 : 缓存未命中时，从 DFA 状态 d 读入字符类 k ，做一次子集构造，建立转换
+    # 返回 : (新的 DFA 状态号, d 的新状态号)  ——缓存被清空时 d 会被重新编号
+    def miss(self, d, k):
+        self.n_miss += 1
+        td, d = self.intern(self.nfa_matcher.next_mask(self.sets[d]) & self.class_mask[k], d)
+        self.trans[d][k] = td
+        self.refs[td].add((d, k))
+        return td, d
+
+
+
+    # 功能 : 初始的激活状态集（只有起始状态 0 激活）
+    def init_state(self):
+        return self.nfa_matcher.init_state()
+
+
+
+    # 功能 : 从激活状态集 s 开始扫描一段字节 data ，data[0] 的全局位置为 base
+    # 参数 : hits : 命中结果追加到这个列表里，每项为 (offset, rule_id)
+    # 返回 : 扫描完 data 后的激活状态集
+    def scan_chunk(self, s, data, base, hits):
+        d, _ = self.intern(s)
+        trans, rules, used = self.trans, self.rules, self.used
+        n_miss = self.n_miss
+        tick = self.tick - base                                                         # 使 tick+offset 随扫描单调递增
+        row = trans[d]
+        if self.class_bytes is not None:
+            classes = data.translate(self.class_bytes)
+        else:
+            char_class = self.char_class
+            classes = [char_class[c] for c in data]
+        for offset, k in enumerate(classes, base+1):
+            nd = row[k]
+            if nd < 0:
+                nd, d = self.miss(d, k)
+                trans, rules, used = self.trans, self.rules, self.used                  # 缓存被清空时这些表会被换掉
+            d = nd
+            row = trans[d]
+            used[d] = tick + offset
+            if rules[d]:
+                for rule_id in rules[d]:
+                    hits.append((offset, rule_id))
+        self.tick += len(data) + 1
+        self.n_hit += len(data) - (self.n_miss - n_miss)
+        return self.sets[d]
+
+
+
+    # 功能 : 从激活状态集 s 开始读入一个边界符，位置为 offset
+    # 返回 : 读入后的激活状态集
+    def scan_border(self, s, offset, hits):
+        return self.nfa_matcher.scan_border(s, offset, hits)
+
+
+
+    # 功能 : 扫描一段完整的输入 data (bytes)，开头和结尾各有一个边界符
+    # 返回 : 命中列表 [(offset, rule_id), ...] ，按 offset 升序
+    def scan(self, data):
+        hits = []
+        s = self.scan_border(self.init_state(), 0, hits)
+        s = self.scan_chunk(s, data, 0, hits)
+        self.scan_border(s, len(data), hits)
+        return hits
+
+
+
+    # 功能 : 扫描一个文件（分块读入，块之间传递激活状态集），开头和结尾各有一个边界符
+    # 返回 : 命中列表 [(offset, rule_id), ...] ，按 offset 升序
+    def scan_file(self, fname):
+        hits = []
+        base = 0
+        s = self.scan_border(self.init_state(), 0, hits)
+        with open(fname, 'rb') as fp:
+            while True:
+                data = fp.read(SCAN_CHUNK_SIZE)
+                if not data:
+                    break
+                s = self.scan_chunk(s, data, base, hits)
+                base += len(data)
+        self.scan_border(s, base, hits)
+        return hits
+
+
+
+    # 功能 : 缓存统计
+    def stats(self):
+        return {'states':len(self.id_of), 'state_max':self.state_max, 'hit':self.n_hit, 'miss':self.n_miss, 'evict':self.n_evict, 'flush':self.n_flush}
+
+
+
+
+
+# 主函数
+# 从命令行参数读入正则表达式文件和数据文件，用 lazy-DFA 扫描，报告命中数、吞吐率和缓存统计
+if __name__ == '__main__':
+
+    # 解析命令行参数
+    (REGEX_FNAME,), ARGV_NUMS = argv_parse(['.re'])
+    DATA_FNAMES = [argv for argv in sys.argv[1:] if argv != REGEX_FNAME and os.path.isfile(argv)]
+    POLICY = 'clear' if 'clear' in sys.argv[1:] else 'lru'
+    if REGEX_FNAME == '' or len(DATA_FNAMES) < 1 or len(ARGV_NUMS) > 1:
+        print('Usage: python %s <输入正则表达式文件(.re)> <待扫描数据文件> [待扫描数据文件 ...] [缓存上限(MB),默认64] [lru|clear]' % sys.argv[0])
+        exit(-1)
+    MEM_LIMIT = int(ARGV_NUMS[0] * (1<<20)) if len(ARGV_NUMS) > 0 else LAZY_DFA_MEM_LIMIT
+
+    # 读取文件，得到一行一行的 regex ，去重 ， 按 ASCII 编码排序
+    regex_strings = list( set( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) ) )
+    regex_strings.sort()
+    print('total %d regexs (after remove duplicate)\n' % len(regex_strings))
+
+    # 建立 homo-NFA 和 lazy-DFA 匹配引擎
+    stime = time()
+    matcher = LazyDFAMatcher(genHomoNFAfromRegex(regex_strings), MEM_LIMIT, POLICY)
+    print('[%12d ms]   build matcher  NFA#S=%d  classes=%d  cache=%d DFA states (%s)' % (int(round((time()-stime)*1000)), matcher.NFA_N, matcher.n_class, matcher.state_max, POLICY) )
+
+    # 逐个扫描数据文件
+    for DATA_FNAME in DATA_FNAMES:
+        stime = time()
+        hits = matcher.scan_file(DATA_FNAME)
+        dtime = time() - stime
+        size = os.path.getsize(DATA_FNAME)
+        print('[%12d ms]   %s  %d bytes  %d hits  %.3f MB/s' % (int(round(dtime*1000)), DATA_FNAME, size, len(hits), size/max(dtime,1e-9)/1e6) )
+        print('    cache: ' + '  '.join('%s=%d' % item for item in matcher.stats().items()) )
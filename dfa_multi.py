@@ -3,16 +3,35 @@
 
 import os
 import sys
+import csv
+import json
+import pickle
+from time import time
+from operator import itemgetter
+from multiprocessing import Process, Pipe
 
 from argv_parse import argv_parse
-from nfa import NFA, genHomoNFAfromRegex
-from nfa_homo_calculation import get_NFA_homo_LUT, get_next_mask
+from nfa import genHomoNFAfromRegex
+from utils import CHARSET_SIZE
+from nfa_homo_calculation import get_NFA_homo_LUT, get_stride_net, get_next_mask_stride, get_char_class, get_class_mask, get_NFA_homo_accpet_mask
+from dfa_table import DFATable, build_dfa_table, minimize_dfa_table
+from nfa_cache import cached_homo_nfa, get_rules_key
+from dfa_predict import DFAPredictor, PRUNE_NONE, PRUNE_BOUND, PRUNE_ALL
+from dfa_parallel import build_dfa_table_parallel
+
+
+DFA_MIN_RAW_COEF = 4                # 最小化模式下，子集构造得到的（未最小化的）DFA 状态数最多允许到预算的几倍
+CHECKPOINT_INTERVAL = 60            # 两次写检查点之间至少间隔的秒数
 
 
 
 # 转 DFA ， 返回 DFA 状态数
 # 在状态数>max_dfa_stat 时放弃，避免浪费过多的计算时间
+# char_mask 相同的字符（同一个字符类）转换结果相同，所以只对互不相同的 char_mask 各算一次
+# 单步传递用分块查询表计算，见 nfa_homo_calculation.get_stride_net
 def dfa_stats_count(NFAhomo_fore_net, NFAhomo_char_mask, max_dfa_stat=-1):
+    class_mask = list(set(NFAhomo_char_mask))
+    fore_stride = get_stride_net(NFAhomo_fore_net)
     St = {1}
     So = set()
     while bool(St):
@@ -20,8 +39,8 @@ def dfa_stats_count(NFAhomo_fore_net, NFAhomo_char_mask, max_dfa_stat=-1):
         So.add(s)
         if max_dfa_stat >= 0 and len(So) > max_dfa_stat:
             return False, len(So)
-        tmask = get_next_mask(s, NFAhomo_fore_net)
-        for cmask in NFAhomo_char_mask:
+        tmask = get_next_mask_stride(s, fore_stride)
+        for cmask in class_mask:
             t = tmask & cmask
             if not t in So:
                 St.add(t)
@@ -31,40 +50,711 @@ def dfa_stats_count(NFAhomo_fore_net, NFAhomo_char_mask, max_dfa_stat=-1):
 
 
 
-# regex 分组，每组一个 DFA ，剩下的放到 NFA
-def dfa_multi(regexs, DFA_GROUP_MAX, DFA_COEF):
-    regexs.sort()
-    
-    # 筛选出值得纳入 DFA 的 regex，尽量把多个 regex 合并成一个 DFA -------------------------------------------------------------------------------------------------------------------------------
-    groups = [[0,0,[]],]
-    group_nfa = []
-    for regex_ii, regex in enumerate(regexs):                             # 对于每项 regex
-        for gi in range(len(groups)):                                     # 对于每个 group
-            nfa = genHomoNFAfromRegex( groups[gi][-1] + [regex] )
-            NFA_N, NFAhomo_fore_net, _, NFAhomo_char_mask, _, _ = get_NFA_homo_LUT(nfa)
-            ret, DFA_N = dfa_stats_count(NFAhomo_fore_net, NFAhomo_char_mask, max_dfa_stat=int(NFA_N*DFA_COEF) )
+# 函数 : tuple_getter
+# 功能 : 与 itemgetter(*idx) 相同，但只有一项时也返回元组
+def tuple_getter(idx):
+    return itemgetter(*idx) if len(idx) != 1 else (lambda seq, i=idx[0]: (seq[i],))
+
+
+
+
+
+# 类 : RegexNFA
+# 功能 : 一条 regex 单独建立的 homo-NFA 及其查询表，每条 regex 只建立一次，尝试放入各个 DFA group 时共用
+class RegexNFA():
+
+    def __init__(self, regex):
+        self.regex = regex
+        nfa = genHomoNFAfromRegex([regex])
+        self.NFA_N, NFAhomo_fore_net, _, NFAhomo_char_mask, _, _ = get_NFA_homo_LUT(nfa)
+        self.fore_stride = get_stride_net(NFAhomo_fore_net)
+        self.n_class, self.char_class = get_char_class(nfa)
+        self.class_mask = get_class_mask(NFAhomo_char_mask, self.n_class, self.char_class)
+        self.accept_mask = get_NFA_homo_accpet_mask(nfa)
+        self.DFA_N = None                                              # 单独的 DFA 状态数，见 dfa_size
+        self.DFA_N_over = 0                                            # 已知单独的 DFA 状态数 > DFA_N_over
+
+
+
+    # 功能 : 这条 regex 单独的 DFA 状态数（超过 max_dfa_stat 时放弃，返回 max_dfa_stat+1），算过的结果会保存下来
+    def dfa_size(self, max_dfa_stat):
+        if self.DFA_N is None and max_dfa_stat > self.DFA_N_over:
+            dfa = DFAGroup().product(self, 0, max_dfa_stat)
+            if dfa is None:
+                self.DFA_N_over = max_dfa_stat
+            else:
+                self.DFA_N = len(dfa[2])
+        return self.DFA_N if self.DFA_N is not None else self.DFA_N_over + 1
+
+
+
+
+
+# 函数 : get_regex_nfa
+# 功能 : 取出 rns (regex → RegexNFA) 中保存的 RegexNFA ，没有时建立并存入； rns 为 None 时每次都建立
+#        多次分组（例如 dfa_sweep 的各个参数）共用同一个 rns 时，每条 regex 的 NFA 和单独的 DFA 状态数只算一次
+def get_regex_nfa(regex, rns=None):
+    if rns is None:
+        return RegexNFA(regex)
+    if regex not in rns:
+        rns[regex] = RegexNFA(regex)
+    return rns[regex]
+
+
+
+
+
+# 类 : DFAGroup
+# 功能 : 一个 DFA group ：它的 regex 列表、NFA 状态数、子集构造得到的（未最小化的）完整 DFA 转换表（n_class, char_class, trans, rules ，格式同 DFATable）
+#        尝试加入一条 regex 时，不从头做子集构造：
+#            组的 NFA 与新 regex 的 NFA 只共享起始状态 0 （化简时合并的公共前缀状态总是同时激活），所以合并后的 DFA 状态与
+#            (组的 DFA 状态, 新 regex 的 NFA 子集) 一一对应，在已有的 DFA 转换表上做乘积构造即可，组一侧的转换直接查表，DFA 状态数与重新做子集构造完全相同
+#        也不必每次都重建整组的 NFA ：合并后的 NFA 状态数不超过 组的 NFA 状态数 + 新 regex 的 NFA 状态数 - 1 （共享起始状态），
+#            先按这个上界的预算做乘积构造，超出预算时一定放不下；没有超出时才重建 NFA ，得到准确的状态数再判断
+class DFAGroup():
+
+    def __init__(self):
+        self.regexs = []
+        self.NFA_N = 0
+        self.DFA_N = 0
+        self.n_class, self.char_class, self.trans, self.rules = 1, [0]*CHARSET_SIZE, [(0,)], [[]]     # 空的 group 的 DFA ：只有起始状态
+
+
+
+    # 功能 : 在组的 DFA 转换表上加入 rn 的 NFA ，用子集构造法（乘积构造）得到合并后的 DFA 转换表，按广度优先顺序给 DFA 状态编号
+    #        DFA 状态数 > max_dfa_stat 时放弃
+    #        合并后的字符类 k 对应 (rn 的字符类, 组的字符类) ，对 rn 的每个子集 b ，预先把字符类按读入后到达的 rn 子集分段，
+    #        每一段的组一侧的转换用 itemgetter 一次取出，再用该 rn 子集的字典一次查出 DFA 状态号，最后用 itemgetter 一次排回字符类的顺序
+    # 参数 : rn      : RegexNFA
+    #        rule_id : rn 在组中的 rule_id
+    # 返回 : (n_class, char_class, trans, rules) ，格式同 DFATable ，放弃时返回 None
+    def product(self, rn, rule_id, max_dfa_stat):
+        g_trans, g_rules = self.trans, self.rules
+        class_of = dict()                                              # (rn 的字符类, 组的字符类) → 合并后的字符类
+        char_class = [ class_of.setdefault(pair, len(class_of))  for pair in zip(rn.char_class, self.char_class) ]
+        pairs = list(class_of)
+        class_mask, fore_stride, accept_mask = rn.class_mask, rn.fore_stride, rn.accept_mask
+
+        sets = [(0, 1)]                                                # sets[d] = DFA 状态 d 对应的 (组的 DFA 状态, rn 的 NFA 子集)
+        ids_of = {1: {0: 0}}                                           # rn 的 NFA 子集 → { 组的 DFA 状态 : DFA 状态号 }
+        segs_of = dict()                                               # rn 的 NFA 子集 b → ( [(到达的 rn 子集, 它的字典, 取出组的 DFA 转换的函数), ...] , 排回字符类顺序的函数 )
+        trans = []
+        rules = []
+        d = 0
+        while d < len(sets):                                           # sets 兼作广度优先遍历的队列
+            a, b = sets[d]
+            if b not in segs_of:
+                tmask = get_next_mask_stride(b, fore_stride)
+                cols = dict()                                          # 到达的 rn 子集 → 字符类列表
+                for k, (kb, _) in enumerate(pairs):
+                    cols.setdefault(tmask & class_mask[kb], []).append(k)
+                segs, order = [], []
+                for t, ks in cols.items():
+                    segs.append((t, ids_of.setdefault(t, dict()), tuple_getter([ pairs[k][1]  for k in ks ])))
+                    order += ks
+                position = [0] * len(order)
+                for i, k in enumerate(order):
+                    position[k] = i
+                segs_of[b] = (segs, tuple_getter(position))
+            segs, reorder = segs_of[b]
+            arow = g_trans[a]
+            row = []
+            for t, ids, getter in segs:
+                targets = getter(arow)
+                part = list(map(ids.get, targets))
+                if None in part:                                       # 有新的 DFA 状态
+                    for i, ta in enumerate(targets):
+                        if part[i] is None:
+                            if ta not in ids:
+                                if len(sets) >= max_dfa_stat:
+                                    return None
+                                ids[ta] = len(sets)
+                                sets.append((ta, t))
+                            part[i] = ids[ta]
+                row += part
+            trans.append(reorder(row))
+            rules.append(g_rules[a] + [rule_id] if b & accept_mask else g_rules[a])
+            d += 1
+        return len(class_of), char_class, trans, rules
+
+
+
+    # 功能 : 放入 rn 后 NFA 状态数的上界，以及按这个上界算出的乘积构造的 DFA 状态数预算
+    # 返回 : NFA_N, max_raw_stat
+    def budget(self, rn, DFA_COEF, minimize=False):
+        raw_coef = DFA_MIN_RAW_COEF if minimize else 1
+        NFA_N = self.NFA_N + rn.NFA_N - 1 if bool(self.regexs) else rn.NFA_N         # NFA 状态数的上界
+        return NFA_N, int(NFA_N*DFA_COEF) * raw_coef
+
+
+
+    # 功能 : 评估能否把 rn 放入本组（不修改本组），DFA 状态数不超过 NFA 状态数的 DFA_COEF 倍时可以放入
+    #        minimize=True 时，用最小化后的 DFA 状态数与预算比较（子集构造本身最多做到预算的 DFA_MIN_RAW_COEF 倍）
+    # 返回 : ret, NFA_N, DFA_N, dfa （dfa 是放入后的 DFA 转换表，交给 add ；不能放入时为 None）
+    def evaluate(self, rn, DFA_COEF, minimize=False):
+        raw_coef = DFA_MIN_RAW_COEF if minimize else 1
+        NFA_N, max_raw_stat = self.budget(rn, DFA_COEF, minimize)
+        dfa = self.product(rn, len(self.regexs), max_raw_stat)
+        if dfa is None:
+            return False, NFA_N, max_raw_stat+1, None
+        if bool(self.regexs):
+            NFA_N = genHomoNFAfromRegex(self.regexs + [rn.regex]).n_stat              # 准确的 NFA 状态数
+        max_dfa_stat = int(NFA_N*DFA_COEF)
+        DFA_N = len(dfa[2])
+        if DFA_N > max_dfa_stat * raw_coef:
+            return False, NFA_N, DFA_N, None
+        if minimize:
+            DFA_N = len(minimize_dfa_table(DFATable(*dfa)))
+        if DFA_N > max_dfa_stat:
+            return False, NFA_N, DFA_N, None
+        return True, NFA_N, DFA_N, dfa
+
+
+
+    # 功能 : 把 evaluate 评估过的 regex 放入本组
+    def add(self, regex, NFA_N, DFA_N, dfa):
+        self.regexs.append(regex)
+        self.NFA_N, self.DFA_N = NFA_N, DFA_N
+        self.n_class, self.char_class, self.trans, self.rules = dfa
+
+
+
+    # 功能 : 直接把一组 regex 放入本组（空的 group），用一次子集构造建立它们的 DFA ，用于从检查点恢复
+    #        子集构造与逐条做乘积构造得到的 DFA 状态数相同，只是状态编号不同
+    def restore(self, regexs, NFA_N, DFA_N):
+        dfa = build_dfa_table(cached_homo_nfa(regexs))
+        self.regexs = list(regexs)
+        self.NFA_N, self.DFA_N = NFA_N, DFA_N
+        self.n_class, self.char_class, self.trans, self.rules = dfa.n_class, dfa.char_class, dfa.trans, dfa.rules
+
+
+
+
+
+# 类 : DFAGroupSet
+# 功能 : 一些 DFA group （用组号 gid 区分），在本进程中逐个尝试
+class DFAGroupSet():
+
+    # 参数 : predictor : dfa_predict.DFAPredictor ，不为 None 时每次尝试前先预测，按 predictor.prune 跳过预测为放不下的尝试，并记录实际结果
+    #        rns       : regex → RegexNFA ，见 get_regex_nfa
+    def __init__(self, DFA_COEF, minimize=False, predictor=None, rns=None):
+        self.DFA_COEF = DFA_COEF
+        self.minimize = minimize
+        self.predictor = predictor
+        self.rns = rns
+        self.groups = dict()                                           # gid → DFAGroup ，第一次用到时建立（空的 group）
+        self.pending = None                                            # evaluate 找到的可以放入的 group ： (gid, regex, NFA_N, DFA_N, dfa)
+        self.explored = 0                                              # 乘积构造累计建立的 DFA 状态数（放弃的尝试按预算+1 计）
+        self.unfinished = None                                         # 上一次尝试因预算用完而没有尝试的第一个 group ，都尝试过时为 None
+
+
+
+    # 功能 : 按 gids 的顺序尝试把 regex 放入各个 group ，找到第一个可以放入的 group 就停止（不修改 group ，之后用 commit 放入）
+    # 参数 : exhausted : 在每次尝试一个 group 之前调用 exhausted(self.explored) ，返回 True 时不再尝试，把这个 group 记在 self.unfinished 中
+    # 返回 : gid, NFA_N, DFA_N ；都放不下（或没有尝试完）时 gid 为 None
+    def evaluate(self, regex, gids, exhausted=None):
+        self.pending = None
+        self.unfinished = None
+        rn = get_regex_nfa(regex, self.rns)
+        for gid in gids:
+            if exhausted is not None and exhausted(self.explored):
+                self.unfinished = gid
+                return None, 0, 0
+            group = self.groups.setdefault(gid, DFAGroup())
+            if self.predictor is not None:
+                verdict, reason = self.predictor.predict(group, rn, group.budget(rn, self.DFA_COEF, self.minimize)[1])
+                if self.predictor.skip(verdict, reason):
+                    continue
+                stime = time()
+            ret, NFA_N, DFA_N, dfa = group.evaluate(rn, self.DFA_COEF, self.minimize)
+            self.explored += DFA_N
+            if self.predictor is not None:
+                self.predictor.record(verdict, reason, ret, time() - stime)
             if ret:
-                print('regex#%d->DFA,  NFA#S=%d  DFA#S=%d' % (regex_ii, NFA_N, DFA_N) )
-                _, _, group = groups.pop(gi)
-                group.append(regex)
-                groups.insert(0, [NFA_N, DFA_N, group])
-                if len(groups[-1][-1]) > 0:
-                    groups.append([0,0,[]])
-                break
+                self.pending = (gid, regex, NFA_N, DFA_N, dfa)
+                return gid, NFA_N, DFA_N
+        return None, 0, 0
+
+
+
+    # 功能 : 把上一次 evaluate 找到的 regex 放入 group gid
+    def commit(self, gid):
+        pending_gid, regex, NFA_N, DFA_N, dfa = self.pending
+        assert pending_gid == gid
+        self.groups[gid].add(regex, NFA_N, DFA_N, dfa)
+        self.pending = None
+
+
+
+    # 功能 : 从检查点恢复 group gid ，见 DFAGroup.restore
+    def restore(self, gid, regexs, NFA_N, DFA_N):
+        self.groups[gid] = DFAGroup()
+        self.groups[gid].restore(regexs, NFA_N, DFA_N)
+
+
+
+    # 功能 : 按 gids 的顺序尝试把 regex 放入各个 group ，放入第一个可以放入的 group
+    # 参数 : control : RunControl ，每次尝试一个 group 之前检查预算，用完时不再尝试（见 self.unfinished）；为 None 时不限
+    # 返回 : gid, NFA_N, DFA_N ；都放不下（或没有尝试完）时 gid 为 None
+    def try_add(self, regex, gids, control=None):
+        gid, NFA_N, DFA_N = self.evaluate(regex, gids, None if control is None else control.exhausted)
+        if gid is not None:
+            self.commit(gid)
+        return gid, NFA_N, DFA_N
+
+
+
+    def close(self):
+        pass
+
+
+
+# 函数 : _group_worker
+# 功能 : DFAGroupPool 的工作进程：保存分给它的那些 group ，执行主进程发来的命令
+#        ('evaluate', regex, gids, deadline, stat_left) → 回复 ((gid, NFA_N, DFA_N), 累计建立的 DFA 状态数, 没有尝试的第一个 group) ；
+#            每次尝试一个 group 之前检查：过了 deadline （墙钟时间）、或这次建立的 DFA 状态数超过 stat_left 时不再尝试，为 -1 时不限
+#        ('commit', gid) 、 ('restore', gid, regexs, NFA_N, DFA_N) → 不回复 ； None → 退出
+def _group_worker(conn, DFA_COEF, minimize, prune):
+    group_set = DFAGroupSet(DFA_COEF, minimize, DFAPredictor(prune) if prune != PRUNE_NONE else None)
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        if msg[0] == 'evaluate':
+            _, regex, gids, deadline, stat_left = msg
+            base = group_set.explored
+            exhausted = lambda explored: (deadline >= 0 and time() > deadline) or (stat_left >= 0 and explored - base > stat_left)
+            conn.send((group_set.evaluate(regex, gids, exhausted), group_set.explored, group_set.unfinished))
+        elif msg[0] == 'commit':
+            group_set.commit(msg[1])
+        else:
+            group_set.restore(*msg[1:])
+    conn.close()
+
+
+
+# 类 : DFAGroupPool
+# 功能 : 与 DFAGroupSet 的接口相同，但把 group 分给多个工作进程，同时尝试把一条 regex 放入所有 group
+#        每个 group 固定保存在一个工作进程中（它的 DFA 转换表很大，不在进程间传递），进程间只传递 regex 和组号
+#        每个工作进程按主进程给出的顺序尝试自己的 group ，找到第一个可以放入的就停止；主进程再取其中顺序最靠前的一个，
+#        所以放入哪个 group 与 DFAGroupSet 逐个尝试的结果完全相同
+class DFAGroupPool():
+
+    def __init__(self, workers, DFA_COEF, minimize=False, prune=PRUNE_NONE):
+        self.conns = []
+        self.procs = []
+        for _ in range(workers):
+            conn, child_conn = Pipe()
+            proc = Process(target=_group_worker, args=(child_conn, DFA_COEF, minimize, prune), daemon=True)
+            proc.start()
+            child_conn.close()
+            self.conns.append(conn)
+            self.procs.append(proc)
+        self.owner = dict()                                            # gid → 保存它的工作进程
+        self.n_groups = [0] * workers                                  # 每个工作进程保存的 group 数
+        self.worker_explored = [0] * workers                           # 每个工作进程的乘积构造累计建立的 DFA 状态数
+        self.unfinished = None                                         # 同 DFAGroupSet.unfinished
+
+
+
+    @property
+    def explored(self):
+        return sum(self.worker_explored)
+
+
+
+    # 功能 : 保存 group gid 的工作进程，新的 group 分给保存 group 最少的工作进程
+    def get_owner(self, gid):
+        if gid not in self.owner:
+            wi = self.n_groups.index(min(self.n_groups))
+            self.owner[gid] = wi
+            self.n_groups[wi] += 1
+        return self.owner[gid]
+
+
+
+    # 功能 : 从检查点恢复 group gid ，见 DFAGroup.restore
+    def restore(self, gid, regexs, NFA_N, DFA_N):
+        self.conns[self.get_owner(gid)].send(('restore', gid, regexs, NFA_N, DFA_N))
+
+
+
+    # 功能 : 按 gids 的顺序尝试把 regex 放入各个 group ，放入第一个可以放入的 group
+    # 参数 : control : RunControl ，剩下的预算交给工作进程（DFA 状态数预算由它们平分），它们在每次尝试一个 group 之前检查；为 None 时不限
+    #                  按 gids 的顺序，在第一个可以放入的 group 之前遇到没有尝试的 group 时，不放入，把它记在 self.unfinished 中
+    # 返回 : gid, NFA_N, DFA_N ；都放不下（或没有尝试完）时 gid 为 None
+    def try_add(self, regex, gids, control=None):
+        self.unfinished = None
+        worker_gids = [ [] for _ in self.conns ]
+        for gid in gids:
+            worker_gids[self.get_owner(gid)].append(gid)
+        busy = [ wi  for wi, wgids in enumerate(worker_gids)  if bool(wgids) ]
+        deadline, stat_left = (-1, -1) if control is None else control.remaining(self.explored)
+        if stat_left >= 0:
+            stat_left //= len(busy)
+        for wi in busy:
+            self.conns[wi].send(('evaluate', regex, worker_gids[wi], deadline, stat_left))
+        results = dict()
+        unfinished = set()
+        for wi in busy:
+            (gid, NFA_N, DFA_N), self.worker_explored[wi], unfinished_gid = self.conns[wi].recv()
+            if gid is not None:
+                results[gid] = (NFA_N, DFA_N)
+            if unfinished_gid is not None:
+                unfinished.add(unfinished_gid)
+        for gid in gids:
+            if gid in unfinished:
+                self.unfinished = gid
+                return None, 0, 0
+            if gid in results:
+                self.conns[self.owner[gid]].send(('commit', gid))
+                return (gid,) + results[gid]
+        return None, 0, 0
+
+
+
+    def close(self):
+        for conn in self.conns:
+            conn.send(None)
+        for proc in self.procs:
+            proc.join()
+
+
+
+
+
+# 类 : RunControl
+# 功能 : 分组的预算和检查点
+#        预算：墙钟时间（秒）或乘积构造累计建立的 DFA 状态数，用完时不再尝试，尚未尝试的 regex 留给 NFA ，得到到目前为止的分组结果
+#        检查点：按处理顺序记下每条 regex 的分组决定，连同 InteractionGraph 的缓存，定期写入 pickle 文件（用完预算、中断时也会写入）；
+#            再次运行时从检查点恢复：已经决定的 regex 直接按记录分组，每个 group 的 DFA 用一次子集构造重建，然后继续处理剩下的 regex
+#        检查点按 "regex 列表 + 分组参数" 算出的键区分，键不同的旧检查点不会被使用
+class RunControl():
+
+    # 参数 : time_budget : 墙钟时间预算（秒），小于 0 时不限
+    #        stat_budget : DFA 状态数预算，小于 0 时不限
+    #        checkpoint  : 检查点文件名，为 '' 时不写检查点
+    def __init__(self, time_budget=-1, stat_budget=-1, checkpoint='', interval=CHECKPOINT_INTERVAL):
+        self.time_budget = time_budget
+        self.stat_budget = stat_budget
+        self.checkpoint = checkpoint
+        self.interval = interval
+        self.key = None
+        self.placed = []                                               # [(regex, gid, NFA_N, DFA_N), ...] 按处理顺序， gid 为 None 代表留给 NFA
+        self.explored = 0                                              # 建立相互作用图时累计建立的 DFA 状态数
+        self.stopped = False
+
+
+
+    # 功能 : 开始分组，有键相同的检查点时读入
+    # 参数 : params : 影响分组结果的参数
+    # 返回 : 从检查点恢复的 regex 数
+    def start(self, regexs, params):
+        self.key = get_rules_key(regexs, 'dfa_multi' + repr(params))
+        self.stime = self.save_time = time()
+        if self.checkpoint != '' and os.path.isfile(self.checkpoint):
+            with open(self.checkpoint, 'rb') as fp:
+                obj = pickle.load(fp)
+            if obj['key'] == self.key:
+                self.placed = obj['placed']
+                InteractionGraph.pair_cache.update(obj['pair_cache'])
+            else:
+                print('checkpoint %s is for other regexs or parameters, ignored' % self.checkpoint)
+        return len(self.placed)
+
+
+
+    # 功能 : 预算是否用完
+    # 参数 : explored : 乘积构造累计建立的 DFA 状态数（不含 self.explored）
+    def exhausted(self, explored=0):
+        if not self.stopped:
+            if self.time_budget >= 0 and time() - self.stime > self.time_budget:
+                self.stopped = True
+            if self.stat_budget >= 0 and self.explored + explored > self.stat_budget:
+                self.stopped = True
+        return self.stopped
+
+
+
+    # 功能 : 剩下的预算，交给工作进程检查
+    # 参数 : explored : 同 exhausted
+    # 返回 : deadline （墙钟时间）, stat_left （DFA 状态数），不限时为 -1
+    def remaining(self, explored=0):
+        deadline = self.stime + self.time_budget if self.time_budget >= 0 else -1
+        stat_left = max(self.stat_budget - self.explored - explored, 0) if self.stat_budget >= 0 else -1
+        return deadline, stat_left
+
+
+
+    # 功能 : 记下一条 regex 的分组决定，到时间时写检查点
+    def record(self, regex, gid, NFA_N, DFA_N):
+        self.placed.append((regex, gid, NFA_N, DFA_N))
+        self.tick()
+
+
+
+    # 功能 : 距上次写检查点超过 interval 秒时写检查点
+    def tick(self):
+        if self.checkpoint != '' and time() - self.save_time >= self.interval:
+            self.save()
+
+
+
+    # 功能 : 写检查点（先写临时文件再改名，写到一半中断也不会损坏已有的检查点）
+    def save(self):
+        if self.checkpoint == '' or self.key is None:
+            return
+        tmp_fname = '%s.%d.tmp' % (self.checkpoint, os.getpid())
+        with open(tmp_fname, 'wb') as fp:
+            pickle.dump({'key':self.key, 'placed':self.placed, 'pair_cache':InteractionGraph.pair_cache}, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fname, self.checkpoint)
+        self.save_time = time()
+
+
+
+
+
+# 函数 : dfa_grouping
+# 功能 : 筛选出值得纳入 DFA 的 regex，尽量把多个 regex 合并成一个 DFA ：按顺序把每条 regex 放入第一个放得下的 group ，
+#        最近放入 regex 的 group 最先尝试，都放不下时留给 NFA
+# 参数 : group_set : DFAGroupSet 或 DFAGroupPool （用完后关闭）
+#        control   : RunControl ，已经 start ；为 None 时不限预算、不写检查点
+# 返回 : groups (按最近放入的顺序，每项为 [NFA_N, DFA_N, regex 列表]) , group_nfa (留给 NFA 的 regex 列表)
+def dfa_grouping(regexs, group_set, verbose=True, control=None):
+    control = RunControl() if control is None else control
+    groups = {0: [0, 0, []]}                                              # gid → [NFA_N, DFA_N, regex 列表]
+    order = [0]                                                           # 尝试的顺序，最近放入 regex 的 group 在最前，最后一个总是空的 group
+    group_nfa = []
+    
+    def place(regex, gid, NFA_N, DFA_N):
+        if gid is not None:
+            groups[gid] = [NFA_N, DFA_N, groups[gid][2] + [regex]]
+            order.remove(gid)
+            order.insert(0, gid)
+            if len(groups[order[-1]][2]) > 0:
+                groups[len(groups)] = [0, 0, []]
+                order.append(len(groups) - 1)
         else:
             group_nfa.append(regex)
     
-    if len(groups[-1][-1]) <= 0:
-        groups.pop()
+    try:
+        for regex, gid, NFA_N, DFA_N in control.placed:                  # 从检查点恢复
+            place(regex, gid, NFA_N, DFA_N)
+        for gid, (NFA_N, DFA_N, group) in groups.items():
+            if len(group) > 0:
+                group_set.restore(gid, group, NFA_N, DFA_N)
+        decided = set( regex  for regex, _, _, _ in control.placed )
+        
+        for regex_ii, regex in enumerate(regexs):                         # 对于每项 regex
+            if regex in decided:
+                continue
+            if control.exhausted(group_set.explored):                     #   预算用完，留给 NFA
+                group_nfa.append(regex)
+                continue
+            gid, NFA_N, DFA_N = group_set.try_add(regex, order, control)  #   依次尝试每个 group
+            if group_set.unfinished is not None:                          #   尝试到一半预算用完，留给 NFA ，不记入检查点（恢复后重新尝试）
+                control.stopped = True
+                group_nfa.append(regex)
+                continue
+            control.record(regex, gid, NFA_N, DFA_N)
+            if gid is not None and verbose:
+                print('regex#%d->DFA,  NFA#S=%d  DFA#S=%d' % (regex_ii, NFA_N, DFA_N) )
+            place(regex, gid, NFA_N, DFA_N)
+    finally:
+        group_set.close()
+        control.save()
+    
+    return [ groups[gid]  for gid in order  if len(groups[gid][2]) > 0 ], group_nfa
+
+
+
+
+
+# 类 : InteractionGraph
+# 功能 : regex 两两之间的相互作用：每对 regex 合并成一个 DFA 时的状态数
+#        一对 regex 的乘积构造按 NFA 状态数上界的预算做，超出预算时这一对一定不能放进同一个 group ，记为冲突边；
+#        没有超出时，记下比两者单独的 DFA 状态数之和多出的状态数（相互作用的强弱）
+#        每条 regex 单独的 DFA 只建一次，与其他 regex 的乘积构造都在它上面做；乘积构造的结果按 (regex, regex, 预算) 缓存，同一进程中再次分组时直接取用
+class InteractionGraph():
+
+    pair_cache = dict()                                                # (regex_a, regex_b, 预算) → 合并后的 DFA 状态数，超出预算时为 None
+
+    # 参数 : regexs    : regex 列表
+    #        predictor : dfa_predict.DFAPredictor ，不为 None 时按 predictor.prune 跳过预测为放不下的一对（直接记为冲突）
+    #        rns       : regex → RegexNFA ，见 get_regex_nfa
+    #        control   : RunControl ，预算用完后不再测量，没有测量的一对当作不冲突、相互作用为 0
+    def __init__(self, regexs, DFA_COEF, minimize=False, predictor=None, rns=None, control=None):
+        control = RunControl() if control is None else control
+        N = len(regexs)
+        rns = [ get_regex_nfa(regex, rns)  for regex in regexs ]
+        self.alone = [False] * N                                       # 单独能否放入一个 DFA group
+        self.conflict = [ set()  for _ in range(N) ]                   # 冲突的 regex
+        self.weight = dict()                                           # (i, j) → 多出的 DFA 状态数 （i < j ，不冲突的一对）
+        singles = []
+        for i, rn in enumerate(rns):
+            group = DFAGroup()
+            ret, NFA_N, DFA_N, dfa = group.evaluate(rn, DFA_COEF, minimize)
+            if ret:
+                group.add(rn.regex, NFA_N, DFA_N, dfa)
+            self.alone[i] = ret
+            singles.append(group)
+        for i in range(N):
+            if not self.alone[i]:
+                continue
+            group = singles[i]
+            for j in range(i+1, N):
+                if not self.alone[j]:
+                    continue
+                max_raw_stat = group.budget(rns[j], DFA_COEF, minimize)[1]
+                key = (regexs[i], regexs[j], max_raw_stat)
+                if key not in self.pair_cache:
+                    if control.exhausted():
+                        continue
+                    if predictor is not None and predictor.skip(*predictor.predict(group, rns[j], max_raw_stat)):
+                        DFA_N = None
+                    else:
+                        dfa = group.product(rns[j], 1, max_raw_stat)
+                        DFA_N = len(dfa[2]) if dfa is not None else None
+                        control.explored += DFA_N if DFA_N is not None else max_raw_stat + 1
+                    self.pair_cache[key] = DFA_N
+                    control.tick()
+                DFA_N = self.pair_cache[key]
+                if DFA_N is None:
+                    self.conflict[i].add(j)
+                    self.conflict[j].add(i)
+                else:
+                    self.weight[(i, j)] = DFA_N - len(group.trans) - len(singles[j].trans) + 1
+
+
+
+    def get_weight(self, i, j):
+        return self.weight.get((i, j) if i < j else (j, i), 0)
+
+
+
+# 函数 : dfa_coloring
+# 功能 : 与 dfa_grouping 相同，但不按 regex 的字符串顺序贪心放入，而是先建立相互作用图，再按 DSatur 图着色的顺序放入：
+#        每次取"冲突的 regex 已经分在最多个不同 group 中"（饱和度最大，相同时取冲突最多）的 regex ，
+#        在不含与它冲突的 regex 的 group 中，按相互作用之和从小到大（相同时按 group 从大到小）依次尝试，仍用实际的乘积构造判断能否放入；
+#        都放不下时放入新的 group ，单独也放不下的 regex 留给 NFA
+# 参数 : group_set : DFAGroupSet 或 DFAGroupPool （用完后关闭）
+#        graph     : InteractionGraph
+#        control   : RunControl ，同 dfa_grouping
+# 返回 : 同 dfa_grouping
+def dfa_coloring(regexs, group_set, graph, verbose=True, control=None):
+    control = RunControl() if control is None else control
+    N = len(regexs)
+    index_of = { regex : i  for i, regex in enumerate(regexs) }
+    groups = []                                                           # 每项为 [NFA_N, DFA_N, regex 序号列表]
+    saturation = [ set()  for _ in range(N) ]                             # 冲突的 regex 所在的 group
+    todo = set( i  for i in range(N)  if graph.alone[i] )
+    group_nfa = [ regexs[i]  for i in range(N)  if not graph.alone[i] ]
     
+    def place(i, gid, NFA_N, DFA_N):
+        todo.discard(i)
+        if gid is None:                                                   # 单独能放下时不会发生（除非最小化模式下的 NFA 状态数上界不准）
+            group_nfa.append(regexs[i])
+            return
+        while len(groups) <= gid:
+            groups.append([0, 0, []])
+        groups[gid] = [NFA_N, DFA_N, groups[gid][2] + [i]]
+        for j in graph.conflict[i]:
+            saturation[j].add(gid)
     
-    # 保留前 DFA_GROUP_MAX 个最大的 DFA group ，其余的小 DFA group 扔回 NFA
-    groups.sort(key=lambda x:x[0], reverse=True)                  # 按照每组包含的 NFA 状态数进行排序
+    try:
+        for regex, gid, NFA_N, DFA_N in control.placed:                  # 从检查点恢复
+            place(index_of[regex], gid, NFA_N, DFA_N)
+        for gid, (NFA_N, DFA_N, members) in enumerate(groups):
+            group_set.restore(gid, [ regexs[i]  for i in members ], NFA_N, DFA_N)
+        
+        while bool(todo):
+            if control.exhausted(group_set.explored):                     # 预算用完，剩下的留给 NFA
+                group_nfa += [ regexs[i]  for i in sorted(todo) ]
+                break
+            i = max(todo, key=lambda i: (len(saturation[i]), len(graph.conflict[i]), -i))
+            candidates = [ gid  for gid in range(len(groups))  if gid not in saturation[i] ]
+            candidates.sort(key=lambda gid: (sum( graph.get_weight(i, j) for j in groups[gid][2] ), -len(groups[gid][2]), gid))
+            gid, NFA_N, DFA_N = group_set.try_add(regexs[i], candidates + [len(groups)], control)
+            if group_set.unfinished is not None:                          # 尝试到一半预算用完，剩下的（包括这一条）留给 NFA
+                control.stopped = True
+                group_nfa += [ regexs[i]  for i in sorted(todo) ]
+                break
+            control.record(regexs[i], gid, NFA_N, DFA_N)
+            place(i, gid, NFA_N, DFA_N)
+            if gid is not None and verbose:
+                print('regex#%d->DFA group#%d,  NFA#S=%d  DFA#S=%d' % (i, gid, NFA_N, DFA_N) )
+    finally:
+        group_set.close()
+        control.save()
+
+    return [ [NFA_N, DFA_N, [ regexs[i]  for i in members ]]  for NFA_N, DFA_N, members in groups ], group_nfa
+
+
+
+
+
+# 函数 : dfa_explore
+# 功能 : regex 分组（不限组数），参数同 dfa_multi
+#        rns     : regex → RegexNFA ，见 get_regex_nfa （多进程时只在主进程中共用，工作进程各自建立）
+#        control : RunControl ，预算和检查点（进程数不影响分组结果，所以不同进程数的运行可以共用检查点）
+# 返回 : groups (每项为 [NFA_N, DFA_N, regex 列表]) , group_nfa (留给 NFA 的 regex 列表)
+def dfa_explore(regexs, DFA_COEF, minimize=False, workers=1, prune=PRUNE_NONE, coloring=False, rns=None, verbose=True, control=None):
+    control = RunControl() if control is None else control
+    n_resumed = control.start(regexs, (DFA_COEF, minimize, prune, coloring))
+    if verbose and n_resumed > 0:
+        print('resume %d regexs from checkpoint %s' % (n_resumed, control.checkpoint) )
+    predictor = DFAPredictor(prune) if prune != PRUNE_NONE else None
+    if coloring:
+        graph = InteractionGraph(regexs, DFA_COEF, minimize, predictor, rns, control)
+        if verbose:
+            print('interaction graph:  %d regexs fit alone,  %d conflicting pairs' % (sum(graph.alone), sum(map(len, graph.conflict)) // 2) )
+    if workers <= 1:
+        group_set = DFAGroupSet(DFA_COEF, minimize, predictor, rns)
+    else:
+        group_set = DFAGroupPool(workers, DFA_COEF, minimize, prune)
+    if coloring:
+        groups, group_nfa = dfa_coloring(regexs, group_set, graph, verbose, control)
+    else:
+        groups, group_nfa = dfa_grouping(regexs, group_set, verbose, control)
+    if verbose and control.stopped:
+        print('budget exhausted after %d regexs, the other %d regexs are left to NFA' % (len(control.placed), len(regexs) - len(control.placed)) )
+    return groups, group_nfa
+
+
+
+# 函数 : trim_groups
+# 功能 : 保留前 DFA_GROUP_MAX 个最大（NFA 状态数最多）的 DFA group ，其余的小 DFA group 扔回 NFA
+# 返回 : groups, group_nfa （新的列表，不修改传入的列表）
+def trim_groups(groups, group_nfa, DFA_GROUP_MAX, verbose=True):
+    groups = sorted(groups, key=lambda x:x[0], reverse=True)     # 按照每组包含的 NFA 状态数进行排序
+    group_nfa = list(group_nfa)
     for i in range(len(groups)-DFA_GROUP_MAX):                    # 要删除的 group 有 len(groups)-DFA_GROUP_MAX 组
         NFA_N, DFA_N, group = groups.pop()
         group_nfa += group
-        print('move a DFA group to NFA group,  regex#%d  NFA#S=%d  DFA#S=%d' % (len(group), NFA_N, DFA_N) )
-        
+        if verbose:
+            print('move a DFA group to NFA group,  regex#%d  NFA#S=%d  DFA#S=%d' % (len(group), NFA_N, DFA_N) )
+    return groups, group_nfa
+
+
+
+
+
+# regex 分组，每组一个 DFA ，剩下的放到 NFA
+# minimize=True 时，用 Hopcroft 最小化后的 DFA 状态数来判断 regex 能否放入 DFA group
+# workers > 1 时，用 workers 个进程同时尝试所有 group （见 DFAGroupPool），分组结果与 workers=1 时相同
+# prune 为 dfa_predict.PRUNE_BOUND 时，跳过下界确定放不下的尝试（分组结果不变）；为 PRUNE_ALL 时，跳过所有预测为放不下的尝试（更快，但个别 regex 可能因误判留给 NFA）
+# coloring=True 时，先测出每对 regex 合并后的 DFA 状态数，再按图着色的顺序分组（见 dfa_coloring），否则按 regex 的字符串顺序贪心分组
+# control 为 RunControl 时，按它的预算提前结束（尚未尝试的 regex 留给 NFA），并写检查点、从检查点恢复
+def dfa_multi(regexs, DFA_GROUP_MAX, DFA_COEF, minimize=False, workers=1, prune=PRUNE_NONE, coloring=False, control=None):
+    regexs.sort()
+    
+    # 筛选出值得纳入 DFA 的 regex，尽量把多个 regex 合并成一个 DFA -------------------------------------------------------------------------------------------------------------------------------
+    groups, group_nfa = dfa_explore(regexs, DFA_COEF, minimize, workers, prune, coloring, control=control)
+    
+    
+    # 保留前 DFA_GROUP_MAX 个最大的 DFA group ，其余的小 DFA group 扔回 NFA
+    groups, group_nfa = trim_groups(groups, group_nfa, DFA_GROUP_MAX)
+    
     
     print('-------- summary : %d groups --------' % len(groups) )
     # 打印 DFA groups 信息 -------------------------------------------------------------------------------------------------------------------------------
@@ -84,7 +774,7 @@ def dfa_multi(regexs, DFA_GROUP_MAX, DFA_COEF):
     
     # 整合 NFA ；统计数据，打印 -------------------------------------------------------------------------------------------------------------------------------
     group_nfa.sort()
-    nfa = genHomoNFAfromRegex( group_nfa )
+    nfa = cached_homo_nfa( group_nfa )
     print('NFA group: ' , nfa)
     
     return groups, group_nfa
@@ -93,25 +783,113 @@ def dfa_multi(regexs, DFA_GROUP_MAX, DFA_COEF):
 
 
 
+SWEEP_FIELDS = ('DFA_COEF', 'DFA_GROUP_MAX', 'groups', 'dfa_regexs', 'dfa_NFA_stats', 'dfa_DFA_stats', 'nfa_regexs', 'nfa_NFA_stats', 'explore_ms')
+
+
+
+# 函数 : dfa_sweep
+# 功能 : 参数扫描：对 DFA_COEFS 中的每个系数各分组一次（不限组数），再按 DFA_GROUP_MAXS 中的每个组数上限裁剪，统计每组参数的结果
+#        所有系数共用每条 regex 的 NFA 和单独的 DFA 状态数 (rns) 以及 InteractionGraph 的缓存；组数上限只影响裁剪，不必重新分组；
+#        留给 NFA 的 regex 用 nfa_cache 建立 NFA ，相同的 regex 集合只建立一次
+# 返回 : 列表，每项为一组参数的结果 (dict ，键见 SWEEP_FIELDS)
+def dfa_sweep(regexs, DFA_COEFS, DFA_GROUP_MAXS, minimize=False, workers=1, prune=PRUNE_NONE, coloring=False):
+    regexs = sorted(regexs)
+    rns = dict()
+    rows = []
+    for DFA_COEF in DFA_COEFS:
+        stime = time()
+        all_groups, all_group_nfa = dfa_explore(regexs, DFA_COEF, minimize, workers, prune, coloring, rns, verbose=False)
+        explore_ms = int(round((time()-stime)*1000))
+        print('[%12d ms]   DFA_COEF=%g : %d groups' % (explore_ms, DFA_COEF, len(all_groups)) )
+        for DFA_GROUP_MAX in DFA_GROUP_MAXS:
+            groups, group_nfa = trim_groups(all_groups, all_group_nfa, DFA_GROUP_MAX, verbose=False)
+            row = { 'DFA_COEF'      : DFA_COEF,
+                    'DFA_GROUP_MAX' : DFA_GROUP_MAX,
+                    'groups'        : len(groups),
+                    'dfa_regexs'    : sum( len(group)  for _, _, group in groups ),
+                    'dfa_NFA_stats' : sum( NFA_N  for NFA_N, _, _ in groups ),
+                    'dfa_DFA_stats' : sum( DFA_N  for _, DFA_N, _ in groups ),
+                    'nfa_regexs'    : len(group_nfa),
+                    'nfa_NFA_stats' : cached_homo_nfa(sorted(group_nfa)).n_stat if bool(group_nfa) else 0,
+                    'explore_ms'    : explore_ms }
+            print('    DFA_GROUP_MAX=%-4d groups=%-4d DFA: regex#%d NFA#S=%d DFA#S=%d    NFA: regex#%d NFA#S=%d' % (
+                  DFA_GROUP_MAX, row['groups'], row['dfa_regexs'], row['dfa_NFA_stats'], row['dfa_DFA_stats'], row['nfa_regexs'], row['nfa_NFA_stats']) )
+            rows.append(row)
+    return rows
+
+
+
+# 函数 : save_sweep
+# 功能 : 保存 dfa_sweep 的结果，文件名以 .csv 结尾时保存为 CSV 表格，否则保存为 JSON
+def save_sweep(rows, fname):
+    if fname.endswith('.csv'):
+        with open(fname, 'wt', newline='') as fp:
+            writer = csv.DictWriter(fp, SWEEP_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(fname, 'wt') as fp:
+            json.dump(rows, fp, indent=1)
+
+
+
+# 函数 : parse_number_list
+# 功能 : 解析逗号分隔的数字列表，例如 '2,2.5,4'
+def parse_number_list(text):
+    return [ float(item)  for item in text.split(',')  if item != '' ]
+
+
+
+
+
 
 if __name__ == '__main__':
 
     # 解析命令行参数 -------------------------------------------------------------------------------------------------------------------------------
-    (REGEX_FNAME,), ARGV_NUMS = argv_parse(['.re'])
-    if REGEX_FNAME == '' or len(ARGV_NUMS) != 2:
-        print('Usage: python %s <输入正则表达式文件(.re)> <最大DFA状态数/NFA状态数> <最大DFA组数>' % sys.argv[0])
+    (REGEX_FNAME, JSON_FNAME, CSV_FNAME, CKPT_FNAME), ARGV_NUMS = argv_parse(['.re', '.json', '.csv', '.ckpt'])
+    OPTIONS = dict( argv.split('=', 1)  for argv in sys.argv[1:]  if '=' in argv )      # time=<秒> 、 states=<DFA 状态数>
+    MINIMIZE = 'min' in sys.argv[1:]
+    COLORING = 'color' in sys.argv[1:]
+    PRUNE = PRUNE_ALL if 'predict' in sys.argv[1:] else PRUNE_BOUND if 'bound' in sys.argv[1:] else PRUNE_NONE
+    SWEEP = 'sweep' in sys.argv[1:]
+    if SWEEP:                                                            # 参数扫描： sweep 后面是逗号分隔的系数列表和组数上限列表，再后面的数字是进程数
+        try:
+            i = sys.argv.index('sweep')
+            DFA_COEFS = parse_number_list(sys.argv[i+1])
+            DFA_GROUP_MAXS = [ int(n)  for n in parse_number_list(sys.argv[i+2]) ]
+            _, ARGV_NUMS = argv_parse([], sys.argv[:i] + sys.argv[i+3:])
+        except (IndexError, ValueError):
+            DFA_COEFS = []
+    if REGEX_FNAME == '' or (SWEEP and (not DFA_COEFS or not DFA_GROUP_MAXS or len(ARGV_NUMS) > 1)) or (not SWEEP and len(ARGV_NUMS) not in (2, 3)):
+        print('Usage: python %s <输入正则表达式文件(.re)> <最大DFA状态数/NFA状态数> <最大DFA组数> [进程数(默认为1)] [min] [bound|predict] [color] [time=<秒>] [states=<DFA状态数>] [检查点文件(.ckpt)]' % sys.argv[0])
+        print('       python %s <输入正则表达式文件(.re)> sweep <系数列表,逗号分隔> <组数上限列表,逗号分隔> [进程数(默认为1)] [输出文件(.json|.csv)] [min] [bound|predict] [color]' % sys.argv[0])
         exit(-1)
-    DFA_COEF, DFA_GROUP_MAX = ARGV_NUMS
-    DFA_GROUP_MAX = int(DFA_GROUP_MAX)
     
     
     # 读取文件，得到一行一行的 regex ，去重，排序 -------------------------------------------------------------------------------------------------------------------------------
     regexs = list( set( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) ) )
+    regexs.sort()                                                        # 排序后每次运行的分组尝试顺序相同，才能用上 nfa_cache 的缓存
     print('%d regexs (after remove duplicate)\n' % len(regexs))
     
     
+    # 参数扫描：不交互，只输出结果表格 -------------------------------------------------------------------------------------------------------------------------------
+    if SWEEP:
+        WORKERS = int(ARGV_NUMS[0]) if len(ARGV_NUMS) > 0 else 1
+        rows = dfa_sweep(regexs, DFA_COEFS, DFA_GROUP_MAXS, MINIMIZE, WORKERS, PRUNE, COLORING)
+        for FNAME in (JSON_FNAME, CSV_FNAME):
+            if FNAME != '':
+                save_sweep(rows, FNAME)
+                print('saved %s' % FNAME)
+        exit(0)
+    
+    DFA_COEF, DFA_GROUP_MAX = ARGV_NUMS[:2]
+    DFA_GROUP_MAX = int(DFA_GROUP_MAX)
+    WORKERS = int(ARGV_NUMS[2]) if len(ARGV_NUMS) > 2 else 1
+    
+    
     # DFA 分组 -------------------------------------------------------------------------------------------------------------------------------
-    groups, group_nfa = dfa_multi(regexs, DFA_GROUP_MAX, DFA_COEF)
+    control = RunControl(float(OPTIONS.get('time', -1)), float(OPTIONS.get('states', -1)), CKPT_FNAME)
+    groups, group_nfa = dfa_multi(regexs, DFA_GROUP_MAX, DFA_COEF, MINIMIZE, WORKERS, PRUNE, COLORING, control)
     
     
     # 创建输出文件夹 -------------------------------------------------------------------------------------------------------------------------------
@@ -133,6 +911,14 @@ if __name__ == '__main__':
     for gi, group in enumerate(groups):
         FNAME = SAVE_DIR + os.path.sep + ('dfa%d.re' % gi)                 # 文件名: dfa%d.re
         open(FNAME, 'wt').writelines( [regex+'\n' for regex in group] )
+        FNAME = SAVE_DIR + os.path.sep + ('dfa%d.json' % gi)               # 文件名: dfa%d.json ，该组的 DFA 转换表，rule_id 即 dfa%d.re 中的行号
+        if WORKERS > 1:                                                  # 多进程时，建立转换表也用多个进程并行做子集构造
+            dfa = build_dfa_table_parallel(cached_homo_nfa(group), workers=WORKERS)
+        else:
+            dfa = build_dfa_table(cached_homo_nfa(group))
+        if MINIMIZE:
+            dfa = minimize_dfa_table(dfa)
+        dfa.save(FNAME)
     
     FNAME = SAVE_DIR + os.path.sep + ('nfa.re')                            # 文件名: nfa.re
     open(FNAME, 'wt').writelines( [regex+'\n' for regex in group_nfa] )
@@ -0,0 +1,264 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 功能：多进程并行的子集构造，用于数 DFA 状态数 (dfa_stats_count_parallel) 和建立 DFA 转换表 (build_dfa_table_parallel)
+# 按层广度优先遍历，DFA 状态（NFA 子集 s）按 hash(s) % workers 分给各个工作进程，每个工作进程只保存自己那一份已访问集合：
+#     1. expand : 每个工作进程展开自己这一层新发现的子集，把后继按所属的工作进程分桶（桶内去重），写入共享的临时目录
+#     2. insert : 每个工作进程读入发给自己的桶，查自己的已访问集合，新的子集编号后成为下一层的待展开子集；
+#                 建立转换表时把每个桶中子集的编号写回给发送者
+#     3. resolve: （只在建立转换表时）每个工作进程读回编号，填好自己这一层展开的状态的转换
+# 主进程只发送很短的同步命令，子集本身经由临时文件在工作进程之间交换，不经过主进程
+# 建立转换表时，最后由主进程按广度优先顺序重新编号，得到的 DFATable 与 dfa_table.build_dfa_table 完全相同
+# dfa_multi 只在保存各组的转换表时用 build_dfa_table_parallel ；分组时的计数是在组的 DFA 转换表上做乘积构造（DFAGroup.product），不是从头做子集构造，
+# 而且多进程时已经在 DFAGroupPool 的工作进程（守护进程，不能再启动子进程）中进行，所以不用 dfa_stats_count_parallel
+
+import os
+import sys
+import pickle
+import tempfile
+from time import time
+from multiprocessing import Process, Pipe
+
+from argv_parse import argv_parse
+from nfa import genHomoNFAfromRegex
+from nfa_homo_calculation import get_NFA_homo_LUT, get_stride_net, get_next_mask_stride, get_accept_rules, get_char_class, get_class_mask
+from dfa_table import DFATable
+
+
+EXCHANGE_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None      # 交换文件所在的目录（优先用内存文件系统）
+
+
+
+# 函数 : _owner
+# 功能 : 子集 s 所属的工作进程（int 的 hash 与进程无关，所有工作进程算出的结果相同）
+def _owner(s, workers):
+    return hash(s) % workers
+
+
+
+# 函数 : _dump / _load
+# 功能 : 读写一个交换文件
+def _dump(obj, fname):
+    with open(fname, 'wb') as fp:
+        pickle.dump(obj, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _load(fname):
+    with open(fname, 'rb') as fp:
+        return pickle.load(fp)
+
+
+
+
+
+# 函数 : _subset_worker
+# 功能 : 并行子集构造的工作进程，执行主进程发来的命令：
+#        ('expand', level) → 回复 None ； ('insert', level) → 回复这一层新发现的状态数 ； ('resolve', level) → 回复 None ；
+#        ('collect',) → 回复 (trans, rules) （只在建立转换表时） ； None → 退出
+# 参数 : me, workers : 本进程的序号、工作进程数
+#        class_mask  : 每个字符类的 NFA 激活掩码
+#        accept_net  : 不为 None 时建立转换表（同时记下每个状态命中的 rule_id），为 None 时只数状态
+#        work_dir    : 交换文件所在的目录
+def _subset_worker(conn, me, workers, NFAhomo_fore_net, class_mask, accept_net, work_dir):
+    fore_stride = get_stride_net(NFAhomo_fore_net)
+    materialize = accept_net is not None
+    ids = dict()                                                       # 本进程的已访问集合： 子集 → 本进程内的编号
+    frontier = []                                                      # 这一层待展开的子集
+    trans = []                                                         # trans[本进程内的编号] = [后继的全局编号, ...] ，全局编号 = 本进程内的编号 * workers + 所属的工作进程
+    rules = []
+    pending = []                                                       # expand 之后等待 resolve 的： [(本进程内的编号, [(所属的工作进程, 桶内的位置), ...]), ...]
+
+    def insert(s):
+        if s not in ids:
+            ids[s] = len(ids)
+            frontier.append(s)
+            if materialize:
+                trans.append(None)
+                rules.append(list(get_accept_rules(s, accept_net)))
+        return ids[s]
+
+    if _owner(1, workers) == me:                                       # 起始状态只包含 NFA 的 0 号状态
+        insert(1)
+
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        cmd = msg[0]
+        if cmd == 'expand':
+            buckets = [ dict()  for _ in range(workers) ]              # 所属的工作进程 → { 后继子集 : 桶内的位置 }
+            pending = []
+            for s in frontier:
+                tmask = get_next_mask_stride(s, fore_stride)
+                refs = []
+                for cmask in class_mask:
+                    t = tmask & cmask
+                    bucket = buckets[_owner(t, workers)]
+                    pos = bucket.setdefault(t, len(bucket))
+                    if materialize:
+                        refs.append((_owner(t, workers), pos))
+                if materialize:
+                    pending.append((ids[s], refs))
+            frontier = []
+            for w, bucket in enumerate(buckets):
+                if bool(bucket):
+                    _dump(list(bucket), os.path.join(work_dir, 'e%d_%d_%d.pkl' % (msg[1], me, w)))
+            conn.send(None)
+        elif cmd == 'insert':
+            n_old = len(ids)
+            for w in range(workers):
+                fname = os.path.join(work_dir, 'e%d_%d_%d.pkl' % (msg[1], w, me))
+                if os.path.isfile(fname):
+                    local_ids = [ insert(t) * workers + me  for t in _load(fname) ]
+                    os.remove(fname)
+                    if materialize:
+                        _dump(local_ids, os.path.join(work_dir, 'r%d_%d_%d.pkl' % (msg[1], me, w)))
+            conn.send(len(ids) - n_old)
+        elif cmd == 'resolve':
+            replies = [None] * workers
+            for w in range(workers):
+                fname = os.path.join(work_dir, 'r%d_%d_%d.pkl' % (msg[1], w, me))
+                if os.path.isfile(fname):
+                    replies[w] = _load(fname)
+                    os.remove(fname)
+            for d, refs in pending:
+                trans[d] = [ replies[w][pos]  for w, pos in refs ]
+            pending = []
+            conn.send(None)
+        elif cmd == 'collect':
+            conn.send((trans, rules))
+    conn.close()
+
+
+
+
+
+# 函数 : _parallel_subset
+# 功能 : 启动工作进程，按层做并行子集构造
+# 返回 : (是否做完, 状态数, [每个工作进程的 (trans, rules)] （只数状态或没有做完时为 None）)
+def _parallel_subset(NFAhomo_fore_net, class_mask, accept_net, max_dfa_stat, workers):
+    with tempfile.TemporaryDirectory(dir=EXCHANGE_DIR) as work_dir:
+        conns, procs = [], []
+        for me in range(workers):
+            conn, child_conn = Pipe()
+            proc = Process(target=_subset_worker, args=(child_conn, me, workers, NFAhomo_fore_net, class_mask, accept_net, work_dir), daemon=True)
+            proc.start()
+            child_conn.close()
+            conns.append(conn)
+            procs.append(proc)
+
+        def broadcast(*msg):
+            for conn in conns:
+                conn.send(msg)
+            return [ conn.recv()  for conn in conns ]
+
+        try:
+            count, level, new = 1, 0, 1
+            while new > 0:
+                broadcast('expand', level)
+                new = sum(broadcast('insert', level))
+                count += new
+                if accept_net is not None:
+                    broadcast('resolve', level)
+                if max_dfa_stat >= 0 and count > max_dfa_stat:
+                    return False, count, None
+                level += 1
+            shards = broadcast('collect') if accept_net is not None else None
+            return True, count, shards
+        except BaseException:
+            for proc in procs:                                         # 有工作进程出错退出时（例如内存不足），其余的工作进程可能还在等命令或回复，直接结束它们
+                proc.terminate()
+            raise
+        finally:
+            for conn, proc in zip(conns, procs):
+                if proc.is_alive():
+                    try:
+                        conn.send(None)
+                    except OSError:                                    # 管道已经断开，不要掩盖原来的异常
+                        pass
+                proc.join()
+
+
+
+
+
+# 函数 : dfa_stats_count_parallel
+# 功能 : 与 dfa_multi.dfa_stats_count 相同（数出 homo-NFA 转成 DFA 后的状态数），用 workers 个进程并行
+# 返回 : (是否数完, 状态数) ，超过 max_dfa_stat 时放弃（状态数按层统计，放弃时可能比 max_dfa_stat 多出不止一个）
+def dfa_stats_count_parallel(NFAhomo_fore_net, NFAhomo_char_mask, max_dfa_stat=-1, workers=os.cpu_count()):
+    finished, count, _ = _parallel_subset(NFAhomo_fore_net, list(set(NFAhomo_char_mask)), None, max_dfa_stat, workers)
+    return finished, count
+
+
+
+# 函数 : build_dfa_table_parallel
+# 功能 : 与 dfa_table.build_dfa_table 相同（结果完全相同，包括状态编号），用 workers 个进程并行
+# 返回 : DFATable ，DFA 状态数 > max_dfa_stat 时返回 None
+def build_dfa_table_parallel(nfa, max_dfa_stat=-1, workers=os.cpu_count()):
+    _, NFAhomo_fore_net, _, NFAhomo_char_mask, _, NFAhomo_accept_net = get_NFA_homo_LUT(nfa)
+    n_class, char_class = get_char_class(nfa)
+    class_mask = get_class_mask(NFAhomo_char_mask, n_class, char_class)
+    finished, count, shards = _parallel_subset(NFAhomo_fore_net, class_mask, NFAhomo_accept_net, max_dfa_stat, workers)
+    if not finished:
+        return None
+
+    # 按广度优先顺序重新编号（与 build_dfa_table 的编号相同）
+    start = _owner(1, workers)                                         # 起始状态的全局编号（本进程内的编号为 0）
+    new_id = {start: 0}
+    order = [start]
+    trans, rules = [], []
+    d = 0
+    while d < len(order):
+        gid = order[d]
+        shard_trans, shard_rules = shards[gid % workers]
+        row = []
+        for t in shard_trans[gid // workers]:
+            if t not in new_id:
+                new_id[t] = len(order)
+                order.append(t)
+            row.append(new_id[t])
+        trans.append(row)
+        rules.append(shard_rules[gid // workers])
+        d += 1
+    return DFATable(n_class, char_class, trans, rules)
+
+
+
+
+
+# 主函数
+# 用多进程做子集构造，与单进程的 build_dfa_table 比较耗时和结果
+if __name__ == '__main__':
+
+    from dfa_table import build_dfa_table
+
+    # 解析命令行参数
+    (REGEX_FNAME,), ARGV_NUMS = argv_parse(['.re'])
+    if REGEX_FNAME == '' or len(ARGV_NUMS) > 2:
+        print('Usage: python %s <输入正则表达式文件(.re)> [进程数(默认为CPU核数)] [最大DFA状态数(默认不限)]' % sys.argv[0])
+        exit(-1)
+    WORKERS = int(ARGV_NUMS[0]) if len(ARGV_NUMS) > 0 else os.cpu_count()
+    MAX_DFA_STAT = int(ARGV_NUMS[1]) if len(ARGV_NUMS) > 1 else -1
+
+    # 读取文件，得到一行一行的 regex ，去重 ， 按 ASCII 编码排序
+    regex_strings = list( set( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) ) )
+    regex_strings.sort()
+    print('total %d regexs (after remove duplicate)\n' % len(regex_strings))
+
+    nfa = genHomoNFAfromRegex(regex_strings)
+    _, NFAhomo_fore_net, _, NFAhomo_char_mask, _, _ = get_NFA_homo_LUT(nfa)
+    print(nfa)
+
+    stime = time()
+    finished, count = dfa_stats_count_parallel(NFAhomo_fore_net, NFAhomo_char_mask, MAX_DFA_STAT, WORKERS)
+    print('[%12d ms]   dfa_stats_count_parallel (%d workers)   DFA#S=%d%s' % (int(round((time()-stime)*1000)), WORKERS, count, '' if finished else ' (stopped at the limit)'))
+
+    stime = time()
+    dfa_par = build_dfa_table_parallel(nfa, MAX_DFA_STAT, WORKERS)
+    print('[%12d ms]   build_dfa_table_parallel (%d workers)' % (int(round((time()-stime)*1000)), WORKERS), dfa_par)
+
+    stime = time()
+    dfa = build_dfa_table(nfa, MAX_DFA_STAT)
+    print('[%12d ms]   build_dfa_table' % int(round((time()-stime)*1000)), dfa)
+
+    if dfa is not None and dfa_par is not None:
+        print('same table: %s' % (dfa.trans == dfa_par.trans and dfa.rules == dfa_par.rules))
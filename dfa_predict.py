@@ -0,0 +1,195 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 功能：预测把一条 regex 放入一个 DFA group 时 DFA 状态数会不会爆炸，在乘积构造之前把尝试分成三类：
+#     EXPLODES : 放不下（可以跳过乘积构造）
+#     SAFE     : 放得下
+#     UNKNOWN  : 不确定，照常做乘积构造
+# 合并后的 DFA 状态是 (组的 DFA 状态, regex 的 NFA 子集) ，两个投影都取遍各自的所有状态，所以合并后的 DFA 状态数 DFA_M 满足
+#     max(DFA_G, DFA_r) ≤ DFA_M ≤ DFA_G × DFA_r         （DFA_G : 组的 DFA 状态数， DFA_r : regex 单独的 DFA 状态数）
+# 两条 regex 互不干扰时（例如两个字面量串） DFA_M 接近加法估计 DFA_G + DFA_r - 1 ；都含有 .* 、 [^\n]* 这类"粘住"的宽字符集循环时，
+# 一边停在循环里，另一边的每个状态都要和它组合一次， DFA_M 接近乘法估计 DFA_G × DFA_r 。据此按以下顺序判断：
+#     1. 下界（确定）： max(DFA_G, DFA_r) > 预算时一定放不下
+#     2. 预算在加法估计和乘法估计之间的位置 need = (预算 - 加法估计) / (乘法估计 - 加法估计) ：
+#            need 很小，即只要有一小部分组合出现就会超出预算 → EXPLODES （两边都有粘住的循环时门槛更高）
+#            need 很大，即大部分组合都出现也不会超出预算 → SAFE
+# 粘住的循环由语法树静态分析得出：不在 regex 开头（开头的 .* 被起始状态 0 的自环吸收）、没有上限、字符集至少 STICKY_WIDTH 个字符的循环
+# DFA_r 只与 regex 自己有关，每条 regex 只做一次（很小的）子集构造，见 dfa_multi.RegexNFA.dfa_size
+# 用随机游走对子集空间抽样也试过：几千步的游走几乎只能看到加法估计那么多的状态，从来不能证明爆炸，所以没有采用
+
+import os
+import sys
+from time import time
+
+from argv_parse import argv_parse
+from regex_tree import build_syntax_tree
+from utils import bit1_count
+
+
+SAFE, EXPLODES, UNKNOWN = 'safe', 'explodes', 'unknown'
+PRUNE_NONE, PRUNE_BOUND, PRUNE_ALL = 0, 1, 2          # 不跳过任何尝试（只统计准确率） / 只跳过下界确定放不下的尝试 / 跳过所有预测为 EXPLODES 的尝试
+
+STICKY_WIDTH = 128                  # 字符集至少有这么多字符的无上限循环才算"粘住"的循环
+EXPLODE_NEED = 0.0005               # need 小于它时预测为 EXPLODES
+EXPLODE_NEED_STICKY = 0.002         # 组和 regex 都有粘住的循环时，need 小于它时预测为 EXPLODES
+SAFE_NEED = 0.2                     # need 不小于它时预测为 SAFE
+
+
+
+# 函数 : node_width
+# 功能 : 节点中最宽的字符集的字符数
+def node_width(node):
+    if node.is_charset():
+        return bit1_count(node.content)
+    width = 0
+    for sub in node.content:
+        while sub is not None:
+            width = max(width, node_width(sub))
+            sub = sub.next
+    return width
+
+
+
+# 函数 : sticky_loops
+# 功能 : 静态分析：统计 regex 中粘住的循环的个数（开头的循环不算；进入第一个粘住的循环之后不再往子表达式里面找）
+def sticky_loops(regex):
+    count = 0
+    lead = True                                                        # 还在 regex 开头（前面只有粘住的循环）
+    def visit(node):
+        nonlocal count, lead
+        while node is not None:
+            is_sticky = node.max < 0 and node_width(node) >= STICKY_WIDTH
+            if is_sticky and not lead:
+                count += 1
+            elif node.is_sub_regexs() and count == 0:
+                for sub in node.content:
+                    visit(sub)
+            lead = lead and is_sticky
+            node = node.next
+    visit(build_syntax_tree(regex))
+    return count
+
+
+
+
+
+# 类 : DFAPredictor
+# 功能 : 预测器，并统计预测的准确率
+class DFAPredictor():
+
+    def __init__(self, prune=PRUNE_NONE):
+        self.prune = prune
+        self.sticky_of = dict()                                        # regex → 粘住的循环的个数
+        self.stats = dict()                                            # (verdict, reason) → [尝试次数, 放下次数, 乘积构造等耗时(秒)]
+        self.predict_time = 0.0
+
+
+
+    def sticky(self, regex):
+        if regex not in self.sticky_of:
+            self.sticky_of[regex] = sticky_loops(regex)
+        return self.sticky_of[regex]
+
+
+
+    # 功能 : 预测能否把 rn 放入 group
+    # 参数 : group        : dfa_multi.DFAGroup
+    #        rn           : dfa_multi.RegexNFA
+    #        max_raw_stat : 乘积构造的 DFA 状态数预算
+    # 返回 : verdict, reason （reason 为 'bound' 、 'need' 、 'need-sticky' ）
+    def predict(self, group, rn, max_raw_stat):
+        stime = time()
+        DFA_G = len(group.trans)
+        DFA_r = rn.dfa_size(max_raw_stat)
+        if max(DFA_G, DFA_r) > max_raw_stat:
+            verdict, reason = EXPLODES, 'bound'
+        else:
+            add = DFA_G + DFA_r - 1
+            mul = DFA_G * DFA_r
+            need = (max_raw_stat - add) / max(1, mul - add)
+            both_sticky = self.sticky(rn.regex) > 0 and any( self.sticky(regex) > 0  for regex in group.regexs )
+            reason = 'need-sticky' if both_sticky else 'need'
+            if need < (EXPLODE_NEED_STICKY if both_sticky else EXPLODE_NEED):
+                verdict = EXPLODES
+            elif need >= SAFE_NEED:
+                verdict = SAFE
+            else:
+                verdict = UNKNOWN
+        self.predict_time += time() - stime
+        return verdict, reason
+
+
+
+    # 功能 : 是否跳过这次尝试
+    def skip(self, verdict, reason):
+        return verdict == EXPLODES and (self.prune == PRUNE_ALL or (self.prune == PRUNE_BOUND and reason == 'bound'))
+
+
+
+    # 功能 : 记录一次尝试的预测和实际结果
+    def record(self, verdict, reason, ret, seconds):
+        item = self.stats.setdefault((verdict, reason), [0, 0, 0.0])
+        item[0] += 1
+        item[1] += int(ret)
+        item[2] += seconds
+
+
+
+    # 功能 : 统计结果
+    # 返回 : 字符串列表（每行一项）
+    def report(self):
+        lines = ['%-9s %-12s %8s %8s %8s %10s' % ('verdict', 'reason', 'trials', 'fit', 'reject', 'time(s)')]
+        total = [0, 0, 0.0]
+        for (verdict, reason), (n, fit, seconds) in sorted(self.stats.items()):
+            lines.append('%-9s %-12s %8d %8d %8d %10.2f' % (verdict, reason, n, fit, n-fit, seconds))
+            total = [total[0]+n, total[1]+fit, total[2]+seconds]
+        lines.append('%-9s %-12s %8d %8d %8d %10.2f' % ('total', '', total[0], total[1], total[0]-total[1], total[2]))
+
+        def count(verdict):
+            items = [ item  for (v, _), item in self.stats.items()  if v == verdict ]
+            return sum( n for n, _, _ in items ), sum( fit for _, fit, _ in items ), sum( seconds for _, _, seconds in items )
+        n_fit, n_reject = total[1], total[0] - total[1]
+        n, fit, seconds = count(EXPLODES)
+        lines.append('explodes : precision %.4f (%d/%d)  recall %.4f (%d/%d)  time saved %.2fs of %.2fs' % (
+                     (n-fit)/max(1,n), n-fit, n, (n-fit)/max(1,n_reject), n-fit, n_reject, seconds, total[2]))
+        n, fit, seconds = count(SAFE)
+        lines.append('safe     : precision %.4f (%d/%d)  recall %.4f (%d/%d)' % (fit/max(1,n), fit, n, fit/max(1,n_fit), fit, n_fit))
+        lines.append('predict time %.2fs' % self.predict_time)
+        return lines
+
+
+
+
+
+# 主函数
+# 对每个正则表达式文件（不给出时为 rules/ 下的所有文件），按 dfa_multi 的方式分组，每次尝试都先预测、再照常做乘积构造，统计预测的准确率
+if __name__ == '__main__':
+
+    from dfa_multi import DFAGroupSet, dfa_grouping
+
+    # 解析命令行参数
+    REGEX_FNAMES = [argv for argv in sys.argv[1:] if argv.endswith('.re')]
+    _, ARGV_NUMS = argv_parse([])
+    if len(ARGV_NUMS) not in (1, 2):
+        print('Usage: python %s [输入正则表达式文件(.re) ...] <最大DFA状态数/NFA状态数> [每个文件最多取前几条regex]' % sys.argv[0])
+        exit(-1)
+    DFA_COEF = ARGV_NUMS[0]
+    REGEX_MAX = int(ARGV_NUMS[1]) if len(ARGV_NUMS) > 1 else -1
+    if len(REGEX_FNAMES) == 0:
+        REGEX_FNAMES = sorted( os.path.join('rules', fname) for fname in os.listdir('rules') if fname.endswith('.re') )
+
+    for REGEX_FNAME in REGEX_FNAMES:
+        # 读取文件，得到一行一行的 regex ，去重 ， 按 ASCII 编码排序
+        regexs = list( set( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) ) )
+        regexs.sort()
+        if REGEX_MAX >= 0:
+            regexs = regexs[:REGEX_MAX]
+        print('-------- %s : %d regexs --------' % (REGEX_FNAME, len(regexs)))
+
+        predictor = DFAPredictor(PRUNE_NONE)
+        stime = time()
+        groups, group_nfa = dfa_grouping(regexs, DFAGroupSet(DFA_COEF, predictor=predictor), verbose=False)
+        print('[%12d ms]   %d groups, %d regexs left to NFA' % (int(round((time()-stime)*1000)), len(groups), len(group_nfa)))
+        for line in predictor.report():
+            print(line)
+        print()
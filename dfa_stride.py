@@ -0,0 +1,453 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 本代码文件把 DFA 转换表（见 dfa_table.py）转成 k-stride DFA ：每次转换读入 k 个字符（k = 1, 2, 4, ...），
+# 硬件上每个周期处理 k 个字节，吞吐率提高到 k 倍
+#
+# 输入流看作字符类序列 [边界符, data[0], data[1], ..., data[L-1], 边界符, 填充类, ...] ，
+# 末尾用不改变 DFA 状态、也不命中任何 rule 的"填充类" (pad) 补齐成 k 的整数倍
+# k 个字符类组成的元组再压缩成"stride 类"：对所有 DFA 状态，读入后到达的状态和 stride 内的命中都相同的元组属于同一 stride 类
+# stride 类逐级两两合并得到：  2-stride 类 = (1-stride 类, 1-stride 类) ，  4-stride 类 = (2-stride 类, 2-stride 类) ， ……
+#
+# 因为一次转换跨过 k 个字符，命中不能再挂在状态上，而是挂在转换上 (Mealy 型)：
+#     trans[d][j] : 状态 d 读入 stride 类 j 后到达的状态，起始状态是 0
+#     hits[d][j]  : 这次转换的命中模式号， patterns[hits[d][j]] = ((p, rule_id), ...) ，p 是命中发生在 stride 内的位置 (0~k-1)
+#                   命中模式 0 是空模式
+# 这样 stride 内任意对齐位置上的命中都能报告出来，offset 与 1-stride 扫描完全相同
+
+import os
+import sys
+import json
+from time import time
+from random import Random
+from operator import itemgetter
+
+from argv_parse import argv_parse
+from nfa import genHomoNFAfromRegex
+from nfa_homo_calculation import get_NFA_homo_LUT, get_stride_net, get_next_mask_stride
+from nfa_homo_match import CHAR_BORDER, SCAN_CHUNK_SIZE
+from dfa_table import build_dfa_table, minimize_dfa_table
+
+
+STRIDE_MAX_ENTRIES = 1 << 24                   # k-stride 转换表最多的表项数 (状态数 × stride类数)，超过就放弃
+STRIDE_MAX_WORK = 1 << 27                      # 两两合并时最多计算的 (状态数 × 元组数)，超过就放弃
+STRIDE_REPORT_DFA_MAX = 2000                   # 报告中 DFA 部分的状态数上限
+
+
+
+# 函数 : _gather
+# 功能 : 返回 [vec[i] for i in idx] （元组），用 itemgetter 加速
+def _gather(vec, idx):
+    if len(idx) == 1:
+        return (vec[idx[0]],)
+    return itemgetter(*idx)(vec)
+
+
+
+# 函数 : _pair_table
+# 功能 : 建立"两个相邻的类号 → 合并后的类号"的查询表，供扫描时把类号序列两两合并
+#        类号数不超过 256 时，类号序列是 bytes ，可以用 memoryview.cast('H') 一次取出相邻的两个类号，此时查询表按 16-bit 整数索引
+# 参数 : pair_map : pair_map[a*n+b] = 类 a 后接类 b 合并后的类号（不会出现的组合为 0）
+#        n        : 合并前的类号数
+def _pair_table(pair_map, n):
+    if n > 256:
+        return None
+    table = [0] * 65536
+    for a in range(n):
+        for b in range(n):
+            if sys.byteorder == 'little':
+                table[a | (b<<8)] = pair_map[a*n+b]
+            else:
+                table[(a<<8) | b] = pair_map[a*n+b]
+    return table
+
+
+
+# 类 : StrideDFATable
+# 功能 : k-stride DFA 转换表，以及表驱动的扫描（扫描接口与 DFATable 相同， scan / scan_file 返回 [(offset, rule_id), ...]）
+class StrideDFATable():
+
+    # 参数 : k          : 每次转换读入的字符数（2 的幂）
+    #        n_class    : 字符类数（不含填充类，填充类的类号为 n_class ）
+    #        char_class : char_class[c] = 字符 c 所属的字符类号
+    #        pair_maps  : pair_maps[i] 把两个 2^i-stride 类合并成一个 2^(i+1)-stride 类，共 log2(k) 级
+    #        trans, hits, patterns : 见文件开头的说明
+    def __init__(self, k, n_class, char_class, pair_maps, trans, hits, patterns):
+        self.k = k
+        self.n_class = n_class
+        self.char_class = char_class
+        self.pair_maps = pair_maps
+        self.trans = trans
+        self.hits = hits
+        self.patterns = [ tuple(map(tuple, pattern)) for pattern in patterns ]
+
+        # 每一级合并前后的类号数
+        self.level_n = [n_class + 1]
+        for pair_map in pair_maps:
+            self.level_n.append(max(pair_map) + 1)
+        self.n_stride = self.level_n[-1] if trans == [] else len(trans[0])
+        self.pair_tables = [ _pair_table(pair_map, n) for pair_map, n in zip(pair_maps, self.level_n) ]
+
+        # 扫描用的扁平化转换表，状态号预先乘以 stride 类数
+        # 表项很多，所以相同的整数共用同一个对象（每个表项只占一个指针），扫描时的访存少一些
+        n_stride = self.n_stride
+        starts = [ nd * n_stride  for nd in range(len(trans)) ]
+        pattern_ids = list(range(len(self.patterns)))
+        self.flat_trans = [ starts[nd]  for row in trans  for nd in row ]
+        self.flat_hits = [ pattern_ids[h]  for row in hits  for h in row ]
+
+        self.class_border = char_class[CHAR_BORDER]
+        self.class_bytes = bytes(char_class[:256]) if n_class + 1 <= 256 else None
+
+
+
+    # 功能 : DFA 状态数
+    def __len__(self):
+        return len(self.trans)
+
+
+
+    # 返回  ： 字符串形式的对象，一般用于打印
+    def __str__(self):
+        return '<%d-stride DFA: %d stats, %d stride classes, %d entries>' % (self.k, len(self.trans), self.n_stride, len(self.flat_trans))
+
+
+
+    # 功能 : 初始的 DFA 状态（还没有读入开头的边界符）
+    def init_state(self):
+        return 0
+
+
+
+    # 功能 : 把字符类序列 seq （长度为 k 的整数倍）逐级两两合并成 stride 类序列
+    def reduce_classes(self, seq):
+        for pair_map, pair_table, n in zip(self.pair_maps, self.pair_tables, self.level_n):
+            if pair_table is not None and isinstance(seq, bytes):
+                seq = list(map(pair_table.__getitem__, memoryview(seq).cast('H')))
+            else:
+                seq = [ pair_map[a*n+b] for a, b in zip(seq[0::2], seq[1::2]) ]
+            if len(seq) > 0 and max(seq) < 256:
+                seq = bytes(seq)
+        return seq
+
+
+
+    # 功能 : 字节 data 对应的字符类序列
+    def data_classes(self, data):
+        if self.class_bytes is not None:
+            return data.translate(self.class_bytes)
+        char_class = self.char_class
+        return [ char_class[c] for c in data ]
+
+
+
+    # 功能 : 从 DFA 状态 d 开始扫描字符类序列 seq （长度为 k 的整数倍）， seq[0] 在输入流中的位置为 base
+    #        （输入流的位置：开头的边界符为 0 ，data[i] 为 i+1 ，结尾的边界符为 L+1 ）
+    # 参数 : hits  : 命中结果追加到这个列表里，每项为 (offset, rule_id)
+    #        limit : offset 的上限（结尾的边界符报告的 offset 是 L 而不是 L+1）
+    # 返回 : 扫描完 seq 后的 DFA 状态
+    def scan_classes(self, d, seq, base, hits, limit):
+        k, n_stride = self.k, self.n_stride
+        flat_trans, flat_hits, patterns = self.flat_trans, self.flat_hits, self.patterns
+        fd = d * n_stride
+        for pos, j in enumerate(self.reduce_classes(seq)):
+            i = fd + j
+            if flat_hits[i]:
+                for p, rule_id in patterns[flat_hits[i]]:
+                    hits.append((min(base + pos*k + p, limit), rule_id))
+            fd = flat_trans[i]
+        return fd // n_stride
+
+
+
+    # 功能 : 扫描一段完整的输入 data (bytes)，开头和结尾各有一个边界符
+    # 返回 : 命中列表 [(offset, rule_id), ...] ，按 offset 升序
+    def scan(self, data):
+        seq = bytes([self.class_border]) + bytes(self.data_classes(data)) if self.class_bytes is not None else [self.class_border] + self.data_classes(data)
+        seq = seq + self.tail_classes(len(seq))
+        hits = []
+        self.scan_classes(self.init_state(), seq, 0, hits, len(data))
+        return hits
+
+
+
+    # 功能 : 结尾的边界符和填充类，使总长度为 k 的整数倍
+    # 参数 : n : 之前的字符类序列的长度
+    def tail_classes(self, n):
+        tail = [self.class_border] + [self.n_class] * ((-(n+1)) % self.k)
+        return bytes(tail) if self.class_bytes is not None else tail
+
+
+
+    # 功能 : 扫描一个文件（分块读入，不足 k 个的字符类留到下一块），开头和结尾各有一个边界符
+    # 返回 : 命中列表 [(offset, rule_id), ...] ，按 offset 升序
+    def scan_file(self, fname):
+        hits = []
+        d = self.init_state()
+        left = bytes([self.class_border]) if self.class_bytes is not None else [self.class_border]
+        base = 0                                                    # left[0] 在输入流中的位置
+        size = 0
+        with open(fname, 'rb') as fp:
+            while True:
+                data = fp.read(SCAN_CHUNK_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                seq = left + self.data_classes(data)
+                n = len(seq) - len(seq) % self.k
+                d = self.scan_classes(d, seq[:n], base, hits, size)
+                left = seq[n:]
+                base += n
+        seq = left + self.tail_classes(len(left))
+        self.scan_classes(d, seq, base, hits, size)
+        return hits
+
+
+
+    # 功能 : 保存成 json 文件（可供 HDL 生成器读入）
+    def save(self, fname):
+        with open(fname, 'wt') as fp:
+            json.dump({'k':self.k, 'n_class':self.n_class, 'char_class':self.char_class, 'pair_maps':self.pair_maps,
+                       'trans':self.trans, 'hits':self.hits, 'patterns':self.patterns}, fp, separators=(',',':'))
+
+
+
+# 函数 : load_stride_table
+# 功能 : 从 StrideDFATable.save 保存的 json 文件读入 k-stride DFA 转换表
+def load_stride_table(fname):
+    with open(fname, 'rt') as fp:
+        obj = json.load(fp)
+    return StrideDFATable(obj['k'], obj['n_class'], obj['char_class'], obj['pair_maps'], obj['trans'], obj['hits'], obj['patterns'])
+
+
+
+# 函数 : build_stride_table
+# 功能 : 把 DFA 转换表转成 k-stride DFA 转换表
+#        先对 DFA 的所有状态求出每个 stride 类的"列"：读入后到达的状态向量、命中模式向量，列相同的元组合并成同一 stride 类；
+#        然后只保留从起始状态出发、每次走 k 步能到达的状态，重新编号
+# 参数 : dfa         : DFATable ，或者 homo-NFA (class NFA) —— 此时先用子集构造建立 DFA 转换表
+#        k           : 每次转换读入的字符数（2 的幂）
+#        max_entries : 结果的表项数超过它就放弃
+#        max_work    : 合并过程中 (状态数 × 元组数) 超过它就放弃
+# 返回 : StrideDFATable ，放弃时返回 None
+def build_stride_table(dfa, k, max_entries=STRIDE_MAX_ENTRIES, max_work=STRIDE_MAX_WORK):
+    assert k >= 1 and k & (k-1) == 0
+    if not hasattr(dfa, 'trans'):
+        dfa = build_dfa_table(dfa, max_entries)
+        if dfa is None:
+            return None
+    n, n_class = len(dfa.trans), dfa.n_class
+
+    patterns = [()]                                             # 命中模式，0 号为空模式
+    pattern_id = {(): 0}
+    def intern_pattern(pattern):
+        if pattern not in pattern_id:
+            pattern_id[pattern] = len(patterns)
+            patterns.append(pattern)
+        return pattern_id[pattern]
+
+    # 1-stride 类就是字符类，外加一个填充类
+    state_pattern = [ intern_pattern(tuple((0, rule_id) for rule_id in rule_ids)) for rule_ids in dfa.rules ]
+    cols = []                                                   # cols[j] = (到达的状态向量, 命中模式向量)
+    for c in range(n_class):
+        nexts = tuple( row[c] for row in dfa.trans )
+        cols.append( (nexts, _gather(state_pattern, nexts)) )
+    cols.append( (tuple(range(n)), (0,)*n) )
+    padded = [False] * n_class + [True]                         # padded[j] : stride 类 j 的末尾是否含有填充类（填充类之后只能是填充类）
+    all_pad = [False] * n_class + [True]
+
+    # 逐级两两合并
+    pair_maps = []
+    width = 1
+    combine_memo = dict()
+    while width < k:
+        m = len(cols)
+        if m * m * n > max_work:
+            return None
+        new_cols, new_padded, new_all_pad = [], [], []
+        col_id = dict()
+        pair_map = [0] * (m*m)
+        for a, (a_next, a_hits) in enumerate(cols):
+            a_has_hits = any(a_hits)
+            for b, (b_next, b_hits) in enumerate(cols):
+                if padded[a] and not all_pad[b]:
+                    continue
+                nexts = _gather(b_next, a_next)
+                b_at = _gather(b_hits, a_next)
+                if a_has_hits or any(b_at):
+                    hit_vec = []
+                    for ha, hb in zip(a_hits, b_at):
+                        if hb == 0:
+                            hit_vec.append(ha)
+                        else:
+                            key = (ha, hb, width)
+                            h = combine_memo.get(key)
+                            if h is None:
+                                h = intern_pattern( patterns[ha] + tuple((p+width, rule_id) for p, rule_id in patterns[hb]) )
+                                combine_memo[key] = h
+                            hit_vec.append(h)
+                    hit_vec = tuple(hit_vec)
+                else:
+                    hit_vec = a_hits
+                col = (nexts, hit_vec)
+                if col not in col_id:
+                    col_id[col] = len(new_cols)
+                    new_cols.append(col)
+                    new_padded.append(padded[b])
+                    new_all_pad.append(all_pad[a] and all_pad[b])
+                pair_map[a*m+b] = col_id[col]
+        pair_maps.append(pair_map)
+        cols, padded, all_pad = new_cols, new_padded, new_all_pad
+        width *= 2
+
+    # 只保留从起始状态每次走 k 步能到达的状态
+    m = len(cols)
+    new_id = {0: 0}
+    order = [0]
+    trans = []
+    hits = []
+    i = 0
+    while i < len(order):
+        d = order[i]
+        row, hit_row = [], []
+        for nexts, hit_vec in cols:
+            t = nexts[d]
+            if t not in new_id:
+                new_id[t] = len(order)
+                order.append(t)
+            row.append(new_id[t])
+            hit_row.append(hit_vec[d])
+        trans.append(row)
+        hits.append(hit_row)
+        if len(order) * m > max_entries:
+            return None
+        i += 1
+    return StrideDFATable(k, n_class, list(dfa.char_class), pair_maps, trans, hits, patterns)
+
+
+
+# 函数 : nfa_stride_edges
+# 功能 : homo-NFA 的 k-stride 边数：状态对 (n, m) 中 m 恰好能由 n 走 k 步到达的对数（homo-NFA 的字符集在状态上，所以路径总是可以走通）
+#        这是直接把 homo-NFA 做成 k-stride NFA 时转换边的数量
+# 返回 : NFA_N : NFA 状态数
+#        edges : 列表，第 i 项是 (i+1)-stride 的边数， i = 0 ~ k-1
+def nfa_stride_edges(nfa, k):
+    NFA_N, NFAhomo_fore_net, _, _, _, _ = get_NFA_homo_LUT(nfa)
+    fore_stride = get_stride_net(NFAhomo_fore_net)
+    reach = list(NFAhomo_fore_net)
+    edges = [ sum(bin(mask).count('1') for mask in reach) ]
+    for _ in range(k-1):
+        reach = [ get_next_mask_stride(mask, fore_stride) for mask in reach ]
+        edges.append( sum(bin(mask).count('1') for mask in reach) )
+    return NFA_N, edges
+
+
+
+# 函数 : dfa_friendly_subset
+# 功能 : 从 regex 列表中贪心地挑出一部分，使它们合起来的 DFA 状态数不超过 max_dfa_stat
+#        每次尝试加入一整块 regex ，失败时把这一块对半拆开再试，直到单个 regex ；连续 max_fail 个单个 regex 加入失败就停止
+# 返回 : 挑出的 regex 列表（保持原来的顺序）
+def dfa_friendly_subset(regex_strings, max_dfa_stat, block=32, max_fail=32):
+    chosen = []
+    todo = [ regex_strings[i:i+block] for i in range(0, len(regex_strings), block) ][::-1]
+    n_fail = 0
+    while todo and n_fail < max_fail:
+        regexs = todo.pop()
+        if build_dfa_table(genHomoNFAfromRegex(chosen + regexs), max_dfa_stat) is not None:
+            chosen += regexs
+            n_fail = 0
+        elif len(regexs) > 1:
+            todo.append(regexs[len(regexs)//2:])
+            todo.append(regexs[:len(regexs)//2])
+        else:
+            n_fail += 1
+    return chosen
+
+
+
+# 函数 : stride_report
+# 功能 : 对一个正则表达式文件，报告 k = 1, 2, 4, ... 时 k-stride 自动机的规模增长和吞吐率
+#        NFA 部分用全部 regex ；整个文件的 DFA 通常会状态爆炸，所以 DFA 部分只用 dfa_friendly_subset 挑出的 regex
+# 参数 : regex_strings : regex 列表
+#        ks            : 要报告的 k 的列表
+#        data          : 用于测量软件扫描吞吐率的数据 (bytes)
+#        max_dfa_stat  : DFA 状态数的上限
+#        minimize      : 是否先最小化 DFA
+# 返回 : 报告的各行（字符串列表）
+def stride_report(regex_strings, ks, data, max_dfa_stat, minimize=False):
+    lines = []
+    nfa = genHomoNFAfromRegex(regex_strings)
+    NFA_N, nfa_edges = nfa_stride_edges(nfa, max(ks))
+    lines.append('NFA#S=%d  ' % NFA_N + '  '.join('%d-stride NFA edges=%d (x%.2f)' % (k, nfa_edges[k-1], nfa_edges[k-1]/max(nfa_edges[0],1)) for k in ks) )
+
+    stime = time()
+    dfa_regexs = dfa_friendly_subset(regex_strings, max_dfa_stat)
+    dfa = build_dfa_table(genHomoNFAfromRegex(dfa_regexs))
+    if minimize:
+        dfa = minimize_dfa_table(dfa)
+    lines.append('[%12d ms]   %d/%d regexs  %s' % (int(round((time()-stime)*1000)), len(dfa_regexs), len(regex_strings), dfa) )
+
+    base_entries, base_mbps = None, None
+    for k in ks:
+        stime = time()
+        table = build_stride_table(dfa, k)
+        build_ms = int(round((time()-stime)*1000))
+        if table is None:
+            lines.append('[%12d ms]   k=%d  too large, give up' % (build_ms, k))
+            break
+        edges = sum( len(set(row)) for row in table.trans )                                    # 互不相同的 (源状态, 目的状态) 对
+        stime = time()
+        table.scan(data)
+        mbps = len(data) / max(time()-stime, 1e-9) / 1e6
+        if base_entries is None:
+            base_entries, base_mbps = len(table.flat_trans), mbps
+        lines.append('[%12d ms]   k=%d  bytes/cycle=%d  stats=%d  stride_classes=%d  entries=%d (x%.2f)  edges=%d  patterns=%d  sw=%.3f MB/s (x%.2f)' % (
+                     build_ms, k, k, len(table), table.n_stride, len(table.flat_trans), len(table.flat_trans)/base_entries, edges, len(table.patterns), mbps, mbps/base_mbps) )
+    return lines
+
+
+
+# 主函数
+# 用法一: python dfa_stride.py <rules.re> <out.json> <k>            建立 k-stride DFA 转换表并保存
+# 用法二: python dfa_stride.py [rules.re] [数据文件] [min]          报告 k=1,2,4 时的规模增长和吞吐率（不给出 .re 文件时报告 rules/ 下的所有文件）
+if __name__ == '__main__':
+
+    # 解析命令行参数
+    (REGEX_FNAME, OUT_FNAME), ARGV_NUMS = argv_parse(['.re', '.json'])
+    DATA_FNAMES = [argv for argv in sys.argv[1:] if argv not in (REGEX_FNAME, OUT_FNAME) and os.path.isfile(argv)]
+    MINIMIZE = 'min' in sys.argv[1:]
+    K = int(ARGV_NUMS[0]) if len(ARGV_NUMS) == 1 and ARGV_NUMS[0] == int(ARGV_NUMS[0]) else 0
+    if (OUT_FNAME != '' and (REGEX_FNAME == '' or K < 1 or K & (K-1) != 0)) or (OUT_FNAME == '' and len(ARGV_NUMS) > 0):       # k 必须是 2 的幂
+        print('Usage: python %s <输入正则表达式文件(.re)> <输出转换表文件(.json)> <k(2的幂)>' % sys.argv[0])
+        print('       python %s [输入正则表达式文件(.re)] [测速数据文件] [min]' % sys.argv[0])
+        exit(-1)
+
+    def read_regexs(fname):
+        return list( filter( lambda regex:len(regex)>0 , open(fname, 'rt').read().split('\n') ) )
+
+    # 用法一: 建立并保存 k-stride DFA 转换表
+    if OUT_FNAME != '':
+        regex_strings = read_regexs(REGEX_FNAME)
+        stime = time()
+        table = build_stride_table(genHomoNFAfromRegex(regex_strings), K)
+        if table is None:
+            print('k-stride DFA too large')
+            exit(-1)
+        table.save(OUT_FNAME)
+        print('[%12d ms]   build' % int(round((time()-stime)*1000)), table)
+        exit(0)
+
+    # 用法二: 规模增长和吞吐率报告
+    if len(DATA_FNAMES) > 0:
+        data = open(DATA_FNAMES[0], 'rb').read()
+    else:
+        data = Random(0).randbytes(1<<20)
+    if REGEX_FNAME != '':
+        REGEX_FNAMES = [REGEX_FNAME]
+    else:
+        REGEX_FNAMES = sorted( os.path.join('rules', fname) for fname in os.listdir('rules') if fname.endswith('.re') )
+    for fname in REGEX_FNAMES:
+        print('-------- %s --------' % fname)
+        for line in stride_report(read_regexs(fname), [1, 2, 4], data, STRIDE_REPORT_DFA_MAX, MINIMIZE):
+            print(line)
+        print()
@@ -0,0 +1,279 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 本代码文件把 homo-NFA 用子集构造法转成完整的 DFA 转换表，并提供表驱动的扫描
+# DFA 转换表的格式：
+#     char_class[c]  : 字符 c (0~255 为字节，256 为边界符) 所属的字符类号，同一类的字符在 DFA 中的转换完全相同
+#     trans[d][k]    : DFA 状态 d 读入字符类 k 后到达的 DFA 状态号，起始状态是 0
+#     rules[d]       : DFA 状态 d 命中的 rule_id 列表（rule_id 是正则表达式在 regex 列表中的下标）
+# 转换表可以保存成 json 文件（dfa_multi.py 把它保存在 dfaN.re 旁边，名为 dfaN.json），之后扫描或生成 HDL 时直接读入，不用再做子集构造
+
+import os
+import sys
+import json
+from time import time
+
+from nfa import genHomoNFAfromRegex
+from nfa_homo_calculation import get_NFA_homo_LUT, get_stride_net, get_next_mask_stride, get_accept_rules, get_char_class, get_class_mask
+from nfa_homo_match import CHAR_BORDER, SCAN_CHUNK_SIZE
+
+
+
+# 类 : DFATable
+# 功能 : DFA 转换表，以及表驱动的扫描。扫描接口与 NFAHomoMatcher 相同，但激活状态是 DFA 状态号
+class DFATable():
+
+    def __init__(self, n_class, char_class, trans, rules):
+        self.n_class = n_class
+        self.char_class = char_class
+        self.trans = trans
+        self.rules = rules
+
+        # 扫描用的扁平化转换表：状态号预先乘以 n_class ，这样单步转换只要一次加法和一次查表
+        self.flat_trans = [ nd * n_class  for row in trans  for nd in row ]
+        self.flat_rules = [ None ] * (len(trans) * n_class)
+        for d, rule_ids in enumerate(rules):
+            self.flat_rules[d * n_class] = tuple(rule_ids)
+
+        # 字节 → 字符类的转换表，可以用 bytes.translate 一次性转换整块数据（字符类数不超过 256 时）
+        self.class_bytes = bytes(char_class[:256]) if n_class <= 256 else None
+
+
+
+    # 功能 : DFA 状态数
+    def __len__(self):
+        return len(self.trans)
+
+
+
+    # 返回  ： 字符串形式的对象，一般用于打印
+    def __str__(self):
+        return '<DFA: %d stats, %d classes, %d accept stats>' % (len(self.trans), self.n_class, sum(1 for rule_ids in self.rules if rule_ids))
+
+
+
+    # 功能 : 初始的 DFA 状态
+    def init_state(self):
+        return 0
+
+
+
+    # 功能 : DFA 状态 d 读入一个字符 c（0~255 为字节，CHAR_BORDER 为边界符）后的 DFA 状态
+    def step(self, d, c):
+        return self.trans[d][self.char_class[c]]
+
+
+
+    # 功能 : 从 DFA 状态 d 开始扫描一段字节 data ，data[0] 的全局位置为 base
+    # 参数 : hits : 命中结果追加到这个列表里，每项为 (offset, rule_id)
+    # 返回 : 扫描完 data 后的 DFA 状态
+    def scan_chunk(self, d, data, base, hits):
+        n_class = self.n_class
+        flat_trans, flat_rules = self.flat_trans, self.flat_rules
+        if self.class_bytes is not None:
+            classes = data.translate(self.class_bytes)
+        else:
+            char_class = self.char_class
+            classes = [char_class[c] for c in data]
+        fd = d * n_class
+        for offset, k in enumerate(classes, base+1):
+            fd = flat_trans[fd + k]
+            if flat_rules[fd]:
+                for rule_id in flat_rules[fd]:
+                    hits.append((offset, rule_id))
+        return fd // n_class
+
+
+
+    # 功能 : 从 DFA 状态 d 开始读入一个边界符，位置为 offset
+    # 返回 : 读入后的 DFA 状态
+    def scan_border(self, d, offset, hits):
+        d = self.step(d, CHAR_BORDER)
+        for rule_id in self.rules[d]:
+            hits.append((offset, rule_id))
+        return d
+
+
+
+    # 功能 : 扫描一段完整的输入 data (bytes)，开头和结尾各有一个边界符
+    # 返回 : 命中列表 [(offset, rule_id), ...] ，按 offset 升序
+    def scan(self, data):
+        hits = []
+        d = self.scan_border(self.init_state(), 0, hits)
+        d = self.scan_chunk(d, data, 0, hits)
+        self.scan_border(d, len(data), hits)
+        return hits
+
+
+
+    # 功能 : 扫描一个文件（分块读入），开头和结尾各有一个边界符
+    # 返回 : 命中列表 [(offset, rule_id), ...] ，按 offset 升序
+    def scan_file(self, fname):
+        hits = []
+        base = 0
+        d = self.scan_border(self.init_state(), 0, hits)
+        with open(fname, 'rb') as fp:
+            while True:
+                data = fp.read(SCAN_CHUNK_SIZE)
+                if not data:
+                    break
+                d = self.scan_chunk(d, data, base, hits)
+                base += len(data)
+        self.scan_border(d, base, hits)
+        return hits
+
+
+
+    # 功能 : 保存成 json 文件
+    def save(self, fname):
+        with open(fname, 'wt') as fp:
+            json.dump({'n_class':self.n_class, 'char_class':self.char_class, 'trans':self.trans, 'rules':self.rules}, fp, separators=(',',':'))
+
+
+
+# 函数 : load_dfa_table
+# 功能 : 从 DFATable.save 保存的 json 文件读入 DFA 转换表
+def load_dfa_table(fname):
+    with open(fname, 'rt') as fp:
+        obj = json.load(fp)
+    return DFATable(obj['n_class'], obj['char_class'], obj['trans'], obj['rules'])
+
+
+
+# 函数 : build_dfa_table
+# 功能 : 用子集构造法把 homo-NFA 转成 DFA 转换表，按广度优先顺序给 DFA 状态编号
+#        DFA 状态数 > max_dfa_stat 时放弃，避免浪费过多的计算时间
+# 参数 : nfa : 必须是 homo-NFA (class NFA)
+# 返回 : DFATable ，放弃时返回 None
+def build_dfa_table(nfa, max_dfa_stat=-1):
+    _, NFAhomo_fore_net, _, NFAhomo_char_mask, _, NFAhomo_accept_net = get_NFA_homo_LUT(nfa)
+    n_class, char_class = get_char_class(nfa)
+    class_mask = get_class_mask(NFAhomo_char_mask, n_class, char_class)
+    fore_stride = get_stride_net(NFAhomo_fore_net)
+
+    sets = [1]                                  # sets[d] = DFA 状态 d 对应的 NFA 子集，起始状态只包含 NFA 的 0 号状态
+    id_of = {1: 0}
+    trans = []
+    rules = []
+    d = 0
+    while d < len(sets):                        # sets 兼作广度优先遍历的队列
+        s = sets[d]
+        tmask = get_next_mask_stride(s, fore_stride)
+        row = []
+        for cmask in class_mask:
+            t = tmask & cmask
+            if t not in id_of:
+                if max_dfa_stat >= 0 and len(sets) >= max_dfa_stat:
+                    return None
+                id_of[t] = len(sets)
+                sets.append(t)
+            row.append(id_of[t])
+        trans.append(row)
+        rules.append(list(get_accept_rules(s, NFAhomo_accept_net)))
+        d += 1
+    return DFATable(n_class, char_class, trans, rules)
+
+
+
+
+# 函数 : minimize_dfa_table
+# 功能 : 用 Hopcroft 划分细化算法最小化 DFA 转换表，复杂度 O(n·k·log n) （n 为 DFA 状态数， k 为字符类数）
+#        初始划分按每个状态命中的 rule_id 列表划分，所以最小化后每个位置命中的 rule_id 不变
+# 参数 : dfa : DFATable （子集构造得到的 DFA 是完整的，每个状态对每个字符类都有转换）
+# 返回 : 最小化后的 DFATable ，状态按广度优先顺序重新编号，起始状态仍是 0
+def minimize_dfa_table(dfa):
+    n, n_class = len(dfa.trans), dfa.n_class
+
+    # 反向转换表: inv[k][t] = 读入字符类 k 后到达 t 的状态列表
+    inv = [ [[] for _ in range(n)] for _ in range(n_class) ]
+    for d, row in enumerate(dfa.trans):
+        for k, t in enumerate(row):
+            inv[k][t].append(d)
+
+    # 初始划分: 命中的 rule_id 相同的状态在同一块
+    block_of_rules = dict()
+    for d, rule_ids in enumerate(dfa.rules):
+        block_of_rules.setdefault(tuple(rule_ids), []).append(d)
+    blocks = [ set(states) for states in block_of_rules.values() ]
+    block_of = [0] * n
+    for b, states in enumerate(blocks):
+        for d in states:
+            block_of[d] = b
+
+    # 待处理的分割者（块号）：初始时除最大块外的所有块
+    largest = max(range(len(blocks)), key=lambda b:len(blocks[b]))
+    waiting = set( b for b in range(len(blocks)) if b != largest )
+
+    while waiting:
+        splitter = list(blocks[waiting.pop()])
+        for k in range(n_class):
+            inv_k = inv[k]
+            touched = dict()                                        # 块号 → 块中读入 k 后到达 splitter 的状态
+            for t in splitter:
+                for d in inv_k[t]:
+                    touched.setdefault(block_of[d], []).append(d)
+            for b, states in touched.items():
+                if len(states) == len(blocks[b]):                   # 整块都到达 splitter ，不用分割
+                    continue
+                new_block = set(states)                             # 分割出新块
+                blocks[b] -= new_block
+                nb = len(blocks)
+                blocks.append(new_block)
+                for d in new_block:
+                    block_of[d] = nb
+                if b in waiting or len(new_block) <= len(blocks[b]):
+                    waiting.add(nb)
+                else:
+                    waiting.add(b)
+
+    # 按广度优先顺序给块编号，建立新的转换表
+    new_id = { block_of[0] : 0 }
+    order = [ block_of[0] ]
+    trans = []
+    rules = []
+    i = 0
+    while i < len(order):
+        d = next(iter(blocks[order[i]]))                            # 块中任取一个状态作代表
+        row = []
+        for t in dfa.trans[d]:
+            tb = block_of[t]
+            if tb not in new_id:
+                new_id[tb] = len(order)
+                order.append(tb)
+            row.append(new_id[tb])
+        trans.append(row)
+        rules.append(list(dfa.rules[d]))
+        i += 1
+    return DFATable(n_class, list(dfa.char_class), trans, rules)
+
+
+
+
+# 主函数
+# 从命令行参数读入正则表达式文件，建立 DFA 转换表并保存成 json 文件；若再给出数据文件，则用 DFA 转换表扫描它
+if __name__ == '__main__':
+
+    # 解析命令行参数
+    ARGVS = sys.argv[1:]
+    if len(ARGVS) < 2 or not ARGVS[0].endswith('.re') or not ARGVS[1].endswith('.json'):
+        print('Usage: python %s <输入正则表达式文件(.re)> <输出DFA转换表文件(.json)> [待扫描数据文件 ...]' % sys.argv[0])
+        exit(-1)
+    REGEX_FNAME, DFA_FNAME, DATA_FNAMES = ARGVS[0], ARGVS[1], ARGVS[2:]
+
+    # 读取文件，得到一行一行的 regex （保持文件中的顺序，rule_id 即行号）
+    regex_strings = list( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) )
+    print('total %d regexs\n' % len(regex_strings))
+
+    # 建立并保存 DFA 转换表
+    stime = time()
+    dfa = build_dfa_table(genHomoNFAfromRegex(regex_strings))
+    dfa.save(DFA_FNAME)
+    print('[%12d ms]   build DFA  ' % int(round((time()-stime)*1000)), dfa)
+
+    # 逐个扫描数据文件
+    for DATA_FNAME in DATA_FNAMES:
+        stime = time()
+        hits = dfa.scan_file(DATA_FNAME)
+        dtime = time() - stime
+        size = os.path.getsize(DATA_FNAME)
+        print('[%12d ms]   %s  %d bytes  %d hits  %.3f MB/s' % (int(round(dtime*1000)), DATA_FNAME, size, len(hits), size/max(dtime,1e-9)/1e6) )
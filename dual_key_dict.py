@@ -8,9 +8,12 @@
 #                      同理，指定 keyb , 它能以 O(1) （哈希查询）的复杂度给出所有包含 keyb 的键对儿 (keya, keyb)
 class dual_key_dict():
 
+    __slots__ = ('a2b', 'b2a', 'n_pair')
+
     def __init__(self):
         self.a2b = dict()
         self.b2a = dict()
+        self.n_pair = 0                    # 键对儿的个数，让 __len__ 不用遍历
 
     # 方法 : pop_pair
     # 功能 : 指定键对 key_pair （key_pair 必须是二元组），弹出它
@@ -22,6 +25,7 @@ class dual_key_dict():
             keya2b = self.a2b[keya]
             if keyb in keya2b:
                 item = keya2b.pop(keyb)
+                self.n_pair -= 1
                 if len(keya2b) <= 0:
                     self.a2b.pop(keya)
         if keyb in self.b2a:
@@ -44,7 +48,9 @@ class dual_key_dict():
     
     def rm_keya(self, keya):
         if keya in self.a2b:
-            for keyb in self.a2b.pop(keya):
+            keya2b = self.a2b.pop(keya)
+            self.n_pair -= len(keya2b)
+            for keyb in keya2b:
                 self.pop_pair((keya, keyb))
     
     def rm_keyb(self, keyb):
@@ -60,6 +66,8 @@ class dual_key_dict():
         keya, keyb = key_pair
         if not keya in self.a2b:
             self.a2b[keya] = dict()
+        if not keyb in self.a2b[keya]:
+            self.n_pair += 1
         self.a2b[keya][keyb] = item
         if not keyb in self.b2a:
             self.b2a[keyb] = dict()
@@ -83,10 +91,7 @@ class dual_key_dict():
         return len(self.a2b) > 0
     
     def __len__(self):
-        length = 0
-        for keya in self.a2b:
-            length += len(self.a2b[keya])
-        return length
+        return self.n_pair
     
     def keya_dict(self, keya):
         if keya in self.a2b:
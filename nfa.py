@@ -10,6 +10,7 @@ from graphviz import Digraph
 from argv_parse import argv_parse
 from utils import bit1_from_list, bit1_from_range, bit1_count, bit1_pos_yield, bit1_or, bit1_and, bit1_exclude, bit1_include_truely, bit1_include, CHARSET_SIZE, CHARSET_FULL, CHARSET_BORDER, CHARSET_DOT, CHARSET_WORDS, CHARSET_DIGITS, CHARSET_SPACES, charset_bit1_to_str
 from dual_key_dict import dual_key_dict
+from nfa_compact import CompactNFA
 from regex_tree import build_syntax_tree
 
 
@@ -244,57 +245,234 @@ class NFA():
     
     
     
-    # 功能： 化简 NFA (目前尚未化成最简的形式，但不一定要化成最简）
-    # 注意： 必须对调用 remove_epsilon 后的 NFA 使用
-    def simplify(self):
-        retry = True
-        while retry:
-            retry = False
-            for sn in self.T.all_keya():                                   # 对于所有出发状态 sn
-                all4n = self.T.keya_dict(sn)
-                for n1 in all4n:                                           # n1 和 n2 都来自 sn
-                    for n2 in all4n:
-                        if n1 < n2 and self.merge_when_same_in(n1, n2):    # 如果 n1 和 n2 有相同的入边
-                            retry = True
-        retry = True
-        while retry:
-            retry = False
-            for en in self.A.all_keyb():                                   # 对于所有接受号 en
-                all2n = self.A.keyb_dict(en)
-                for n1 in all2n:                                           # n1 和 n2 都会到达 en
-                    for n2 in all2n:
-                        if n1 < n2 and self.merge_when_same_out(n1, n2):
-                            retry = True
-        retry = True
-        while retry:
-            retry = False
-            for en in self.T.all_keyb():                                   # 对于所有到达状态 en
-                all2n = self.T.keyb_dict(en)
-                for n1 in all2n:                                           # n1 和 n2 都会到达 en
-                    for n2 in all2n:
-                        if n1 < n2 and self.merge_when_same_out(n1, n2):
-                            retry = True
+    # 功能  ： 互模拟划分的初始标签，标签不同的状态一定不互模拟
+    # 说明  ： 标签中含有签名里的字符集集合，这不改变结果，只是让初始划分更细、求精的轮数更少
+    def bisimulation_label(self, n:int, forward:bool):
+        if forward:
+            in_csets = set(self.T.keyb_dict(n).values())
+            return (frozenset(self.A.keya_dict(n)), in_csets.pop() if len(in_csets) == 1 else ('mixed', n), frozenset(self.T.keya_dict(n).values()))   # 入边字符集不一致的状态不与别的状态合并，避免破坏 homo-NFA 结构
+        else:
+            return (n == 0, frozenset(self.T.keyb_dict(n).values()))          # 起始状态单独一块
+    
+    
+    
+    # 功能  ： 找出需要重新划分的状态：上次划分（NFA 已没有两个状态互模拟）之后，只有 dirty 中的状态有变化，新的互模拟关系只能出现在返回的状态之间
+    # 参数  ： forward : 同 bisimulation_blocks
+    #          dirty   : 上次划分之后出边、入边或标签有变化的状态
+    # 返回  ： 状态集合，其它状态与任何状态都不互模拟
+    # 说明  ： 以前向为例（后向把出边换成入边）：前向互模拟只看出边，新出现的一对互模拟的状态，沿出边往下总能找到一对新互模拟的状态，
+    #          其中一个 a 在 A 中， A 为 dirty 及与 dirty 在同一个环上的状态（不在环上的祖先，要等它的后继合并、被 merge_around 标为 dirty 后，
+    #          下一轮再划分）。另一个状态 z 若不在 A 中，它与 a 的标签相同，且：
+    #              a 有一条出边 (m, cset) 指向 A 之外时， z 一定也有这条出边（A 之外的状态互不模拟），即 z 是 m 以 cset 到达的前驱；
+    #              a 是接受状态时， z 有相同的接受号；
+    #              其它情况下 a 的出边都指向 A 或伙伴中的状态， z 的出边也是这样，即 z 是 A 中状态或某个伙伴的前驱
+    #          返回 A 和所有可能的伙伴 z ，一般只与 dirty 附近的规模有关，不必每次都划分整个 NFA
+    def bisimulation_stats(self, forward:bool, dirty):
+        sig_edges = self.T.keya_dict if forward else self.T.keyb_dict         # 签名看的边
+        rev_edges = self.T.keyb_dict if forward else self.T.keya_dict         # 反方向的边
+        D = set( n for n in dirty if bool(self.T.keya_dict(n)) or bool(self.T.keyb_dict(n)) )
+        anc = set(D)                                                        # dirty 的祖先
+        stack = list(D)
+        while bool(stack):
+            for m in rev_edges(stack.pop()):
+                if m not in anc:
+                    anc.add(m)
+                    stack.append(m)
+        A = set(D)                                                          # dirty 及与它在同一个环上的状态
+        stack = list(D)
+        while bool(stack):
+            for m in sig_edges(stack.pop()):
+                if m in anc and m not in A:
+                    A.add(m)
+                    stack.append(m)
+        
+        labels = dict()
+        def label(n):
+            if n not in labels:
+                labels[n] = self.bisimulation_label(n, forward)
+            return labels[n]
+        partners = set()
+        new = []
+        def try_add(z, lab):
+            if z not in A and z not in partners and label(z) == lab:
+                partners.add(z)
+                new.append(z)
+        
+        inner_labels = set()                                                # 出边都指向 A 中的状态的标签
+        for a in A:
+            outside = [ (m, cset) for m, cset in sig_edges(a).items() if m not in A ]
+            if bool(outside):
+                m, cset = outside[0]
+                for z, z_cset in rev_edges(m).items():
+                    if z_cset == cset:
+                        try_add(z, label(a))
+            else:
+                inner_labels.add(label(a))
+            if forward:
+                for an in self.A.keya_dict(a):
+                    for z in self.A.keyb_dict(an):
+                        try_add(z, label(a))
+        new.extend(A)                                                       # 签名全在 A 与伙伴中的状态，也只可能在它们的后继中
+        while bool(new):
+            for z in rev_edges(new.pop()):
+                if label(z) in inner_labels:
+                    try_add(z, label(z))
+        return A | partners
+    
+    
+    
+    # 功能  ： 对状态做互模拟 (bisimulation) 划分求精 (partition refinement) ，得到最粗的稳定划分，同一块中的状态可以合并
+    # 参数  ： forward : True  为前向互模拟：同一块中的状态接受号相同、到达它们的边的字符集相同，且对任一块、任一字符集，都有或都没有到达该块的出边
+    #                    False 为后向互模拟：同一块中的状态都不是起始状态，且对任一块、任一字符集，都有或都没有来自该块的入边
+    #          dirty   : 上次划分之后有变化的状态，只划分 bisimulation_stats 找出的状态，其它状态各自单独一块；为 None 时划分所有状态
+    # 返回  ： dict ，状态号 → 块号（只含参与划分的状态）
+    # 说明  ： 从按标签的粗划分开始，只重新计算"签名所依赖的状态换了块"的那些状态的签名，直到没有块再分裂，总耗时与参与划分的状态的边数接近线性
+    def bisimulation_blocks(self, forward:bool, dirty=None):
+        if dirty is None:
+            stats = self.all_stats() | self.T.all_keya()
+        else:
+            stats = self.bisimulation_stats(forward, dirty)
+        sig_edges = self.T.keya_dict if forward else self.T.keyb_dict         # 前向签名看出边，出边指向 n 的状态（n 的前驱）的签名依赖 n 所在的块
+        users     = self.T.keyb_dict if forward else self.T.keya_dict         # 后向签名看入边，n 的后继的签名依赖 n 所在的块
+        
+        # 初始划分
+        labels = dict()                                                     # 标签 → 块号
+        block = dict()                                                      # 状态号 → 块号 ，不参与划分的状态 m 的块号记为 -1-m
+        members = dict()                                                    # 块号 → 状态集合
+        for n in stats:
+            b = labels.setdefault(self.bisimulation_label(n, forward), len(labels))
+            block[n] = b
+            members.setdefault(b, set()).add(n)
+        
+        # 划分求精：每一轮只计算"有邻居换了块"的状态的签名，稳定块中其余状态的签名仍等于该块的签名 bsig
+        bsig = dict()                                                       # 块号 → 块中未被触及的状态的签名（初始划分时还没有）
+        block_of = block.get
+        touched = stats
+        while bool(touched):
+            by_block = dict()                                               # 块号 → 本轮被触及的状态
+            for n in touched:
+                by_block.setdefault(block[n], []).append(n)
+            touched = set()
+            for b, ns in by_block.items():
+                if len(members[b]) == 1:                                    # 只有一个状态的块不会再分裂
+                    continue
+                groups = dict()                                             # 签名 → 状态集合
+                for n in ns:
+                    groups.setdefault(frozenset([ (block_of(m, -1-m), cset) for m, cset in sig_edges(n).items() ]), set()).add(n)
+                n_rest = len(members[b]) - len(ns)                         # 未被触及的状态数，它们的签名都是 bsig[b]
+                if n_rest > 0 and any( len(group) > n_rest + len(groups.get(bsig[b], ())) for group in groups.values() ):
+                    groups.setdefault(bsig[b], set()).update(members[b].difference(ns))    # 未被触及的一组不是最大的，才把它们列出来
+                    n_rest = 0
+                keep_sig = bsig[b] if n_rest > 0 else max(groups, key=lambda sig:len(groups[sig]))
+                bsig[b] = keep_sig                                          # 最大的一组留在原块中，其它组分成新块
+                for sig, group in groups.items():
+                    if sig == keep_sig:
+                        continue
+                    new_b = len(members)
+                    members[new_b] = group
+                    members[b] -= group
+                    bsig[new_b] = sig
+                    for n in group:
+                        block[n] = new_b
+                    for n in group:
+                        touched.update( m for m in users(n) if m in block )
+        return block
+    
+    
+    
+    # 功能  ： 把每一块中的状态合并到块中最小的状态上（起始状态 0 始终保留），就地修改，耗时只与被合并的状态的边数有关
+    # 参数  ： block : 状态号 → 块号
+    # 返回  ： (合并掉的状态数, 吸收了其它状态的状态集合)
+    def merge_blocks(self, block:dict):
+        rep = dict()                                                        # 块号 → 块中最小的状态号
+        for n in sorted(block):
+            rep.setdefault(block[n], n)
+        rename = lambda n: rep[block[n]] if n in block else n
+        changed = set()
+        for n, b in block.items():
+            r = rep[b]
+            if n == r:
+                continue
+            for m, cset in list(self.T.keya_dict(n).items()):              # 把 n 的出边、入边（另一端也改名为所在块的代表）和接受号转给 r
+                self.addT(r, rename(m), cset)
+            for m, cset in list(self.T.keyb_dict(n).items()):
+                self.addT(rename(m), r, cset)
+            for an in self.A.keya_dict(n):
+                self.A[(r, an)] = 'ε'
+            self.remove(n)
+            changed.add(r)
+        return len(block) - len(rep), changed
+    
+    
+    
+    # 功能： 合并出的状态 ns 及它们的前驱、后继，即入边、出边或标签因合并而改变的状态
+    #        （合并后平行的边的字符集取并集，所以两个方向上都可能出现新的互模拟）
+    def merge_around(self, ns):
+        around = set(ns)
+        for n in ns:
+            around.update(self.T.keya_dict(n))
+            around.update(self.T.keyb_dict(n))
+        return around
+    
+    
+    
+    # 功能： 化简 NFA ：交替合并后向互模拟（入边相同）和前向互模拟（出边相同）的状态，直到不能再合并
+    #        每次合并之后，两个方向都只需从因合并而改变的状态开始重新划分（见 bisimulation_stats），没有这样的状态时跳过，而不是每次都划分整个 NFA
+    # 参数： dirty_in, dirty_out : 上次化简后入边、出边（或标签）有变化的状态（例如 to_homo_nfa 的返回值），只从它们开始划分；为 None 时划分所有状态
+    # 注意： 必须对调用 remove_epsilon 后的 NFA 使用；给出 dirty_in, dirty_out 时，它们必须包含上次化简后所有有变化的状态
+    # 返回： (n_merge_in, n_merge_out) 两类合并各合并掉的状态数
+    def simplify(self, dirty_in=None, dirty_out=None):
+        n_merge_in, n_merge_out = 0, 0
+        dirty_in  = None if dirty_in  is None else set(dirty_in)            # 待做后向划分的状态
+        dirty_out = None if dirty_out is None else set(dirty_out)           # 待做前向划分的状态
+        while dirty_in is None or dirty_out is None or bool(dirty_in) or bool(dirty_out):
+            if dirty_in is None or bool(dirty_in):
+                n_merge, changed = self.merge_blocks(self.bisimulation_blocks(False, dirty_in))
+                n_merge_in += n_merge
+                dirty_in = self.merge_around(changed)
+                if dirty_out is not None:
+                    dirty_out |= dirty_in
+            if dirty_out is None or bool(dirty_out):
+                n_merge, changed = self.merge_blocks(self.bisimulation_blocks(True, dirty_out))
+                n_merge_out += n_merge
+                dirty_out = self.merge_around(changed)
+                dirty_in |= dirty_out
+        return n_merge_in, n_merge_out
     
     
     
     # 功能： 转 homo-NFA
+    # 说明： 对每个入边字符集不一致的状态 en ，按字符集把入边分组，字符集最常见的一组留在 en 上，其它每组只新建一个状态（复制 en 的出边和接受号）
+    #        复制出的出边与 en 原有的出边字符集相同，不会让已经处理过的状态重新变得不一致；新状态的入边只有一种字符集，也不用再处理
+    #        唯一的例外是 en 的自环 en→en ：在它所在的组处理之前复制出边，新状态会得到一条到达 en 的边 nn→en （自环的字符集），
+    #        所以每个 en 要反复分组，直到入边只剩一种字符集（自环被移走后不会再出现这种边，最多再分一次）
+    # 返回： (入边有变化的状态集合, 出边或标签有变化的状态集合)，供之后的 simplify 只从这些状态开始划分
     def to_homo_nfa(self):
         nn = max(self.all_stats())
-        retry = True
-        while retry:
-            retry = False
-            for en in self.T.all_keyb():                                     # 对于所有到达状态 en
-                csets = set()
+        touched_in, touched_out = set(), set()
+        for en in self.T.all_keyb():                                         # 对于所有到达状态 en
+            while True:
+                groups = dict()                                              #   字符集 → 以它到达 en 的出发状态列表
                 for sn, cset in self.T.keyb_dict(en).items():
-                    if bool(csets) and cset not in csets:
-                        nn += 1                                              # 新建状态
+                    groups.setdefault(cset, []).append(sn)
+                if len(groups) <= 1:
+                    break
+                keep = max(groups, key=lambda cset:len(groups[cset]))
+                for cset, sns in groups.items():
+                    if cset == keep:
+                        continue
+                    nn += 1                                                  #   新建状态
+                    for sn in sns:                                           #   这一组入边改为到达新状态（若其中有 en 的自环 en→en ，则变成 en→nn ，下面复制出边时 nn 也得到自环 nn→nn ）
                         self.addT(sn, nn, self.T.pop_pair((sn, en)))
-                        for een, een_cset in self.T.keya_dict(en).items():
-                            self.addT(nn, een, een_cset)
-                        for an in self.A.keya_dict(en):
-                            self.A[(nn, an)] = 'ε'
-                        retry = True
-                    csets.add(cset)
+                    for een, een_cset in self.T.keya_dict(en).items():
+                        self.addT(nn, een, een_cset)
+                    for an in self.A.keya_dict(en):
+                        self.A[(nn, an)] = 'ε'
+                    touched_in.update(self.T.keya_dict(en))                  #   en 的后继多了来自 nn 的入边
+                    touched_in.update((en, nn))
+                    touched_out.update(sns)                                  #   sn 的出边改为到达 nn ； en 的入边字符集变了（标签变了）
+                    touched_out.update((en, nn))
+        return touched_in, touched_out
     
     
     
@@ -329,18 +507,108 @@ class NFA():
         
         self.T = rebuild_T
         self.A = rebuild_A
+    
+    
+    
+    # 功能： 转成紧凑的只读形式 CompactNFA （必须在 reorganize 之后），之后就不能再增删边了
+    def freeze(self):
+        return CompactNFA(self)
+    
+    
+    
+    # 功能： 增量加入一条正则表达式，作为最后一条规则
+    #        先单独为它建立化简的 homo-NFA ，把状态号平移到现有状态之后，从共享的起始状态 0 接入；
+    #        再按广度优先顺序，把每个新状态合并到入边完全相同的已有状态上（共享前缀），只检查新状态的前驱的后继，耗时与新规则的规模成正比
+    # 注意： 必须对 homo-NFA 使用（例如 genHomoNFAfromRegex(regexs, freeze=False) 的结果）；之后要 reorganize 才能 freeze
+    # 返回： 新规则的 rule_id （等于加入前的规则数）
+    def add_regex(self, regex):
+        sub = NFA([regex])
+        sub.simplify()
+        sub.simplify(*sub.to_homo_nfa())
+        sub.reorganize()                                                    # 新状态按广度优先顺序编号
+        
+        self.n_accept -= 1
+        base = max(self.T.all_keya() | self.T.all_keyb() | self.A.all_keya())
+        rename = lambda n: 0 if n == 0 else n + base
+        new_stats = set()
+        for sn, en, cset in sub.T.tolist():
+            if sn != 0 or en != 0:                                          # 0 的自环已经有了
+                self.addT(rename(sn), rename(en), cset)
+                new_stats.add(rename(en))
+        for sn, _, _ in sub.A.tolist():
+            self.A[(rename(sn), self.n_accept)] = 'ε'
+        
+        # 局部化简：新状态 s 与已有状态 t 入边完全相同时，把 s 合并到 t
+        for s in sorted(new_stats):
+            if s == 0:
+                continue
+            all2s = self.T.keyb_dict(s)
+            candidates = set()
+            for p, cset in all2s.items():
+                if p != s:
+                    candidates |= { t for t, t_cset in self.T.keya_dict(p).items() if t_cset == cset and t != s }
+            for t in sorted(candidates):                                    # 已有状态号小，优先合并到已有状态上
+                if t != 0 and len(self.T.keyb_dict(t)) == len(all2s) and self.merge_when_same_in(t, s):
+                    break
+        return -self.n_accept - 1
+    
+    
+    
+    # 功能： 增量删除一条规则（接受号为 -(rule_id+1) ），排在它后面的规则的 rule_id 都减 1 （与从正则表达式列表中 pop(rule_id) 一致）
+    #        然后删除不再能到达任何接受号的状态：只在"能到达被删规则的接受状态"的那些状态中检查，耗时与这条规则的规模成正比
+    # 注意： 之后要 reorganize 才能 freeze
+    def remove_rule(self, rule_id:int):
+        an = -(rule_id + 1)
+        assert self.n_accept <= an < 0, 'no such rule'
+        accept_stats = list(self.A.keyb_dict(an))
+        self.A.rm_keyb(an)
+        for a in range(an - 1, self.n_accept - 1, -1):                     # 后面的接受号依次前移
+            for sn in self.A.keyb_dict(a):
+                self.A.pop_pair((sn, a))
+                self.A[(sn, a + 1)] = 'ε'
+        self.n_accept += 1
+        
+        # 候选状态：能到达被删规则的接受状态的那些状态（不经过起始状态 0 ）
+        cands = set(accept_stats)
+        todo = list(accept_stats)
+        while bool(todo):
+            n = todo.pop()
+            if n == 0:
+                continue
+            for p in self.T.keyb_dict(n):
+                if p not in cands:
+                    cands.add(p)
+                    todo.append(p)
+        cands.discard(0)
+        
+        # 候选状态中，有接受号、或者有出边到达候选之外的状态（它们不受影响，仍能到达接受号）的状态是活的，再反向传播
+        alive = set()
+        todo = [ n for n in cands if bool(self.A.keya_dict(n)) or any( en not in cands for en in self.T.keya_dict(n) ) ]
+        while bool(todo):
+            n = todo.pop()
+            if n in alive:
+                continue
+            alive.add(n)
+            for p in self.T.keyb_dict(n):
+                if p in cands and p not in alive:
+                    todo.append(p)
+        for n in cands - alive:
+            self.remove(n)
 
 
 
 
 # 函数 : 生成 homo-NFA
-# 如果不在乎 NFA 的细节，而是想一步生成化简的 homo-NFA ，就用这个函数
-def genHomoNFAfromRegex(regexs):
+# 如果不在乎 NFA 的细节，而是想一步生成化简的 homo-NFA ，就用这个函数，返回的是紧凑的只读形式 CompactNFA
+# freeze=False 时返回可修改的 class NFA ，可以再用 add_regex / remove_rule 增量修改规则
+def genHomoNFAfromRegex(regexs, freeze=True):
     nfa = NFA(regexs)
     nfa.simplify()
-    nfa.to_homo_nfa()
-    nfa.simplify()
+    nfa.simplify(*nfa.to_homo_nfa())
     nfa.reorganize()
+    assert nfa.is_homo_nfa(), 'to_homo_nfa left some state with different incoming charsets'
+    if freeze:
+        nfa = nfa.freeze()
     nfa.self_check()   ####
     return nfa
 
@@ -355,7 +623,7 @@ if __name__ == '__main__':
     # 解析命令行参数
     (REGEX_FNAME, DRAW_FNAME), _ = argv_parse(['.re', '.gv'])
     if REGEX_FNAME == '':
-        print('Usage: python %s <输入正则表达式文件(.re)> [输出绘图文件(.gv)]' % sys.argv[0])
+        print('Usage: python %s <输入正则表达式文件(.re)> [输出绘图文件(.gv)] [nocache]' % sys.argv[0])
         exit(-1)
     
     # 读取文件，得到一行一行的 regex ，去重 ， 按 ASCII 编码排序
@@ -366,30 +634,47 @@ if __name__ == '__main__':
     # 起始时间
     stime = int(round(time()*1000))
     
-    # 创建 NFA 对象
-    nfa = NFA(regex_strings)
-    print('[%12d ms]  ' % (int(round(time()*1000)) - stime) , 'build NFA   ' , nfa )
-    nfa.self_check()
-    
-    # 化简 NFA
-    nfa.simplify()
-    print('[%12d ms]  ' % (int(round(time()*1000)) - stime) , 'simplify    ' , nfa )
-    nfa.self_check()
-    
-    # 转 homo NFA
-    nfa.to_homo_nfa()
-    print('[%12d ms]  ' % (int(round(time()*1000)) - stime) , 'to_homo     ' , nfa )
-    nfa.self_check()
-    
-    # 转为 homo NFA 后，再次化简 NFA（这一步一般不会化简太多，耗时也不长）
-    nfa.simplify()
-    print('[%12d ms]  ' % (int(round(time()*1000)) - stime) , 'simplify    ' , nfa )
-    nfa.self_check()
-    
-    # 重组织 NFA（按广度优先遍历顺序重新给状态编号）
-    nfa.reorganize()
-    print('[%12d ms]  ' % (int(round(time()*1000)) - stime) , 'reorganize  ' , nfa )
-    nfa.self_check()
+    # 规则和编译器代码都没有改动时，直接从磁盘缓存 (nfa_cache) 读出建好的 NFA ；加 nocache 参数则总是重新建立
+    from nfa_cache import get_default_cache, get_rules_key
+    from nfa_homo_calculation import get_NFA_homo_LUT
+    cache = get_default_cache()
+    cache_key = get_rules_key(regex_strings)
+    nfa = None if 'nocache' in sys.argv[1:] else cache.load(cache_key)
+    if nfa is not None:
+        print('[%12d ms]  ' % (int(round(time()*1000)) - stime) , 'load cache  ' , nfa )
+    else:
+        # 创建 NFA 对象
+        nfa = NFA(regex_strings)
+        print('[%12d ms]  ' % (int(round(time()*1000)) - stime) , 'build NFA   ' , nfa )
+        nfa.self_check()
+        
+        # 化简 NFA
+        n_merge_in, n_merge_out = nfa.simplify()
+        print('[%12d ms]  ' % (int(round(time()*1000)) - stime) , 'simplify    ' , nfa , ' merged in=%d out=%d' % (n_merge_in, n_merge_out) )
+        nfa.self_check()
+        
+        # 转 homo NFA
+        touched_in, touched_out = nfa.to_homo_nfa()
+        print('[%12d ms]  ' % (int(round(time()*1000)) - stime) , 'to_homo     ' , nfa )
+        nfa.self_check()
+        
+        # 转为 homo NFA 后，再次化简 NFA（只从 to_homo_nfa 改动过的状态开始划分，耗时很短）
+        n_merge_in, n_merge_out = nfa.simplify(touched_in, touched_out)
+        print('[%12d ms]  ' % (int(round(time()*1000)) - stime) , 'simplify    ' , nfa , ' merged in=%d out=%d' % (n_merge_in, n_merge_out) )
+        nfa.self_check()
+        
+        # 重组织 NFA（按广度优先遍历顺序重新给状态编号）
+        nfa.reorganize()
+        print('[%12d ms]  ' % (int(round(time()*1000)) - stime) , 'reorganize  ' , nfa )
+        nfa.self_check()
+        
+        # 转成紧凑的只读形式
+        nfa = nfa.freeze()
+        print('[%12d ms]  ' % (int(round(time()*1000)) - stime) , 'freeze      ' , nfa )
+        nfa.self_check()
+        
+        get_NFA_homo_LUT(nfa)                                      # 算好 homo_tables ，一起存入缓存
+        cache.store(cache_key, nfa)
     
     # NFA 绘图
     if DRAW_FNAME != '':
@@ -0,0 +1,199 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 功能：编译结果的磁盘缓存（按内容寻址）
+# 键是 "编译器版本 + 构造方法 + 正则表达式列表" 的 SHA-1 ：
+#     编译器版本是参与建立 NFA 的源代码文件（包括所有构造方法所在的文件）内容的 SHA-1 ，改了编译器代码，旧的缓存自动失效
+#     正则表达式列表按给出的顺序参与计算（顺序决定接受号），从文件读入时已经去重、排序，所以同一个规则文件总是得到同一个键
+# 值是建好的 homo-NFA (CompactNFA) ，连同 get_NFA_homo_LUT 算好的字符激活表等（nfa.homo_tables）一起 pickle 保存
+# 缓存目录的总大小有上限，超过时按最近使用时间（文件的 mtime ，命中时更新）淘汰最久未用的项 (LRU)
+
+import os
+import sys
+import pickle
+import hashlib
+from time import time
+
+from argv_parse import argv_parse
+from nfa import genHomoNFAfromRegex
+from nfa_homo_calculation import get_NFA_homo_LUT
+
+
+CACHE_DIR = os.environ.get('NFA_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.nfa_cache'))
+CACHE_MAX_BYTES = 1 << 30                     # 缓存目录的总大小上限
+
+COMPILER_FILES = ('nfa.py', 'nfa_glushkov.py', 'nfa_compact.py', 'nfa_homo_calculation.py', 'regex_tree.py', 'regex_parser.py', 'utils.py', 'dual_key_dict.py')
+
+
+
+_compiler_version = None
+
+
+
+# 函数 : get_compiler_version
+# 功能 : 编译器版本：参与建立 NFA 的源代码文件内容的 SHA-1
+def get_compiler_version():
+    global _compiler_version
+    if _compiler_version is None:
+        sha = hashlib.sha1()
+        src_dir = os.path.dirname(os.path.abspath(__file__))
+        for fname in COMPILER_FILES:
+            with open(os.path.join(src_dir, fname), 'rb') as fp:
+                sha.update(fp.read())
+        _compiler_version = sha.hexdigest()
+    return _compiler_version
+
+
+
+# 函数 : get_rules_key
+# 功能 : 计算缓存的键
+# 参数 : regex_strings : 正则表达式列表
+#        method        : 构造方法的名字（不同的构造方法得到的 NFA 不同，不能共用缓存）
+def get_rules_key(regex_strings, method='genHomoNFAfromRegex'):
+    sha = hashlib.sha1()
+    sha.update(get_compiler_version().encode())
+    sha.update(method.encode())
+    for regex in regex_strings:
+        sha.update(b'\n' + regex.encode('utf-8', 'surrogateescape'))
+    return sha.hexdigest()
+
+
+
+# 类 : NFACache
+# 功能 : 一个缓存目录
+class NFACache():
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hit = 0
+        self.miss = 0
+
+
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+
+
+    # 功能 : 读出一项，命中时更新它的使用时间
+    # 返回 : 缓存的对象，没有时返回 None
+    def load(self, key):
+        fname = self.path(key)
+        try:
+            with open(fname, 'rb') as fp:
+                obj = pickle.load(fp)
+        except Exception:                                               # 没有这一项，或文件损坏
+            self.miss += 1
+            return None
+        os.utime(fname)
+        self.hit += 1
+        return obj
+
+
+
+    # 功能 : 存入一项（先写临时文件再改名，多个进程同时写同一项也不会读到写了一半的文件），然后按 LRU 淘汰
+    def store(self, key, obj):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fname = self.path(key)
+        tmp_fname = '%s.%d.tmp' % (fname, os.getpid())
+        with open(tmp_fname, 'wb') as fp:
+            pickle.dump(obj, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fname, fname)
+        self.evict()
+
+
+
+    # 功能 : 总大小超过上限时，删除最久未用的项
+    def evict(self):
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            if fname.endswith('.pkl'):
+                try:
+                    st = os.stat(os.path.join(self.cache_dir, fname))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, fname))
+        total = sum( size for _, size, _ in entries )
+        entries.sort()
+        while total > self.max_bytes and len(entries) > 1:             # 至少保留刚存入的一项
+            _, size, fname = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.cache_dir, fname))
+            except OSError:
+                pass
+            total -= size
+
+
+
+    # 功能 : 清空缓存目录
+    def clear(self):
+        if os.path.isdir(self.cache_dir):
+            for fname in os.listdir(self.cache_dir):
+                if fname.endswith('.pkl') or fname.endswith('.tmp'):
+                    os.remove(os.path.join(self.cache_dir, fname))
+
+
+
+_default_cache = None
+
+
+
+# 函数 : get_default_cache
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = NFACache()
+    return _default_cache
+
+
+
+# 函数 : cached_homo_nfa
+# 功能 : 与 genHomoNFAfromRegex(regex_strings) 相同，但先查磁盘缓存，没有时才建立并存入缓存
+# 参数 : regex_strings : 正则表达式列表
+#        cache         : NFACache ，默认为 CACHE_DIR 下的缓存
+#        build         : 构造函数，默认为 genHomoNFAfromRegex ，它所在的文件必须在 COMPILER_FILES 中（否则改了它的代码，缓存不会失效）
+# 返回 : CompactNFA （已经算好 homo_tables ， get_NFA_homo_LUT 只需重建正反向转换查询表）
+def cached_homo_nfa(regex_strings, cache=None, build=genHomoNFAfromRegex):
+    assert os.path.basename(sys.modules[build.__module__].__file__) in COMPILER_FILES, 'source file of %s is not in COMPILER_FILES' % build.__name__
+    cache = get_default_cache() if cache is None else cache
+    key = get_rules_key(regex_strings, build.__name__)
+    nfa = cache.load(key)
+    if nfa is None:
+        nfa = build(regex_strings)
+        get_NFA_homo_LUT(nfa)                                           # 顺便算好 homo_tables ，一起存入缓存
+        cache.store(key, nfa)
+    return nfa
+
+
+
+
+# 主函数
+# 从命令行参数读入正则表达式文件，用缓存建立 homo-NFA ，报告耗时；第二次运行（规则和编译器都没有改动时）直接从缓存读出
+if __name__ == '__main__':
+
+    # 解析命令行参数
+    (REGEX_FNAME,), _ = argv_parse(['.re'])
+    if REGEX_FNAME == '' and 'clear' not in sys.argv[1:]:
+        print('Usage: python %s <输入正则表达式文件(.re)>' % sys.argv[0])
+        print('       python %s clear' % sys.argv[0])
+        exit(-1)
+
+    cache = get_default_cache()
+    if REGEX_FNAME == '':
+        cache.clear()
+        print('cleared %s' % cache.cache_dir)
+        exit(0)
+
+    # 读取文件，得到一行一行的 regex ，去重 ， 按 ASCII 编码排序
+    regex_strings = list( set( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) ) )
+    regex_strings.sort()
+    print('total %d regexs (after remove duplicate)\n' % len(regex_strings))
+
+    stime = time()
+    nfa = cached_homo_nfa(regex_strings, cache)
+    print('[%12d ms]   %s NFA  ' % (int(round((time()-stime)*1000)), 'load' if cache.hit > 0 else 'build'), nfa)
+    stime = time()
+    get_NFA_homo_LUT(nfa)
+    print('[%12d ms]   get_NFA_homo_LUT' % int(round((time()-stime)*1000)))
+    print('cache: %s' % cache.path(get_rules_key(regex_strings)))
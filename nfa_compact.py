@@ -0,0 +1,148 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 功能：NFA 的紧凑只读形式 CompactNFA
+# NFA 在建立和化简时要频繁增删边，所以用 dual_key_dict （两份 dict 套 dict）保存；建好之后不再修改，就转成 CompactNFA ：
+#     正向、反向邻接表都是 CSR 形式：状态 n 的出边是 fore_dst[fore_ptr[n]:fore_ptr[n+1]] ，入边是 back_src[back_ptr[n]:back_ptr[n+1]]
+#     边的字符集只保存编号 (cid) ，相同的字符集只保存一份 (csets[cid])
+#     接受号也是 CSR 形式：状态 n 的接受号是 acc_num[acc_ptr[n]:acc_ptr[n+1]]
+# 所有数组都是 array ，内存只有 dual_key_dict 的几十分之一，传给子进程 (pickle) 也快得多
+
+from array import array
+from graphviz import Digraph
+
+from utils import charset_bit1_to_str
+
+
+
+# 类 : CompactNFA
+# 功能 : 紧凑的只读 NFA ，状态号必须是 0 ~ N-1 （即 NFA.reorganize 之后）
+class CompactNFA():
+
+    __slots__ = ('n_stat', 'n_accept', 'csets', 'fore_ptr', 'fore_dst', 'fore_cid', 'back_ptr', 'back_src', 'back_cid', 'acc_ptr', 'acc_num', 'homo_tables')
+
+    # 构造函数
+    # 参数 : nfa : class NFA
+    def __init__(self, nfa):
+        stats = nfa.T.all_keya() | nfa.T.all_keyb() | nfa.A.all_keya()
+        self.n_stat = len(stats)
+        assert stats == set(range(self.n_stat)), 'NFA must be reorganized before freeze'
+        self.n_accept = nfa.n_accept
+
+        cids = dict()                                               # 字符集 → 编号
+        self.fore_ptr, self.fore_dst, self.fore_cid = self.build_csr(nfa.T.keya_dict, cids)
+        self.back_ptr, self.back_src, self.back_cid = self.build_csr(nfa.T.keyb_dict, cids)
+        self.csets = tuple(cids)
+
+        self.acc_ptr, self.acc_num = array('i', [0]), array('i')
+        for n in range(self.n_stat):
+            self.acc_num.extend(sorted(nfa.A.keya_dict(n)))
+            self.acc_ptr.append(len(self.acc_num))
+
+        self.homo_tables = None                                     # get_NFA_homo_LUT 算好的字符激活表等（见 nfa_homo_calculation.get_NFA_homo_tables）
+
+
+
+    # 功能 : 建立一个方向的 CSR 邻接表
+    # 参数 : adj_dict : NFA.T.keya_dict （正向）或 NFA.T.keyb_dict （反向）
+    #        cids     : 字符集 → 编号，新遇到的字符集在这里分配编号
+    # 返回 : ptr, adj, cid 三个 array
+    def build_csr(self, adj_dict, cids):
+        ptr, adj, cid = array('i', [0]), array('i'), array('i')
+        for n in range(self.n_stat):
+            for m, cset in sorted(adj_dict(n).items()):
+                adj.append(m)
+                cid.append(cids.setdefault(cset, len(cids)))
+            ptr.append(len(adj))
+        return ptr, adj, cid
+
+
+
+    # 功能 ： 所有状态号
+    def all_stats(self):
+        return range(self.n_stat)
+
+
+
+    # 功能 ： 状态 n 的出边
+    # 返回 ： 生成器，给出 (en, cset)
+    def out_edges(self, n):
+        csets, fore_dst, fore_cid = self.csets, self.fore_dst, self.fore_cid
+        for i in range(self.fore_ptr[n], self.fore_ptr[n+1]):
+            yield fore_dst[i], csets[fore_cid[i]]
+
+
+
+    # 功能 ： 状态 n 的入边
+    # 返回 ： 生成器，给出 (sn, cset)
+    def in_edges(self, n):
+        csets, back_src, back_cid = self.csets, self.back_src, self.back_cid
+        for i in range(self.back_ptr[n], self.back_ptr[n+1]):
+            yield back_src[i], csets[back_cid[i]]
+
+
+
+    # 功能 ： 状态 n 的接受号（负数）
+    def accepts(self, n):
+        return self.acc_num[self.acc_ptr[n]:self.acc_ptr[n+1]]
+
+
+
+    # 功能 ： 所有转换边
+    # 返回 ： [(sn, en, cset), ...]
+    def tolist(self):
+        return [ (sn, en, cset)  for sn in range(self.n_stat)  for en, cset in self.out_edges(sn) ]
+
+
+
+    # 功能：判断是不是 homo NFA （每个状态的所有入边的字符集都相同）
+    def is_homo_nfa(self):
+        back_ptr, back_cid = self.back_ptr, self.back_cid
+        for n in range(self.n_stat):
+            cid = back_cid[back_ptr[n]:back_ptr[n+1]]
+            if len(cid) > 1 and cid.count(cid[0]) != len(cid):
+                return False
+        return True
+
+
+
+    # 返回  ： 字符串形式的对象，一般用于打印
+    def __str__(self):
+        return '<NFA: %d rules, %d stats, %d trans, homo=%s>' % (-self.n_accept, self.n_stat, len(self.fore_dst), str(self.is_homo_nfa()))
+
+
+
+    # 返回  ： NFA 的可视化图 (Digraph 类的对象)
+    def get_digraph(self):
+        digraph = Digraph()
+        digraph.attr('node', style='filled', color='lightblue2', shape='circle')
+
+        digraph.node(str(0), color='red', shape='circle')                          # 起始状态标为红色
+
+        for sn, en, cset in self.tolist():
+            digraph.edge(str(sn), str(en), charset_bit1_to_str(cset).replace('\\','\\\\') )
+
+        for sn in range(self.n_stat):
+            for en in self.accepts(sn):
+                digraph.edge(str(sn), str(en), '')
+                digraph.node(str(en), color='green', shape='doublecircle')         # 接受状态标为绿色
+
+        return digraph
+
+
+
+    # 功能： 自检，包含一些 assert ，为了检查转换是否可能写错
+    def self_check(self):
+        N = self.n_stat
+        assert len(self.fore_ptr) == len(self.back_ptr) == len(self.acc_ptr) == N + 1
+        assert len(self.fore_dst) == len(self.back_src), 'forward and backward edges differ'
+        assert sorted(self.tolist()) == sorted( (sn, en, cset)  for en in range(N)  for sn, cset in self.in_edges(en) ), 'forward and backward edges differ'
+        assert set(self.acc_num) == set(range(self.n_accept, 0)), 'some accept number is deleted'
+
+        for cset in self.csets:
+            assert type(cset) == int and cset != 0                                  # 所有边都不能是空字符集
+
+        # 检查状态
+        for n in range(N):
+            assert self.fore_ptr[n+1] > self.fore_ptr[n] or self.acc_ptr[n+1] > self.acc_ptr[n], 'there exist islands in NFA!'   # n 必须有出边或是接受状态
+            assert self.back_ptr[n+1] > self.back_ptr[n], 'there exist islands in NFA!'                                          # n 必须有入边
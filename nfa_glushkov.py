@@ -0,0 +1,163 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 功能：用 Glushkov 构造法（位置自动机）直接从语法树建立 homo-NFA
+# 语法树中每个字符集的每次出现（计数约束展开后）是一个"位置"，每个位置就是一个 NFA 状态，到达它的边的字符集就是它自己的字符集，
+# 所以得到的 NFA 天然是 homo-NFA ，不需要 ε 边，也不需要 to_homo_nfa 拆分状态
+# 对每个子表达式求三样东西：
+#     first    : 匹配它时第一个读入的位置的集合
+#     last     : 匹配它时最后一个读入的位置的集合
+#     nullable : 它能否匹配空串
+# 连接 A·B 时，last(A) 中每个位置到 first(B) 中每个位置连一条边；重复 (+, *) 时， last 中每个位置到 first 中每个位置连一条边
+
+import os
+import sys
+from time import time
+from random import Random
+
+from nfa import NFA, genHomoNFAfromRegex
+from regex_tree import build_syntax_tree
+
+
+
+# 类 : GlushkovBuilder
+# 功能 : 把语法树的位置逐个加入 NFA ，并连接 follow 边
+class GlushkovBuilder():
+
+    def __init__(self, nfa):
+        self.nfa = nfa
+        self.n = max(nfa.all_stats())          # 已经用掉的状态号
+        self.cset = dict()                     # 位置（状态号） → 它的字符集
+
+
+
+    # 功能 : 从 last 中每个位置到 first 中每个位置连边，边的字符集是目的位置的字符集
+    def link(self, last, first):
+        for q in last:
+            for p in first:
+                self.nfa.addT(q, p, self.cset[p])
+
+
+
+    # 功能 : 建立节点内容（不计量语）的一份新拷贝
+    # 返回 : (first, last, nullable)
+    def unit(self, node):
+        if node.is_charset():
+            self.n += 1
+            self.cset[self.n] = node.content
+            return {self.n}, {self.n}, False
+        first, last, nullable = set(), set(), False
+        for sub in node.content:
+            sub_first, sub_last, sub_nullable = self.chain(sub)
+            first |= sub_first
+            last |= sub_last
+            nullable = nullable or sub_nullable
+        return first, last, nullable
+
+
+
+    # 功能 : 连接 A·B
+    def concat(self, a, b):
+        a_first, a_last, a_nullable = a
+        b_first, b_last, b_nullable = b
+        self.link(a_last, b_first)
+        first = a_first | b_first if a_nullable else a_first
+        last = a_last | b_last if b_nullable else b_last
+        return first, last, a_nullable and b_nullable
+
+
+
+    # 功能 : 建立带量语的节点：x{m,n} 展开成 m 份 x 和嵌套的 n-m 份可选的 x ，即 (x(x(x)?)?)? ， x{m,} 展开成 m-1 份 x 和一份 x+ （m=0 时为 x*）
+    # 可选部分按嵌套方式连接，每一份只连到下一份，边数与 n-m 成线性关系（若按 x?x?x? 连接则是平方关系）
+    def repeat(self, node):
+        mn, mx = node.minmax
+        result = (set(), set(), True)                                  # 空串
+        for _ in range(mn - 1 if mx < 0 and mn > 0 else mn):
+            result = self.concat(result, self.unit(node))
+        if mx < 0:
+            first, last, nullable = self.unit(node)
+            self.link(last, first)                                     # 自环： x+
+            result = self.concat(result, (first, last, nullable or mn == 0))
+        elif mx > mn:
+            first, last, _ = self.unit(node)
+            prev_last, all_last = last, set(last)
+            for _ in range(mx - mn - 1):
+                sub_first, sub_last, _ = self.unit(node)
+                self.link(prev_last, sub_first)
+                prev_last = sub_last
+                all_last |= sub_last
+            result = self.concat(result, (first, all_last, True))
+        return result
+
+
+
+    # 功能 : 建立以 node 开头的语法链
+    # 返回 : (first, last, nullable)
+    def chain(self, node):
+        result = (set(), set(), True)
+        while node is not None:
+            result = self.concat(result, self.repeat(node))
+            node = node.next
+        return result
+
+
+
+    # 功能 : 加入一个正则表达式，接受号为 accept
+    def add_regex(self, regex, accept):
+        first, last, nullable = self.chain(build_syntax_tree(regex))
+        self.link({0}, first)
+        for p in last:
+            self.nfa.A[(p, accept)] = 'ε'
+        if nullable:
+            self.nfa.A[(0, accept)] = 'ε'
+
+
+
+# 函数 : genHomoNFAbyGlushkov
+# 功能 : 用 Glushkov 构造法生成 homo-NFA （CompactNFA），接受号、状态编号方式与 genHomoNFAfromRegex 相同（第 k 个正则表达式的接受号为 -(k+1)）
+# 参数 : regexs   : 正则表达式列表
+#        simplify : 是否用 NFA.simplify 合并等价的状态（合并相同前缀/后缀，状态数与 genHomoNFAfromRegex 的结果相近）
+def genHomoNFAbyGlushkov(regexs, simplify=True):
+    nfa = NFA([])
+    builder = GlushkovBuilder(nfa)
+    for regex in regexs:
+        nfa.n_accept -= 1
+        builder.add_regex(regex, nfa.n_accept)
+    if simplify:
+        nfa.simplify()
+    nfa.reorganize()
+    nfa = nfa.freeze()
+    nfa.self_check()
+    return nfa
+
+
+
+
+# 主函数
+# 对每个正则表达式文件（不给出时为 rules/ 下的所有文件），比较 genHomoNFAfromRegex 和 Glushkov 构造法的耗时和规模，
+# 并在一段随机数据上检查两个 NFA 的扫描结果是否相同
+if __name__ == '__main__':
+
+    from nfa_homo_match import NFAHomoMatcher
+
+    # 解析命令行参数
+    REGEX_FNAMES = [argv for argv in sys.argv[1:] if argv.endswith('.re')]
+    if len(REGEX_FNAMES) == 0:
+        REGEX_FNAMES = sorted( os.path.join('rules', fname) for fname in os.listdir('rules') if fname.endswith('.re') )
+    data = Random(0).randbytes(1<<16)
+
+    for REGEX_FNAME in REGEX_FNAMES:
+        # 读取文件，得到一行一行的 regex ，去重 ， 按 ASCII 编码排序
+        regex_strings = list( set( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) ) )
+        regex_strings.sort()
+        print('-------- %s : %d regexs --------' % (REGEX_FNAME, len(regex_strings)))
+
+        results = []
+        for name, build in (('epsilon-NFA', genHomoNFAfromRegex),
+                            ('Glushkov', genHomoNFAbyGlushkov),
+                            ('Glushkov(raw)', lambda regexs: genHomoNFAbyGlushkov(regexs, simplify=False))):
+            stime = time()
+            nfa = build(regex_strings)
+            print('[%12d ms]   %-14s' % (int(round((time()-stime)*1000)), name), nfa)
+            results.append(NFAHomoMatcher(nfa).scan(data))
+        print('same hits on %d random bytes: %s\n' % (len(data), results[0] == results[1] == results[2]))
@@ -8,14 +8,61 @@
 # 则 NFA 的相关计算可以快速用查找表和位运算来实现
 
 
+import re
+
 from utils import CHARSET_SIZE
 from nfa import NFA
 
 
 
+# 函数: get_char_class
+# 功能: 字母表压缩：用 NFA 所有转换边的字符集把字符划分成等价类（字符类），
+#       同一类的字符属于完全相同的那些字符集，所以它们在 NFA 和由它生成的 DFA 中的转换完全相同
+#       一般的规则集只区分几十个字符类，子集构造、DFA 转换表、扫描引擎都可以只处理字符类，而不是全部 CHARSET_SIZE 个字符
+# 参数:
+#     nfa: CompactNFA 或 class NFA （不要求是 homo-NFA）
+# 返回:
+#     n_class   : 字符类数
+#     char_class: char_class[c] = 字符 c 所属的字符类号，按字符首次出现的顺序编号
+def get_char_class(nfa):
+    csets = set(compact_nfa(nfa).csets)
+    sig = [0] * CHARSET_SIZE                # sig[c] 的第 i 个bit=1 代表字符 c 属于第 i 个字符集
+    for i, cset in enumerate(csets):
+        while cset != 0:
+            low = cset & -cset
+            sig[low.bit_length()-1] |= (1<<i)
+            cset ^= low
+    class_of = dict()
+    char_class = []
+    for v in sig:
+        if v not in class_of:
+            class_of[v] = len(class_of)
+        char_class.append(class_of[v])
+    return len(class_of), char_class
+
+
+
+# 函数: get_class_mask
+# 功能: 把字符激活查询表 NFAhomo_char_mask 按字符类压缩
+# 返回: class_mask[k] = 字符类 k 会到达的状态的集合
+def get_class_mask(NFAhomo_char_mask, n_class, char_class):
+    class_mask = [0] * n_class
+    for c, k in enumerate(char_class):
+        class_mask[k] = NFAhomo_char_mask[c]
+    return class_mask
+
+
+
+# 函数: compact_nfa
+# 功能: 下面的函数都在 CompactNFA 上运行，传入的若是（已经 reorganize 的） class NFA ，先转换
+def compact_nfa(nfa):
+    return nfa.freeze() if isinstance(nfa, NFA) else nfa
+
+
+
 # 生成 homo-NFA 的快速查询表：
 # 参数：
-#     nfa: 必须是 class NFA
+#     nfa: 必须是 homo-NFA （CompactNFA 或 class NFA）
 # 返回：
 #     NFA_N: NFA 状态数
 #     NFAhomo_fore_net : 正向转换查询表，NFAhomo_fore_net[n] = 状态n的下一个状态的集合
@@ -23,68 +70,168 @@ from nfa import NFA
 #     NFAhomo_char_mask: 字符激活查询表，NFAhomo_char_mask[c]= 字符c会到达的状态的集合 ，注意：homo-NFA 的任意状态的所有入边都有相同的字符集，即对于 n1, n2 ，若 δ(n1,c1)=δ(n2,c2) , 则 c1=c2
 #     NFAhomo_csets    : 
 #     NFAhomo_accept_net:
+# 说明：
+#     后三个表（见 get_NFA_homo_tables）算好后保存在 nfa.homo_tables 中，同一个 nfa 再次调用时直接使用，也随 nfa 一起存进 nfa_cache 的磁盘缓存
+#     正反向转换查询表是很大的整数（状态数的平方/8 字节量级），不保存，每次从 CSR 邻接表重建
 def get_NFA_homo_LUT(nfa):
+    nfa = compact_nfa(nfa)
     assert nfa.is_homo_nfa()                # 必须是 homo-NFA 才能执行该算法
     
-    NFA_N = len(nfa.all_stats())            # NFA 状态数
+    NFA_N = nfa.n_stat                      # NFA 状态数
     
     NFAhomo_fore_net = [0] * NFA_N
     NFAhomo_back_net = [0] * NFA_N
-    for sn in nfa.T.all_keya():
-        for en in nfa.T.keya_dict(sn):
+    for sn in range(NFA_N):
+        for en in nfa.fore_dst[nfa.fore_ptr[sn]:nfa.fore_ptr[sn+1]]:
             NFAhomo_fore_net[sn] |= (1<<en)
             NFAhomo_back_net[en] |= (1<<sn)
     
+    if nfa.homo_tables is None:
+        nfa.homo_tables = get_NFA_homo_tables(nfa)
+    NFAhomo_char_mask, NFAhomo_csets, NFAhomo_accept_net = nfa.homo_tables
+    
+    return NFA_N, NFAhomo_fore_net, NFAhomo_back_net, NFAhomo_char_mask, NFAhomo_csets, NFAhomo_accept_net
+
+
+
+# 函数: get_NFA_homo_tables
+# 功能: 计算 get_NFA_homo_LUT 中与转换查询表无关的三个表
+# 参数: nfa: 必须是 homo-NFA (CompactNFA)
+# 返回: NFAhomo_char_mask, NFAhomo_csets, NFAhomo_accept_net
+def get_NFA_homo_tables(nfa):
+    NFA_N = nfa.n_stat
+    
     NFAhomo_accept_net = [0] * NFA_N
-    for sn in nfa.A.all_keya():
-        for en in nfa.A.keya_dict(sn):
+    for sn in range(NFA_N):
+        for en in nfa.accepts(sn):
             NFAhomo_accept_net[sn] |= (1<<(-en))
     
-    NFAhomo_char_mask = [0] * CHARSET_SIZE
     NFAhomo_csets = [0] * NFA_N
-    for en in nfa.T.all_keyb():
-        for _, cset in nfa.T.keyb_dict(en).items():
+    cset_stats = dict()                     # 字符集 → 入边字符集为它的状态的集合
+    for en in range(NFA_N):
+        if nfa.back_ptr[en+1] > nfa.back_ptr[en]:
+            cset = nfa.csets[nfa.back_cid[nfa.back_ptr[en]]]
             NFAhomo_csets[en] = cset
-            for ci in range(CHARSET_SIZE):
-                if cset & (1<<ci):
-                    NFAhomo_char_mask[ci] |= (1<<en)
-            break
+            cset_stats[cset] = cset_stats.get(cset, 0) | (1<<en)
     
-    return NFA_N, NFAhomo_fore_net, NFAhomo_back_net, NFAhomo_char_mask, NFAhomo_csets, NFAhomo_accept_net
+    # 按字符类计算字符激活查询表，同一类的字符的查询结果相同，所以每个字符集只要查每个字符类的代表字符
+    n_class, char_class = get_char_class(nfa)
+    class_first = [-1] * n_class
+    for c, k in enumerate(char_class):
+        if class_first[k] < 0:
+            class_first[k] = c
+    class_mask = [0] * n_class
+    for cset, smask in cset_stats.items():
+        for k, c in enumerate(class_first):
+            if cset & (1<<c):
+                class_mask[k] |= smask
+    NFAhomo_char_mask = [ class_mask[k] for k in char_class ]
+    
+    return NFAhomo_char_mask, NFAhomo_csets, NFAhomo_accept_net
 
 
 
 
 # 函数: get_NFA_homo_accpet_mask
 def get_NFA_homo_accpet_mask(nfa):
+    nfa = compact_nfa(nfa)
     NFAhomo_accept_mask = 0
-    for sn in nfa.A.all_keya():
-        NFAhomo_accept_mask |= (1<<sn)
+    for sn in range(nfa.n_stat):
+        if nfa.acc_ptr[sn+1] > nfa.acc_ptr[sn]:
+            NFAhomo_accept_mask |= (1<<sn)
     return NFAhomo_accept_mask
 
 
 
+# 函数: get_accept_rules
+# 功能: 给出 NFA 子集 nset 中所有接受状态对应的 rule_id （rule_id 是正则表达式在建立 NFA 时的 regex 列表中的下标，从0开始）
+# 返回: rule_id 的元组（升序）
+def get_accept_rules(nset, NFAhomo_accept_net):
+    rmask = 0
+    while nset != 0:
+        low = nset & -nset
+        rmask |= NFAhomo_accept_net[low.bit_length()-1]
+        nset ^= low
+    rules = []
+    while rmask != 0:
+        low = rmask & -rmask
+        rules.append(low.bit_length()-2)            # 接受号 -1, -2, ... 对应 bit 1, 2, ... ，对应 rule_id 0, 1, ...
+        rmask ^= low
+    return tuple(rules)
+
+
+
 # 计算 NFA 子集 nset 的单步传递，
 # 当 NFAhomo_net 是 NFAhomo_fore_net 时，返回一个 NFA 状态集的"下一个"子集
 # 当 NFAhomo_net 是 NFAhomo_back_net 时，返回一个 NFA 状态集的"上一个"子集
+# 只遍历 bit=1 的状态，代价与激活的状态数成正比
 def get_next_mask(nset, NFAhomo_net):
     s_next_mask = 0
-    n = 0
     while nset != 0:
-        if (nset & 1):
-            s_next_mask |= NFAhomo_net[n]
-        nset >>= 1
-        n += 1
+        low = nset & -nset
+        s_next_mask |= NFAhomo_net[low.bit_length()-1]
+        nset ^= low
+    return s_next_mask
+
+
+
+STRIDE_BITS = 8                             # 分块查询表默认每块的 bit 数
+
+_NONZERO_BYTE = re.compile(b'[^\x00]')
+
+
+
+# 生成 get_next_mask 的分块查询表 (stride net)：
+# 把 NFA 子集按每 k 个bit 分成一块，对每块的每种取值 v ，保存这块中 bit=1 的状态的 NFAhomo_net 的并集
+# 这样单步传递只需对每个非零块查一次表，而不是对每个 bit=1 的状态做一次按位或
+# 查询表是按需填写的（第一次遇到某块的某种取值时才计算），所以内存只与实际遇到的取值数成正比
+# 参数：
+#     NFAhomo_net: NFAhomo_fore_net 或 NFAhomo_back_net
+#     k          : 每块的 bit 数，必须是 1, 2, 4, 8 之一
+# 返回：
+#     stride_net : 供 get_next_mask_stride 使用
+def get_stride_net(NFAhomo_net, k=STRIDE_BITS):
+    assert k in (1, 2, 4, 8)
+    return (k, NFAhomo_net, [None] * ((len(NFAhomo_net) + k - 1) // k))
+
+
+
+# 用分块查询表计算 NFA 子集 nset 的单步传递，结果与 get_next_mask(nset, NFAhomo_net) 相同
+# 全零的字节在 C 层面被跳过，所以只有少数状态激活时（稀疏集合）也很快
+def get_next_mask_stride(nset, stride_net):
+    k, NFAhomo_net, tables = stride_net
+    per_byte = 8 // k
+    kmask = (1 << k) - 1
+    s_next_mask = 0
+    nbytes = nset.to_bytes((nset.bit_length() + 7) // 8, 'little')
+    for match in _NONZERO_BYTE.finditer(nbytes):
+        j = match.start()
+        v = nbytes[j]
+        for i in range(per_byte):
+            u = (v >> (i*k)) & kmask
+            if u == 0:
+                continue
+            chunk = j * per_byte + i
+            table = tables[chunk]
+            if table is None:
+                table = tables[chunk] = dict()
+            t = table.get(u)
+            if t is None:
+                t = get_next_mask(u << (chunk*k), NFAhomo_net)
+                table[u] = t
+            s_next_mask |= t
     return s_next_mask
 
 
 
 # 得到一个 NFA 子集 nset 的封闭集：不断把 nset 的上一个、上上一个、上上上一个…… 的 NFA 状态加入 nset ，直到没有更多的状态加入为止，也就是让 nset 变得封闭，只有出边，没有入边
+# 每一轮只展开上一轮新加入的状态
 def get_close_by_expand(nset, NFAhomo_back_net):
-    nset_old = 0
-    while nset != nset_old:
-        nset_old = nset
-        nset |= get_next_mask(nset_old, NFAhomo_back_net)
+    stride_net = get_stride_net(NFAhomo_back_net)
+    nset_new = nset
+    while nset_new != 0:
+        nset_new = get_next_mask_stride(nset_new, stride_net) & ~nset
+        nset |= nset_new
     return nset
 
 
@@ -97,3 +244,42 @@ def is_close(nset, NFAhomo_back_net):
 
 
 
+
+
+
+# 函数: get_max_match_len
+# 功能: 求 homo-NFA 一次匹配最多读入多少个字符：从起始状态 0 出发（不算 0 号状态的自环）的最长路径的长度
+#       若起始状态能到达的部分有环（例如 .* 、 a+ ），匹配长度没有上限
+# 参数:
+#     NFAhomo_fore_net: 正向转换查询表
+# 返回:
+#     最长匹配长度（边界符也算一个字符），没有上限时返回 -1
+def get_max_match_len(NFAhomo_fore_net):
+    NFA_N = len(NFAhomo_fore_net)
+    def bits(nset):
+        while nset != 0:
+            low = nset & -nset
+            yield low.bit_length()-1
+            nset ^= low
+
+    reach = get_close_by_expand(NFAhomo_fore_net[0] & ~1, NFAhomo_fore_net) & ~1     # 起始状态能到达的状态（不含 0）
+    indeg = [0] * NFA_N
+    for n in bits(reach):
+        for m in bits(NFAhomo_fore_net[n] & ~1):
+            indeg[m] += 1
+
+    # 按拓扑顺序求最长路径，有状态处理不到说明有环
+    dist = [1] * NFA_N
+    todo = [ n for n in bits(reach) if indeg[n] == 0 ]
+    n_done = 0
+    while todo:
+        n = todo.pop()
+        n_done += 1
+        for m in bits(NFAhomo_fore_net[n] & ~1):
+            dist[m] = max(dist[m], dist[n] + 1)
+            indeg[m] -= 1
+            if indeg[m] == 0:
+                todo.append(m)
+    if n_done < bin(reach).count('1'):
+        return -1
+    return max( (dist[n] for n in bits(reach)), default=0 )
@@ -0,0 +1,174 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 本代码文件提供 homo-NFA 的多通道 (multi-lane) 批量匹配引擎，依赖 NumPy
+# 同时模拟 L 条相互独立的输入流（例如 L 个短报文），它们以锁步方式推进：每一步每条流各读入一个字符
+# 激活状态集不再是 Python 大整数，而是 uint64 字数组：
+#     S[l, w] 是第 l 条流的激活状态集的第 w 个 64-bit 字（第 n 号状态在第 n//64 个字的第 n%64 个bit）
+# NFAhomo_fore_net 和 NFAhomo_char_mask（按字符类压缩）也被打包成同样格式的字矩阵，单步转换对所有流向量化地进行
+
+import os
+import sys
+from time import time
+
+import numpy as np
+
+from argv_parse import argv_parse
+from nfa import genHomoNFAfromRegex
+from nfa_homo_calculation import get_char_class, get_class_mask
+from nfa_homo_match import NFAHomoMatcher, CHAR_BORDER
+
+
+
+# 函数 : pack_masks_to_words
+# 功能 : 把若干个用整数表示的 NFA 子集打包成 uint64 字矩阵
+# 参数 : masks : 整数列表
+#        W     : 每个子集打包成的字数
+# 返回 : shape=(len(masks), W) 的 np.uint64 矩阵
+def pack_masks_to_words(masks, W):
+    buf = b''.join( mask.to_bytes(W*8, 'little') for mask in masks )
+    return np.frombuffer(buf, dtype='<u8').astype(np.uint64).reshape(len(masks), W)
+
+
+
+# 函数 : unpack_words_to_mask
+# 功能 : 把一行 uint64 字数组还原成用整数表示的 NFA 子集
+def unpack_words_to_mask(words):
+    return int.from_bytes(words.astype('<u8').tobytes(), 'little')
+
+
+
+# 类 : NFAHomoLanes
+# 功能 : homo-NFA 的多通道批量匹配引擎，扫描结果与 NFAHomoMatcher.scan 对每条流逐一扫描的结果相同
+class NFAHomoLanes():
+
+    # 构造函数
+    # 参数 : nfa      : 必须是 homo-NFA (class NFA)
+    #        lane_max : 每批最多同时模拟多少条流
+    def __init__(self, nfa, lane_max=4096):
+        self.matcher = NFAHomoMatcher(nfa)                      # 借用它的查询表，以及命中时 接受状态集→rule_id 的解码
+        self.NFA_N = self.matcher.NFA_N
+        self.W = (self.NFA_N + 63) // 64                        # 每个子集占用的 64-bit 字数
+        self.lane_max = lane_max
+
+        # 字符按字符类压缩，另加一个不激活任何状态的填充类：短于本批最长流的流，末尾用它填充
+        self.n_class, char_class = get_char_class(nfa)
+        self.char_class = np.array(char_class, dtype=np.intp)
+        self.class_pad = self.n_class
+        class_mask = get_class_mask(self.matcher.NFAhomo_char_mask, self.n_class, char_class)
+
+        self.fore_words   = pack_masks_to_words(self.matcher.NFAhomo_fore_net, self.W)                  # shape=(NFA_N, W)
+        self.class_words  = pack_masks_to_words(class_mask + [0], self.W)                               # shape=(n_class+1, W) ，最后一行对应填充类
+        self.accept_words = pack_masks_to_words([self.matcher.accept_mask], self.W)[0]                  # shape=(W,)
+        self.init_words   = pack_masks_to_words([self.matcher.init_state()], self.W)[0]                 # shape=(W,)
+
+        self.bit_shift = np.arange(64, dtype=np.uint64)
+        self.hash_words = np.random.default_rng(0).integers(1, 1<<63, size=self.W, dtype=np.uint64) | np.uint64(1)
+
+
+
+    # 功能 : 一组激活状态集 S 的"下一个"子集（只遍历非零的字和其中 bit=1 的状态）
+    # 参数 : S : shape=(L, W) 的 uint64 矩阵
+    # 返回 : shape=(L, W) 的 uint64 矩阵
+    def next_words_sparse(self, S):
+        lane_idx, word_idx = np.nonzero(S)                                                   # 非零的字，按流号升序
+        bits = (S[lane_idx, word_idx][:, None] >> self.bit_shift) & np.uint64(1)             # 展开成 bit
+        pair_idx, bit_idx = np.nonzero(bits)
+        lane_idx = lane_idx[pair_idx]
+        state_idx = word_idx[pair_idx] * 64 + bit_idx                                        # 激活的 (流号, 状态号) ，仍按流号升序
+        T = np.zeros_like(S)
+        if len(lane_idx) > 0:
+            starts = np.flatnonzero( np.concatenate(([True], lane_idx[1:] != lane_idx[:-1])) )
+            T[lane_idx[starts]] = np.bitwise_or.reduceat(self.fore_words[state_idx], starts, axis=0)
+        return T
+
+
+
+    # 功能 : 所有流的激活状态集 S 的"下一个"子集
+    #        各条流的激活状态集大多相同（通常只有起始状态和少数几个状态激活），
+    #        所以先按行哈希去重，只对互不相同的激活状态集做单步转换，再散回各条流
+    # 参数 : S : shape=(L, W) 的 uint64 矩阵
+    # 返回 : shape=(L, W) 的 uint64 矩阵
+    def next_words(self, S):
+        h = (S * self.hash_words).sum(axis=1)                                                # 行哈希（uint64 乘加，自然溢出回绕）
+        _, first, inverse = np.unique(h, return_index=True, return_inverse=True)
+        U = S[first]
+        if not np.array_equal(U[inverse], S):                                                # 哈希冲突（极少见），不去重
+            return self.next_words_sparse(S)
+        return self.next_words_sparse(U)[inverse]
+
+
+
+    # 功能 : 扫描一批流（锁步），流的条数不超过 lane_max
+    # 返回 : 每条流的命中列表
+    def scan_batch(self, datas):
+        L = len(datas)
+        lengths = [len(data) for data in datas]
+        steps = max(lengths) + 2                                                 # 开头和结尾各有一个边界符
+
+        class_border = self.char_class[CHAR_BORDER]
+        syms = np.full((L, steps), self.class_pad, dtype=np.intp)                # 每条流每一步读入的字符类
+        for l, data in enumerate(datas):
+            syms[l, 0] = class_border
+            syms[l, 1:lengths[l]+1] = self.char_class[np.frombuffer(data, dtype=np.uint8)]
+            syms[l, lengths[l]+1] = class_border
+
+        hits = [[] for _ in range(L)]
+        S = np.tile(self.init_words, (L, 1))
+        for t in range(steps):
+            S = self.next_words(S) & self.class_words[syms[:, t]]
+            for l in np.flatnonzero( (S & self.accept_words).any(axis=1) ):
+                offset = min(t, lengths[l])
+                for rule_id in self.matcher.accept_rules(unpack_words_to_mask(S[l])):
+                    hits[l].append((offset, rule_id))
+        return hits
+
+
+
+    # 功能 : 扫描任意多条流，每条流开头和结尾各有一个边界符
+    #        流按长度排序后每 lane_max 条一批，减少锁步中填充的浪费
+    # 参数 : datas : bytes 列表
+    # 返回 : 每条流的命中列表 [(offset, rule_id), ...] ，顺序与 datas 一致
+    def scan(self, datas):
+        order = sorted(range(len(datas)), key=lambda i:len(datas[i]))
+        hits = [None] * len(datas)
+        for bi in range(0, len(order), self.lane_max):
+            batch = order[bi:bi+self.lane_max]
+            for i, batch_hits in zip(batch, self.scan_batch([datas[i] for i in batch])):
+                hits[i] = batch_hits
+        return hits
+
+
+
+
+
+# 主函数
+# 从命令行参数读入正则表达式文件和数据文件，把数据文件切成等长的报文，批量扫描，报告命中数和总吞吐率
+if __name__ == '__main__':
+
+    # 解析命令行参数
+    (REGEX_FNAME,), ARGV_NUMS = argv_parse(['.re'])
+    DATA_FNAMES = [argv for argv in sys.argv[1:] if argv != REGEX_FNAME and os.path.isfile(argv)]
+    if REGEX_FNAME == '' or len(DATA_FNAMES) != 1 or len(ARGV_NUMS) > 2:
+        print('Usage: python %s <输入正则表达式文件(.re)> <待扫描数据文件> [报文长度(默认1500)] [每批流数(默认4096)]' % sys.argv[0])
+        exit(-1)
+    PACKET_SIZE = int(ARGV_NUMS[0]) if len(ARGV_NUMS) > 0 else 1500
+    LANE_MAX    = int(ARGV_NUMS[1]) if len(ARGV_NUMS) > 1 else 4096
+
+    # 读取文件，得到一行一行的 regex ，去重 ， 按 ASCII 编码排序
+    regex_strings = list( set( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) ) )
+    regex_strings.sort()
+    print('total %d regexs (after remove duplicate)\n' % len(regex_strings))
+
+    # 建立 homo-NFA 和多通道匹配引擎
+    stime = time()
+    lanes = NFAHomoLanes(genHomoNFAfromRegex(regex_strings), LANE_MAX)
+    print('[%12d ms]   build lanes  NFA#S=%d  words=%d' % (int(round((time()-stime)*1000)), lanes.NFA_N, lanes.W) )
+
+    # 切成报文，批量扫描
+    data = open(DATA_FNAMES[0], 'rb').read()
+    packets = [data[i:i+PACKET_SIZE] for i in range(0, len(data), PACKET_SIZE)]
+    stime = time()
+    hits = lanes.scan(packets)
+    dtime = time() - stime
+    print('[%12d ms]   %d packets  %d bytes  %d hits  %.3f MB/s' % (int(round(dtime*1000)), len(packets), len(data), sum(map(len, hits)), len(data)/max(dtime,1e-9)/1e6) )
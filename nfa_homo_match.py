@@ -0,0 +1,181 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 本代码文件提供基于 homo-NFA 快速查询表的位并行匹配引擎
+# 用一个整数表示 NFA 的激活状态集（与 nfa_homo_calculation 一致：第 n 个 bit=1 代表 n 号状态激活）
+# 每读入一个字符 c ，激活状态集的单步转换为：
+#     s_next = get_next_mask(s, NFAhomo_fore_net) & NFAhomo_char_mask[c]
+# 输入流的开头和结尾各送入一个边界符 (＾) ，对应正则表达式中的 ^ 和 $
+
+import os
+import sys
+from time import time
+
+from utils import CHARSET_SIZE
+from nfa import genHomoNFAfromRegex
+from nfa_homo_calculation import get_NFA_homo_LUT, get_stride_net, get_next_mask_stride, get_accept_rules
+
+
+CHAR_BORDER = CHARSET_SIZE - 1                 # 边界符 (＾) 的字符号
+SCAN_CHUNK_SIZE = 1 << 20                      # 扫描文件时每次读入的字节数
+
+
+
+# 类 : NFAHomoMatcher
+# 功能 : homo-NFA 的位并行匹配引擎，扫描 bytes 或文件，报告命中 (offset, rule_id)
+#          offset : 匹配的结束位置（不含），即匹配到该位置为止已读入的字节数
+#          rule_id: 命中的正则表达式编号，即它在建立 NFA 时的 regex 列表中的下标（从0开始）
+#        激活状态集 s 的"下一个"子集 get_next_mask(s) 会被缓存起来（缓存满了就清空），
+#        因为实际流量中激活状态集的种类很少，这样大多数字符只需要一次查表和一次按位与
+class NFAHomoMatcher():
+
+    # 构造函数
+    # 参数 : nfa      : 必须是 homo-NFA (class NFA)
+    #        memo_max : 最多缓存多少个激活状态集的"下一个"子集
+    def __init__(self, nfa, memo_max=4096):
+        self.NFA_N, self.NFAhomo_fore_net, _, self.NFAhomo_char_mask, _, self.NFAhomo_accept_net = get_NFA_homo_LUT(nfa)
+        self.fore_stride = get_stride_net(self.NFAhomo_fore_net)
+
+        self.accept_mask = 0                                     # 所有接受状态的集合
+        for n, accept in enumerate(self.NFAhomo_accept_net):
+            if accept:
+                self.accept_mask |= (1<<n)
+
+        self.memo_max = memo_max
+        self.memo = dict()                                       # 缓存: 激活状态集 s → s 的"下一个"子集
+        self.accept_memo = dict()                                # 缓存: 激活的接受状态集 → 命中的 rule_id 元组
+
+
+
+    # 功能 : 初始的激活状态集（只有起始状态 0 激活）
+    def init_state(self):
+        return 1
+
+
+
+    # 功能 : 计算激活状态集 s 的"下一个"子集（带缓存）
+    def next_mask(self, s):
+        t = self.memo.get(s)
+        if t is None:
+            t = get_next_mask_stride(s, self.fore_stride)
+            if len(self.memo) >= self.memo_max:
+                self.memo.clear()
+            self.memo[s] = t
+        return t
+
+
+
+    # 功能 : 激活状态集 s 读入一个字符 c（0~255 为字节，CHAR_BORDER 为边界符）后的激活状态集
+    def step(self, s, c):
+        return self.next_mask(s) & self.NFAhomo_char_mask[c]
+
+
+
+    # 功能 : 给出激活状态集 s 中所有接受状态对应的 rule_id
+    # 返回 : rule_id 的元组（升序）
+    def accept_rules(self, s):
+        amask = s & self.accept_mask
+        rules = self.accept_memo.get(amask)
+        if rules is None:
+            rules = get_accept_rules(amask, self.NFAhomo_accept_net)
+            if len(self.accept_memo) >= self.memo_max:
+                self.accept_memo.clear()
+            self.accept_memo[amask] = rules
+        return rules
+
+
+
+    # 功能 : 从激活状态集 s 开始扫描一段字节 data ，data[0] 的全局位置为 base
+    # 参数 : hits      : 命中结果追加到这个列表里，每项为 (offset, rule_id)
+    #        char_mask : 代替 NFAhomo_char_mask 的字符激活查询表（例如只保留部分 rule 的状态），默认为 NFAhomo_char_mask
+    # 返回 : 扫描完 data 后的激活状态集
+    def scan_chunk(self, s, data, base, hits, char_mask=None):
+        memo = self.memo
+        NFAhomo_char_mask = self.NFAhomo_char_mask if char_mask is None else char_mask
+        accept_mask = self.accept_mask
+        for offset, c in enumerate(data, base+1):
+            t = memo.get(s)
+            if t is None:
+                t = self.next_mask(s)
+            s = t & NFAhomo_char_mask[c]
+            if s & accept_mask:
+                for rule_id in self.accept_rules(s):
+                    hits.append((offset, rule_id))
+        return s
+
+
+
+    # 功能 : 从激活状态集 s 开始读入一个边界符，位置为 offset
+    # 返回 : 读入后的激活状态集
+    def scan_border(self, s, offset, hits):
+        s = self.step(s, CHAR_BORDER)
+        if s & self.accept_mask:
+            for rule_id in self.accept_rules(s):
+                hits.append((offset, rule_id))
+        return s
+
+
+
+    # 功能 : 扫描一段完整的输入 data (bytes)，开头和结尾各有一个边界符
+    # 返回 : 命中列表 [(offset, rule_id), ...] ，按 offset 升序
+    def scan(self, data):
+        hits = []
+        s = self.scan_border(self.init_state(), 0, hits)
+        s = self.scan_chunk(s, data, 0, hits)
+        self.scan_border(s, len(data), hits)
+        return hits
+
+
+
+    # 功能 : 扫描一个文件（分块读入，块之间传递激活状态集），开头和结尾各有一个边界符
+    # 返回 : 命中列表 [(offset, rule_id), ...] ，按 offset 升序
+    def scan_file(self, fname):
+        hits = []
+        base = 0
+        s = self.scan_border(self.init_state(), 0, hits)
+        with open(fname, 'rb') as fp:
+            while True:
+                data = fp.read(SCAN_CHUNK_SIZE)
+                if not data:
+                    break
+                s = self.scan_chunk(s, data, base, hits)
+                base += len(data)
+        self.scan_border(s, base, hits)
+        return hits
+
+
+
+
+
+# 主函数
+# 从命令行参数读入正则表达式文件和若干个待扫描的数据文件，报告每个文件的命中数和扫描吞吐率
+if __name__ == '__main__':
+
+    # 解析命令行参数
+    if len(sys.argv) < 3 or not sys.argv[1].endswith('.re'):
+        print('Usage: python %s <输入正则表达式文件(.re)> <待扫描数据文件> [待扫描数据文件 ...]' % sys.argv[0])
+        exit(-1)
+    REGEX_FNAME, DATA_FNAMES = sys.argv[1], sys.argv[2:]
+
+    # 读取文件，得到一行一行的 regex ，去重 ， 按 ASCII 编码排序
+    regex_strings = list( set( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) ) )
+    regex_strings.sort()
+    print('total %d regexs (after remove duplicate)\n' % len(regex_strings))
+
+    # 建立 homo-NFA 和匹配引擎
+    stime = time()
+    matcher = NFAHomoMatcher(genHomoNFAfromRegex(regex_strings))
+    print('[%12d ms]   build matcher  NFA#S=%d' % (int(round((time()-stime)*1000)), matcher.NFA_N) )
+
+    # 逐个扫描数据文件
+    for DATA_FNAME in DATA_FNAMES:
+        stime = time()
+        hits = matcher.scan_file(DATA_FNAME)
+        dtime = time() - stime
+        size = os.path.getsize(DATA_FNAME)
+        print('[%12d ms]   %s  %d bytes  %d hits  %.3f MB/s' % (int(round(dtime*1000)), DATA_FNAME, size, len(hits), size/max(dtime,1e-9)/1e6) )
+        rule_hits = dict()
+        for _, rule_id in hits:
+            rule_hits[rule_id] = rule_hits.get(rule_id, 0) + 1
+        for rule_id in sorted(rule_hits):
+            print('    rule#%d  hits=%d  %s' % (rule_id, rule_hits[rule_id], regex_strings[rule_id]) )
@@ -0,0 +1,159 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 本代码文件提供流式扫描接口：输入可以一块一块地送入（例如重组后的 TCP 流），也可以是 mmap 映射的大文件，内存占用与文件大小无关
+# 块与块之间传递匹配引擎的激活状态（homo-NFA 的激活状态集，即 get_next_mask 用的整数；对 DFATable 则是 DFA 状态号），
+# 命中的 offset 是从流的开头算起的全局位置
+# 流可以随时挂起 (suspend) 成一段 bytes ，之后（甚至在另一个进程里）用同样的正则表达式集建立的匹配引擎恢复 (resume_stream) ，接着扫描
+#
+# 匹配引擎可以是 NFAHomoMatcher 、 LazyDFAMatcher 或 DFATable ，只要求它们提供 init_state / scan_chunk / scan_border
+
+import os
+import sys
+import json
+import mmap
+from time import time
+
+from nfa import genHomoNFAfromRegex
+from nfa_homo_match import NFAHomoMatcher, SCAN_CHUNK_SIZE
+from dfa_lazy import LazyDFAMatcher
+
+
+
+# 类 : ScanStream
+# 功能 : 一条输入流的扫描状态
+class ScanStream():
+
+    # 构造函数
+    # 参数 : matcher : 匹配引擎
+    #        border  : 流的开头是否有边界符（即是否能匹配正则表达式中的 ^ ）。从中途截取的流（例如中途开始抓包的 TCP 流）应为 False
+    def __init__(self, matcher, border=True):
+        self.matcher = matcher
+        self.border = border
+        self.state = None                       # 匹配引擎的激活状态， None 代表还没有开始
+        self.offset = 0                         # 已经读入的字节数
+        self.closed = False
+
+
+
+    # 功能 : 开始扫描（读入开头的边界符）
+    def begin(self, hits):
+        if self.border:
+            self.state = self.matcher.scan_border(self.matcher.init_state(), 0, hits)
+        else:
+            self.state = self.matcher.init_state()
+
+
+
+    # 功能 : 送入一块数据 (bytes / bytearray / memoryview / mmap 的切片)
+    # 返回 : 这块数据中的命中列表 [(offset, rule_id), ...] ， offset 为全局位置
+    def feed(self, data):
+        assert not self.closed
+        hits = []
+        if self.state is None:
+            self.begin(hits)
+        for i in range(0, len(data), SCAN_CHUNK_SIZE):
+            chunk = bytes(data[i:i+SCAN_CHUNK_SIZE])
+            self.state = self.matcher.scan_chunk(self.state, chunk, self.offset, hits)
+            self.offset += len(chunk)
+        return hits
+
+
+
+    # 功能 : 结束扫描
+    # 参数 : border : 流的结尾是否有边界符（即是否能匹配正则表达式中的 $ ）
+    # 返回 : 结尾处的命中列表
+    def close(self, border=True):
+        assert not self.closed
+        hits = []
+        if self.state is None:
+            self.begin(hits)
+        if border:
+            self.state = self.matcher.scan_border(self.state, self.offset, hits)
+        self.closed = True
+        return hits
+
+
+
+    # 功能 : 挂起，把扫描状态序列化
+    # 返回 : bytes
+    def suspend(self):
+        state = None if self.state is None else '%x' % self.state
+        return json.dumps({'state':state, 'offset':self.offset, 'border':self.border, 'closed':self.closed}).encode()
+
+
+
+# 函数 : resume_stream
+# 功能 : 从 ScanStream.suspend 的结果恢复一条流
+# 参数 : matcher : 匹配引擎，必须与挂起时的匹配引擎用同样的正则表达式集（同样的顺序）建立
+#        blob    : ScanStream.suspend 返回的 bytes
+# 返回 : ScanStream
+def resume_stream(matcher, blob):
+    obj = json.loads(blob)
+    stream = ScanStream(matcher, obj['border'])
+    stream.state = None if obj['state'] is None else int(obj['state'], 16)
+    stream.offset = obj['offset']
+    stream.closed = obj['closed']
+    return stream
+
+
+
+# 函数 : iter_mmap_chunks
+# 功能 : 用 mmap 映射文件，逐块给出数据（不把整个文件读入内存）
+# 返回 : 生成器，每次给出一块 bytes （只有这一块在内存中）
+def iter_mmap_chunks(fname, chunk_size=SCAN_CHUNK_SIZE):
+    with open(fname, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:                 # 不能 mmap 空文件
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i in range(0, len(mm), chunk_size):
+                yield mm[i:i+chunk_size]
+
+
+
+# 函数 : iter_file_hits
+# 功能 : 用 mmap 流式扫描一个文件，开头和结尾各有一个边界符
+# 返回 : 生成器，逐个给出命中 (offset, rule_id) ，按 offset 升序
+def iter_file_hits(matcher, fname):
+    stream = ScanStream(matcher)
+    for chunk in iter_mmap_chunks(fname):
+        yield from stream.feed(chunk)
+    yield from stream.close()
+
+
+
+
+# 主函数
+# 从命令行参数读入正则表达式文件和数据文件，用 mmap 流式扫描，报告每条正则表达式的命中次数和吞吐率
+if __name__ == '__main__':
+
+    # 解析命令行参数
+    ARGVS = [argv for argv in sys.argv[1:] if argv != 'lazy']
+    if len(ARGVS) < 2 or not ARGVS[0].endswith('.re'):
+        print('Usage: python %s <输入正则表达式文件(.re)> <待扫描数据文件> [待扫描数据文件 ...] [lazy]' % sys.argv[0])
+        exit(-1)
+    REGEX_FNAME, DATA_FNAMES = ARGVS[0], ARGVS[1:]
+    LAZY = 'lazy' in sys.argv[1:]
+
+    # 读取文件，得到一行一行的 regex ，去重 ， 按 ASCII 编码排序
+    regex_strings = list( set( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) ) )
+    regex_strings.sort()
+    print('total %d regexs (after remove duplicate)\n' % len(regex_strings))
+
+    # 建立 homo-NFA 和匹配引擎
+    stime = time()
+    nfa = genHomoNFAfromRegex(regex_strings)
+    matcher = LazyDFAMatcher(nfa) if LAZY else NFAHomoMatcher(nfa)
+    print('[%12d ms]   build matcher  NFA#S=%d' % (int(round((time()-stime)*1000)), matcher.NFA_N) )
+
+    # 逐个流式扫描数据文件，只统计每条正则表达式的命中次数
+    for DATA_FNAME in DATA_FNAMES:
+        stime = time()
+        rule_hits = dict()
+        for _, rule_id in iter_file_hits(matcher, DATA_FNAME):
+            rule_hits[rule_id] = rule_hits.get(rule_id, 0) + 1
+        dtime = time() - stime
+        size = os.path.getsize(DATA_FNAME)
+        print('[%12d ms]   %s  %d bytes  %d hits  %.3f MB/s' % (int(round(dtime*1000)), DATA_FNAME, size, sum(rule_hits.values()), size/max(dtime,1e-9)/1e6) )
+        for rule_id in sorted(rule_hits):
+            print('    rule#%d  hits=%d  %s' % (rule_id, rule_hits[rule_id], regex_strings[rule_id]) )
@@ -0,0 +1,269 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 本代码文件提供"字面量预过滤 + homo-NFA"的匹配引擎
+# 每个正则表达式的必需因子（见 regex_literal.py）编译成一个多模式 Aho-Corasick 自动机，扫描一段输入时：
+#     1. 先用 Aho-Corasick 自动机（不区分大小写）找出必需因子在输入中出现过的那些 rule ，作为候选 rule
+#     2. 若没有候选 rule ，这段输入中有必需因子的 rule 都不可能命中，跳过它们的 homo-NFA
+#     3. 否则只让候选 rule 的 NFA 状态参与扫描（激活状态集每一步都与候选状态集按位与），激活的状态少，NFAHomoMatcher 的缓存命中率高
+# 没有必需因子的 rule （通常只有少数几条）单独建立 lazy-DFA ，每段输入都要扫描
+# 必需因子没出现的 rule 不可能命中，所以扫描结果与不做预过滤时完全相同
+# 正常流量中大部分输入都没有任何必需因子出现，大部分自动机的工作被跳过
+
+import os
+import re
+import sys
+from time import time
+
+from argv_parse import argv_parse
+from nfa import genHomoNFAfromRegex
+from nfa_homo_calculation import get_close_by_expand
+from nfa_homo_match import NFAHomoMatcher, CHAR_BORDER
+from dfa_lazy import LazyDFAMatcher
+from regex_literal import get_required_literal
+
+
+
+# 类 : AhoCorasick
+# 功能 : 不区分大小写的多模式字符串匹配（Aho-Corasick 自动机，转换表按字节类压缩并且是完整的 DFA ，没有失败转换）
+#        只用来回答"哪些模式出现过"，不报告位置
+class AhoCorasick():
+
+    # 构造函数
+    # 参数 : patterns : [(小写的 bytes, 模式号), ...] ，同一个字符串可以对应多个模式号
+    def __init__(self, patterns):
+        # 字节类：模式中出现过的每个字节各一类（大小写算同一类），其余字节为 0 类
+        class_of = dict()
+        for string, _ in patterns:
+            for c in string:
+                if c not in class_of:
+                    class_of[c] = len(class_of) + 1
+        self.n_class = len(class_of) + 1
+        self.class_bytes = bytes( class_of.get(c, 0) for c in bytes(range(256)).lower() )
+
+        # 字典树
+        goto = [dict()]
+        out = [set()]
+        for string, pid in patterns:
+            node = 0
+            for c in string:
+                k = class_of[c]
+                if k not in goto[node]:
+                    goto[node][k] = len(goto)
+                    goto.append(dict())
+                    out.append(set())
+                node = goto[node][k]
+            out[node].add(pid)
+
+        # 按广度优先顺序求失败转换，同时补全成 DFA
+        n_class = self.n_class
+        trans = [None] * len(goto)
+        trans[0] = [ goto[0].get(k, 0) for k in range(n_class) ]
+        queue = [ t for t in goto[0].values() ]
+        fail = [0] * len(goto)
+        i = 0
+        while i < len(queue):
+            node = queue[i]
+            out[node] |= out[fail[node]]
+            trans[node] = [ goto[node].get(k, trans[fail[node]][k]) for k in range(n_class) ]
+            for k, t in goto[node].items():
+                fail[t] = trans[fail[node]][k]
+                queue.append(t)
+            i += 1
+
+        self.flat_trans = [ t * n_class  for row in trans  for t in row ]
+        self.out = [ frozenset(pids) for pids in out ]
+        self.flat_out = [ None ] * len(self.flat_trans)
+        for node, pids in enumerate(self.out):
+            if pids:
+                self.flat_out[node * n_class] = pids
+
+        # 扫描时在根状态用 re （C 实现）直接跳到下一个有完整模式出现的位置，正常流量中绝大部分字节都这样被跳过
+        trie = dict()
+        for string, _ in patterns:
+            node = trie
+            for c in string:
+                node = node.setdefault(c, dict())
+            node[None] = True
+        self.skip_re = re.compile(_trie_regex(trie)) if patterns else None
+
+
+
+    # 功能 : 找出在 data 中出现过的模式
+    # 返回 : 模式号的集合
+    def search(self, data):
+        found = set()
+        if self.skip_re is None:
+            return found
+        flat_trans, flat_out = self.flat_trans, self.flat_out
+        classes = data.translate(self.class_bytes)
+        skip_search = self.skip_re.search
+        lower = data.lower()
+        pos, end = 0, len(classes)
+        while pos < end:
+            match = skip_search(lower, pos)
+            if match is None:
+                break
+            fd = 0                                                  # 从根状态开始运行 Aho-Corasick ，直到回到根状态
+            for pos in range(match.start(), end):
+                fd = flat_trans[fd + classes[pos]]
+                if fd == 0:
+                    break
+                if flat_out[fd] is not None:
+                    found |= flat_out[fd]
+            pos += 1
+        return found
+
+
+
+# 函数 : _trie_regex
+# 功能 : 把字典树写成正则表达式 (bytes)，它在某个位置匹配成功，当且仅当有模式从这个位置开始出现
+#        只有一个分支的链直接连写，所以嵌套层数只与分支的层数有关
+def _trie_regex(node):
+    alts = []
+    for c, child in sorted((c, child) for c, child in node.items() if c is not None):
+        sub = re.escape(bytes([c]))
+        while len(child) == 1 and None not in child:               # 单分支链
+            c, child = next(iter(child.items()))
+            sub += re.escape(bytes([c]))
+        if len(child) > 1 or None not in child:
+            tail = _trie_regex(child)
+            sub += (b'(?:' + tail + b')?') if None in child else tail
+        alts.append(sub)
+    return alts[0] if len(alts) == 1 else b'(?:' + b'|'.join(alts) + b')'
+
+
+
+# 类 : PrefilteredMatcher
+# 功能 : 带字面量预过滤的匹配引擎，scan(data) 的结果与用全部正则表达式建立的 NFAHomoMatcher.scan(data) 相同
+#        有必需因子的 rule 和没有必需因子的 rule 分开建立自动机：
+#            前者建立一个 homo-NFA ，只在有候选 rule 时运行，并且只让候选 rule 的状态参与扫描
+#            后者（通常只有少数几条）总要运行，用 lazy-DFA 扫描
+class PrefilteredMatcher():
+
+    # 构造函数
+    # 参数 : regex_strings : 正则表达式列表（顺序与 rule_id 一致）
+    def __init__(self, regex_strings):
+        self.factors = [ get_required_literal(regex) for regex in regex_strings ]
+        self.factor_ids = [ rule_id for rule_id, factor in enumerate(self.factors) if factor is not None ]       # 有必需因子的 rule
+        self.always_ids = [ rule_id for rule_id, factor in enumerate(self.factors) if factor is None ]           # 没有必需因子的 rule ，总要扫描
+
+        # 没有必需因子的 rule 的 lazy-DFA
+        self.always_matcher = None
+        if self.always_ids:
+            self.always_matcher = LazyDFAMatcher(genHomoNFAfromRegex([ regex_strings[rule_id] for rule_id in self.always_ids ]))
+
+        # 有必需因子的 rule 的 homo-NFA ，以及必需因子的 Aho-Corasick 自动机（模式号是 rule 在 factor_ids 中的下标）
+        self.matcher = None
+        self.ac = AhoCorasick([ (string, i)  for i, rule_id in enumerate(self.factor_ids)  for string in self.factors[rule_id] ])
+        if self.factor_ids:
+            self.matcher = NFAHomoMatcher(genHomoNFAfromRegex([ regex_strings[rule_id] for rule_id in self.factor_ids ]))
+
+            # 每个 rule 的 NFA 状态：能到达它的接受状态的所有状态
+            back_net = [0] * self.matcher.NFA_N
+            for sn, fmask in enumerate(self.matcher.NFAhomo_fore_net):
+                while fmask != 0:
+                    low = fmask & -fmask
+                    back_net[low.bit_length()-1] |= (1<<sn)
+                    fmask ^= low
+            accept_states = [0] * len(self.factor_ids)
+            for n, amask in enumerate(self.matcher.NFAhomo_accept_net):
+                while amask != 0:
+                    low = amask & -amask
+                    accept_states[low.bit_length()-2] |= (1<<n)
+                    amask ^= low
+            self.rule_states = [ get_close_by_expand(states, back_net) | 1 for states in accept_states ]
+
+        self.mask_memo = dict()                                     # 候选 rule 集合 → 只保留候选状态的字符激活查询表
+        self.n_scan = 0                                             # 扫描过的输入数
+        self.n_skip = 0                                             # 预过滤后不用运行 homo-NFA 的输入数
+
+
+
+    # 功能 : 候选 rule 集合对应的字符激活查询表（非候选 rule 的状态被清零）
+    def char_mask_for(self, rules):
+        char_mask = self.mask_memo.get(rules)
+        if char_mask is None:
+            allowed = 0
+            for i in rules:
+                allowed |= self.rule_states[i]
+            char_mask = [ cmask & allowed for cmask in self.matcher.NFAhomo_char_mask ]
+            if len(self.mask_memo) >= self.matcher.memo_max:
+                self.mask_memo.clear()
+            self.mask_memo[rules] = char_mask
+        return char_mask
+
+
+
+    # 功能 : 只让候选 rule 的状态参与扫描，用 homo-NFA 扫描 data
+    # 返回 : 命中列表，rule_id 是 rule 在 factor_ids 中的下标
+    def scan_candidates(self, data, rules):
+        char_mask = self.char_mask_for(frozenset(rules))
+        matcher = self.matcher
+        hits = []
+        s = matcher.next_mask(matcher.init_state()) & char_mask[CHAR_BORDER]
+        if s & matcher.accept_mask:
+            hits += [ (0, i) for i in matcher.accept_rules(s) ]
+        s = matcher.scan_chunk(s, data, 0, hits, char_mask)
+        s = matcher.next_mask(s) & char_mask[CHAR_BORDER]
+        if s & matcher.accept_mask:
+            hits += [ (len(data), i) for i in matcher.accept_rules(s) ]
+        return hits
+
+
+
+    # 功能 : 扫描一段完整的输入 data (bytes)，开头和结尾各有一个边界符
+    # 返回 : 命中列表 [(offset, rule_id), ...] ，按 offset 升序（同一 offset 按 rule_id 升序）
+    def scan(self, data):
+        self.n_scan += 1
+        hits = []
+        if self.always_matcher is not None:
+            always_ids = self.always_ids
+            hits += [ (offset, always_ids[i]) for offset, i in self.always_matcher.scan(data) ]
+        rules = self.ac.search(data)
+        if rules:
+            factor_ids = self.factor_ids
+            hits += [ (offset, factor_ids[i]) for offset, i in self.scan_candidates(data, rules) ]
+            if self.always_matcher is not None:
+                hits.sort()
+        else:
+            self.n_skip += 1
+        return hits
+
+
+
+# 主函数
+# 从命令行参数读入正则表达式文件和数据文件，把数据文件切成等长的报文，分别用 NFAHomoMatcher 和带预过滤的引擎扫描，比较结果和吞吐率
+if __name__ == '__main__':
+
+    # 解析命令行参数
+    (REGEX_FNAME,), ARGV_NUMS = argv_parse(['.re'])
+    DATA_FNAMES = [argv for argv in sys.argv[1:] if argv != REGEX_FNAME and os.path.isfile(argv)]
+    if REGEX_FNAME == '' or len(DATA_FNAMES) != 1 or len(ARGV_NUMS) > 1:
+        print('Usage: python %s <输入正则表达式文件(.re)> <待扫描数据文件> [报文长度(默认1500)]' % sys.argv[0])
+        exit(-1)
+    PACKET_SIZE = int(ARGV_NUMS[0]) if len(ARGV_NUMS) > 0 else 1500
+
+    # 读取文件，得到一行一行的 regex ，去重 ， 按 ASCII 编码排序
+    regex_strings = list( set( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) ) )
+    regex_strings.sort()
+    print('total %d regexs (after remove duplicate)\n' % len(regex_strings))
+
+    # 建立 homo-NFA 和两个匹配引擎
+    stime = time()
+    nfa = genHomoNFAfromRegex(regex_strings)
+    plain = NFAHomoMatcher(nfa)
+    prefiltered = PrefilteredMatcher(regex_strings)
+    print('[%12d ms]   build matchers  NFA#S=%d  %d/%d regexs have required literal factors' % (int(round((time()-stime)*1000)), plain.NFA_N, len(prefiltered.factor_ids), len(regex_strings)) )
+
+    # 切成报文，分别扫描
+    data = open(DATA_FNAMES[0], 'rb').read()
+    packets = [data[i:i+PACKET_SIZE] for i in range(0, len(data), PACKET_SIZE)]
+    results = []
+    for name, matcher in (('NFA', plain), ('prefilter+NFA', prefiltered)):
+        stime = time()
+        hits = [ matcher.scan(packet) for packet in packets ]
+        dtime = time() - stime
+        results.append(hits)
+        print('[%12d ms]   %-14s %d packets  %d bytes  %d hits  %.3f MB/s' % (int(round(dtime*1000)), name, len(packets), len(data), sum(map(len, hits)), len(data)/max(dtime,1e-9)/1e6) )
+    print('NFA skipped in %d/%d packets , same hits: %s' % (prefiltered.n_skip, prefiltered.n_scan, results[0] == results[1]) )
@@ -0,0 +1,120 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 功能：从正则表达式语法树中提取"必需字面量因子" (required literal factor)
+# 必需因子是一组字符串，正则表达式的任何一次匹配都至少包含其中一个（作为连续子串）
+# 例如 .{0,1}GET x HTTP\/1\.0 的必需因子是 {'get x http/1.0'} ， (abc|xyz)+k 的必需因子是 {'abc', 'xyz'}
+# 字面量一律转成小写（[aA] 这样只区分大小写的字符集也视作字面量），所以用必需因子做预过滤时要不区分大小写地查找，查找结果只会多不会少
+
+import sys
+
+from argv_parse import argv_parse
+from regex_tree import build_syntax_tree
+
+
+LITERAL_MIN_LEN = 3                  # 必需因子中最短的字符串短于它时，认为这个正则表达式没有可用的必需因子
+
+
+
+# 函数： charset_to_literal
+# 功能： 若字符集只含一个字节，或者只含一个字母的大小写两种形式，返回它的小写形式 (bytes) ，否则返回 None
+def charset_to_literal(cset):
+    if cset <= 0 or cset >= (1<<256):                              # 含有边界符的字符集不是字面量
+        return None
+    c = cset.bit_length() - 1
+    rest = cset ^ (1<<c)
+    if rest == 0:
+        return bytes([c]).lower()
+    if rest & (rest-1) == 0:
+        lo = rest.bit_length() - 1
+        if bytes([c]).lower() == bytes([lo]) and bytes([c]) != bytes([lo]):    # c 是大写字母 ， lo 是对应的小写字母
+            return bytes([lo])
+        if bytes([lo]).lower() == bytes([c]) and bytes([c]) != bytes([lo]):
+            return bytes([c])
+    return None
+
+
+
+# 函数： _factor_score
+# 功能： 必需因子的优劣：最短的字符串越长越好，其次字符串越少越好
+def _factor_score(factor):
+    return (min(len(s) for s in factor), -len(factor))
+
+
+
+# 函数： analyze_chain
+# 功能： 分析以 node 开头的语法链
+# 返回： exact : 若这条链只能匹配唯一一个字符串（不区分大小写），返回该字符串 (bytes) ，否则为 None
+#        best  : 这条链的最优必需因子 (frozenset of bytes) ，没有时为 None
+def analyze_chain(node):
+    candidates = []
+    run = b''                                                      # 当前的连续字面量
+    exact = True                                                   # 到目前为止整条链是不是唯一一个字符串
+    while node is not None:
+        lit = None                                                 # 节点内容（不计量语）对应的唯一字符串
+        alts = None                                                # 节点内容对应的必需因子
+        if node.is_charset():
+            lit = charset_to_literal(node.content)
+        else:
+            subs = [ analyze_chain(sub) for sub in node.content ]
+            if len(subs) == 1 and subs[0][0] is not None:
+                lit = subs[0][0]
+            elif all(sub_exact is not None and len(sub_exact) > 0 for sub_exact, _ in subs):
+                alts = frozenset( sub_exact for sub_exact, _ in subs )
+            elif all(sub_best is not None for _, sub_best in subs):
+                alts = frozenset().union( *(sub_best for _, sub_best in subs) )
+
+        if lit is not None and node.min == node.max:               # 固定次数的字面量，接在当前字面量后面
+            run += lit * node.min
+        elif lit is not None and node.min > 0:                     # 可变次数的字面量: 前 min 次是必需的，之后当前字面量中断，再从最后 min 次开始
+            run += lit * node.min
+            candidates.append(frozenset([run]))
+            run = lit * node.min
+            exact = False
+        else:                                                      # 其它情况，当前字面量中断
+            if run:
+                candidates.append(frozenset([run]))
+            run = b''
+            exact = False
+            if alts is not None and node.min > 0:
+                candidates.append(alts)
+        node = node.next
+
+    if run:
+        candidates.append(frozenset([run]))
+    best = max(candidates, key=_factor_score) if candidates else None
+    return (run if exact else None), best
+
+
+
+# 函数： get_required_literal
+# 功能： 求一个正则表达式的必需因子
+# 参数： regex    : 正则表达式字符串
+#        min_len  : 必需因子中最短的字符串的最小长度
+# 返回： frozenset of bytes （小写），没有可用的必需因子时返回 None
+def get_required_literal(regex, min_len=LITERAL_MIN_LEN):
+    _, best = analyze_chain(build_syntax_tree(regex))
+    if best is None or min(len(s) for s in best) < min_len:
+        return None
+    return best
+
+
+
+
+if __name__ == '__main__':
+
+    # 解析命令行参数
+    (REGEX_FNAME,), _ = argv_parse(['.re'])
+    if REGEX_FNAME == '':
+        print('Usage: python %s <输入正则表达式文件(.re)>' % sys.argv[0])
+        exit(-1)
+
+    # 对逐个正则表达式打印必需因子
+    n_factor = 0
+    regexs = list( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) )
+    for regex_no, regex in enumerate(regexs):
+        factor = get_required_literal(regex)
+        if factor is not None:
+            n_factor += 1
+        print('regex#%d : %s\n    factor: %s' % (regex_no, regex, 'None' if factor is None else ' | '.join(map(repr, sorted(factor)))) )
+    print('\n%d/%d regexs have required literal factors' % (n_factor, len(regexs)))
@@ -4,12 +4,16 @@
 # 功能：正则表达式语法树建立
 
 import sys
+from functools import lru_cache
 
 from argv_parse import argv_parse
 from utils import charset_bit1_to_str
 from regex_parser import regex_parser
 
 
+SYNTAX_CACHE_SIZE = 1 << 16                  # build_syntax_tree 最多缓存多少个正则表达式的语法树
+
+
 
 # 类： SyntaxNode
 # 功能： 定义正则表达式短语，构成语法树节点，有三个字段：
@@ -175,7 +179,9 @@ def _make_syntax_tree(syntax_items, root=None, node=None):
 
 # 函数： build_syntax_tree
 # 功能： 以 regex(str) 为正则表达式，建立语法树
+#        同一个正则表达式只解析一次（例如 dfa_multi 反复用不同的正则表达式组合建立 NFA 时），所以返回的语法树是共享的，调用者不能修改它
 # 返回： 语法树的根节点 root
+@lru_cache(maxsize=SYNTAX_CACHE_SIZE)
 def build_syntax_tree(regex):
     syntax_items = [syntax_item for syntax_item in regex_parser(regex)]
     syntax_items.reverse()
@@ -0,0 +1,160 @@
+# -*- coding:utf-8 -*-
+# Python3
+
+# 本代码文件用多进程并行扫描一批文件（例如每晚抓到的报文文件）
+# homo-NFA 只在主进程建立一次，然后传给进程池中的每个工作进程，工作进程各自建立匹配引擎（Python 的大整数运算受 GIL 限制，只有多进程才能用满所有核）
+# 任务的单位是"文件段"：
+#     若 homo-NFA 的最长匹配长度 L 有上限（见 nfa_homo_calculation.get_max_match_len），大文件被切成若干段，
+#     每段从段首之前 L 个字节处开始扫描（不读入开头的边界符），只报告结束位置在本段内的命中，所以跨段的匹配不会漏掉也不会重复
+#     否则（规则中有 .* 之类的环），每个文件整个作为一个任务
+# 最后合并各段的结果：每条正则表达式的命中次数，以及（可选）每个文件的命中列表
+
+import os
+import sys
+from time import time
+from multiprocessing import Pool, cpu_count
+
+from argv_parse import argv_parse
+from nfa import genHomoNFAfromRegex
+from nfa_homo_calculation import get_NFA_homo_LUT, get_max_match_len
+from nfa_homo_match import NFAHomoMatcher, SCAN_CHUNK_SIZE
+from nfa_homo_stream import ScanStream
+from dfa_lazy import LazyDFAMatcher
+
+
+SEGMENT_SIZE = 64 << 20                        # 大文件切段时每段的字节数
+
+
+
+_worker_matcher = None                         # 工作进程中的匹配引擎
+
+
+
+# 函数 : _worker_init
+# 功能 : 工作进程的初始化：用主进程传来的 homo-NFA 建立匹配引擎
+def _worker_init(nfa, lazy):
+    global _worker_matcher
+    _worker_matcher = LazyDFAMatcher(nfa) if lazy else NFAHomoMatcher(nfa)
+
+
+
+# 函数 : _worker_scan
+# 功能 : 扫描一个文件段 [start, end) ，从 scan_from (<= start) 开始读入
+# 参数 : task : (fname, start, end, scan_from, keep_hits)
+# 返回 : (fname, start, 扫描的字节数, {rule_id: 命中次数}, 命中列表或 None)
+def _worker_scan(task):
+    fname, start, end, scan_from, keep_hits = task
+    size = os.path.getsize(fname)
+    stream = ScanStream(_worker_matcher, border=(scan_from == 0))
+    stream.offset = scan_from
+    hits = []
+    with open(fname, 'rb') as fp:
+        fp.seek(scan_from)
+        pos = scan_from
+        while pos < end:
+            data = fp.read(min(SCAN_CHUNK_SIZE, end - pos))
+            if not data:
+                break
+            hits += stream.feed(data)
+            pos += len(data)
+    if end >= size:
+        hits += stream.close()
+    if start > 0:                                               # 只保留结束位置在本段内的命中（重叠部分的命中属于上一段）
+        hits = [ hit for hit in hits if hit[0] > start ]
+    rule_hits = dict()
+    for _, rule_id in hits:
+        rule_hits[rule_id] = rule_hits.get(rule_id, 0) + 1
+    return fname, start, end - scan_from, rule_hits, (hits if keep_hits else None)
+
+
+
+# 函数 : make_tasks
+# 功能 : 把文件列表切成扫描任务
+# 参数 : max_len   : 最长匹配长度，-1 代表没有上限（此时不切段）
+#        keep_hits : 是否返回命中列表
+def make_tasks(fnames, max_len, keep_hits, segment_size=SEGMENT_SIZE):
+    tasks = []
+    for fname in fnames:
+        size = os.path.getsize(fname)
+        if max_len < 0 or size <= segment_size:
+            tasks.append((fname, 0, size, 0, keep_hits))
+            continue
+        for start in range(0, size, segment_size):
+            tasks.append((fname, start, min(start+segment_size, size), max(0, start-max_len), keep_hits))
+    tasks.sort(key=lambda task:task[3]-task[2])                # 大任务先做，负载更均衡
+    return tasks
+
+
+
+# 函数 : scan_corpus
+# 功能 : 用进程池并行扫描一批文件
+# 参数 : nfa       : homo-NFA
+#        fnames    : 文件列表
+#        workers   : 工作进程数
+#        lazy      : 是否用 lazy-DFA 引擎（否则用 NFAHomoMatcher）
+#        keep_hits : 是否返回每个文件的命中列表
+# 返回 : rule_hits : {rule_id: 命中次数}
+#        file_hits : {fname: [(offset, rule_id), ...]} （keep_hits=False 时为空）
+#        n_bytes   : 实际扫描的字节数（含切段的重叠部分）
+def scan_corpus(nfa, fnames, workers=cpu_count(), lazy=False, keep_hits=False, segment_size=SEGMENT_SIZE):
+    max_len = get_max_match_len(get_NFA_homo_LUT(nfa)[1])
+    tasks = make_tasks(fnames, max_len, keep_hits, segment_size)
+    rule_hits = dict()
+    segments = dict()                                           # fname → [(start, 命中列表), ...]
+    n_bytes = 0
+    with Pool(workers, initializer=_worker_init, initargs=(nfa, lazy)) as pool:
+        for fname, start, n, seg_rule_hits, seg_hits in pool.imap_unordered(_worker_scan, tasks):
+            n_bytes += n
+            for rule_id, count in seg_rule_hits.items():
+                rule_hits[rule_id] = rule_hits.get(rule_id, 0) + count
+            if keep_hits:
+                segments.setdefault(fname, []).append((start, seg_hits))
+    file_hits = dict()
+    for fname, segs in segments.items():
+        segs.sort(key=lambda seg:seg[0])
+        file_hits[fname] = [ hit  for _, seg_hits in segs  for hit in seg_hits ]
+    return rule_hits, file_hits, n_bytes
+
+
+
+
+# 主函数
+# 从命令行参数读入正则表达式文件和若干个数据文件（或目录，扫描其中所有文件），并行扫描，报告每条正则表达式的命中次数和总吞吐率
+if __name__ == '__main__':
+
+    # 解析命令行参数
+    (REGEX_FNAME,), ARGV_NUMS = argv_parse(['.re'])
+    PATHS = [argv for argv in sys.argv[1:] if argv != REGEX_FNAME and os.path.exists(argv)]
+    LAZY = 'lazy' in sys.argv[1:]
+    if REGEX_FNAME == '' or len(PATHS) < 1 or len(ARGV_NUMS) > 1:
+        print('Usage: python %s <输入正则表达式文件(.re)> <数据文件或目录> [数据文件或目录 ...] [进程数(默认为CPU核数)] [lazy]' % sys.argv[0])
+        exit(-1)
+    WORKERS = int(ARGV_NUMS[0]) if len(ARGV_NUMS) > 0 else cpu_count()
+
+    # 展开目录
+    DATA_FNAMES = []
+    for path in PATHS:
+        if os.path.isdir(path):
+            for dirpath, _, fnames in os.walk(path):
+                DATA_FNAMES += sorted( os.path.join(dirpath, fname) for fname in fnames )
+        else:
+            DATA_FNAMES.append(path)
+
+    # 读取文件，得到一行一行的 regex ，去重 ， 按 ASCII 编码排序
+    regex_strings = list( set( filter( lambda regex:len(regex)>0 , open(REGEX_FNAME, 'rt').read().split('\n') ) ) )
+    regex_strings.sort()
+    print('total %d regexs (after remove duplicate)\n' % len(regex_strings))
+
+    # 建立 homo-NFA
+    stime = time()
+    nfa = genHomoNFAfromRegex(regex_strings)
+    print('[%12d ms]   build NFA  max_match_len=%d' % (int(round((time()-stime)*1000)), get_max_match_len(get_NFA_homo_LUT(nfa)[1])) )
+
+    # 并行扫描
+    stime = time()
+    rule_hits, _, n_bytes = scan_corpus(nfa, DATA_FNAMES, WORKERS, LAZY)
+    dtime = time() - stime
+    size = sum( os.path.getsize(fname) for fname in DATA_FNAMES )
+    print('[%12d ms]   %d files  %d bytes  %d workers  %d hits  %.3f MB/s' % (int(round(dtime*1000)), len(DATA_FNAMES), size, WORKERS, sum(rule_hits.values()), size/max(dtime,1e-9)/1e6) )
+    for rule_id in sorted(rule_hits):
+        print('    rule#%d  hits=%d  %s' % (rule_id, rule_hits[rule_id], regex_strings[rule_id]) )